@@ -1,20 +1,127 @@
-import google.generativeai as genai
 import random
-import json
-import re
+import metrics
+from aio import runner
+from backends import generate_async
+from deadline import DeadlineExceeded, timed_call
+from stream_parser import MessageStreamParser
+from strategies import get_strategy
+
+def render_turn(model, plan, on_token=None, deadline=None):
+    """render_turn_async for sync callers (step-by-step routes), run on aio.runner's loop"""
+    return runner.run(render_turn_async(model, plan, on_token, deadline))
+
+async def render_turn_async(model, plan, on_token=None, deadline=None):
+    """Turn a planned move into its message, falling back to the template text.
+
+    With on_token, the reply is streamed from the model and on_token is called
+    with each new piece of the message as soon as it has been generated.
+    Without a model (offline mode) the template text is used directly. With a
+    deadline (see deadline.py) the model is skipped when the time left can't
+    cover the call, and a call that overruns is cancelled; the template
+    result is then marked `degraded`. The call is awaited, so a turn waiting
+    on the model holds no thread.
+    """
+    metrics.agent_turns.inc(agent=plan['agent'])
+    degraded = False
+    if model is None and plan.get('prompt'):
+        metrics.agent_fallbacks.inc(agent=plan['agent'], reason='offline')
+    elif deadline is not None and plan.get('prompt') and not deadline.allows_call():
+        metrics.agent_fallbacks.inc(agent=plan['agent'], reason='deadline')
+        degraded = True
+    elif model is not None and plan.get('prompt'):
+        try:
+            parser = MessageStreamParser()
+            with timed_call(), metrics.llm_span(plan['agent'], 'generate' if on_token is None else 'stream') as span:
+                span.prompt(plan['prompt'])
+                reply = read_reply_async(model, plan['prompt'], parser, span, on_token)
+                await (reply if deadline is None else deadline.run_async(reply))
+            result = parser.result()
+            if result and 'message' in result:
+                result['price'] = plan['price']
+                return result
+            metrics.agent_fallbacks.inc(agent=plan['agent'], reason='unparsed')
+        except Exception as e:
+            metrics.agent_fallbacks.inc(agent=plan['agent'], reason=getattr(e, 'fallback_reason', 'error'))
+            degraded = isinstance(e, DeadlineExceeded)
+            print(f"Error generating {plan['label']}: {e}")
+
+    return template_result(plan, degraded)
+
+async def read_reply_async(model, prompt, parser, span, on_token):
+    """Feed the model's reply (streamed when on_token is given) into parser"""
+    if on_token is None:
+        response = await generate_async(model, prompt)
+        span.response(response)
+        parser.feed(response.text)
+        return
+    async for chunk in await generate_async(model, prompt, stream=True):
+        span.response(chunk)
+        partial = parser.feed(chunk.text)
+        if partial:
+            on_token(partial)
+
+def template_result(plan, degraded=False):
+    """The planned move phrased by its template text"""
+    result = {
+        'message': plan['fallback'],
+        'price': plan['price']
+    }
+    if degraded:
+        result['degraded'] = True
+    return result
 
 class BuyerAgent:
-    def __init__(self, model, max_price):
+    role = 'buyer'
+    direction = 1  # conceding raises the price
+
+    def __init__(self, model, max_price, rng=None, strategy='default'):
         self.model = model
+        self.rng = rng or random  # anything with uniform(), for reproducible runs
         self.max_price = max_price
         self.target_price = max_price * 0.8  # Initial target is 20% below max
         self.rounds_count = 0
-        self.negotiation_strategy = "conservative"  # Start conservative, get more aggressive
-    
-    def make_initial_offer(self, item):
+        self.negotiation_strategy = get_strategy(strategy).name  # see strategies.py
+        self.own_price = None    # our latest offer
+        self.their_price = None  # the seller's latest offer
+
+    @property
+    def strategy(self):
+        return get_strategy(self.negotiation_strategy)
+
+    def limit_price(self):
+        return self.max_price
+
+    def reservation(self):
+        """The most we will ever offer"""
+        return self.max_price * 0.99
+
+    def prefers(self, price, other):
+        """Whether `price` is at least as good for us as `other`"""
+        return price <= other
+
+    def make_initial_offer(self, item, on_token=None, deadline=None):
+        return render_turn(self.model, self.plan_initial_offer(item), on_token, deadline)
+
+    def respond_to_offer(self, item, last_price, last_message, on_token=None, deadline=None):
+        return render_turn(self.model, self.plan_response(item, last_price, last_message), on_token, deadline)
+
+    async def make_initial_offer_async(self, item, on_token=None, deadline=None):
+        return await render_turn_async(self.model, self.plan_initial_offer(item), on_token, deadline)
+
+    async def respond_to_offer_async(self, item, last_price, last_message, on_token=None, deadline=None):
+        return await render_turn_async(self.model, self.plan_response(item, last_price, last_message), on_token, deadline)
+
+    def plan_initial_offer(self, item):
+        """Decide the opening price locally and build the prompt that will phrase it"""
+        return self.describe_opening(item, self.opening_price())
+
+    def opening_price(self):
         # Start at around 70-80% of max price
-        initial_offer_price = self.max_price * random.uniform(0.70, 0.80)
-        
+        self.own_price = self.max_price * self.rng.uniform(0.70, 0.80)
+        return self.own_price
+
+    def describe_opening(self, item, initial_offer_price):
+        """The plan (prompt and template text) for an opening offer at a given price"""
         prompt = f"""You are a buyer interested in purchasing a {item}. Your maximum budget is ${self.max_price:.2f}, but you want to negotiate a good deal.
 
 Generate a realistic opening offer message for ${initial_offer_price:.2f}. Make it:
@@ -28,39 +135,53 @@ Example style: "Hello! I'm interested in your {item}. Based on my research and s
 
 Return ONLY a valid JSON response with 'message' and 'price' keys.
 Example: {{"message": "Hello! I'm interested in your {item}...", "price": {initial_offer_price:.2f}}}"""
-        
-        try:
-            response = self.model.generate_content(prompt)
-            text = response.text
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                offer = json.loads(json_match.group())
-                offer['price'] = initial_offer_price
-                return offer
-        except Exception as e:
-            print(f"Error generating initial offer: {e}")
-        
-        # Fallback response
+
         return {
-            'message': f"Hello! I'm interested in your {item}. Based on my research and similar items I've seen in the area, would you consider ${initial_offer_price:.2f} as a starting point?",
-            'price': initial_offer_price
+            'agent': 'buyer',
+            'intent': 'offer',
+            'price': initial_offer_price,
+            'prompt': prompt,
+            'fallback': f"Hello! I'm interested in your {item}. Based on my research and similar items I've seen in the area, would you consider ${initial_offer_price:.2f} as a starting point?",
+            'label': 'initial offer'
         }
-    
-    def respond_to_offer(self, item, last_price, last_message):
+
+    def plan_response(self, item, last_price, last_message):
+        """Decide the next price locally and build the prompt that will phrase it"""
+        intent, new_price = self.decide(last_price)
+        return self.describe(item, intent, new_price, last_price, last_message)
+
+    def decide(self, last_price):
+        """The next move against the seller's `last_price`, as (intent, price), without any text"""
         self.rounds_count += 1
-        
+
         # NEVER accept prices above maximum budget
-        if last_price > self.max_price:
+        if last_price > self.max_price and self.rounds_count >= 3:
             # If seller's price is above budget, make a firm counter or walk away
-            if self.rounds_count >= 3:
-                return {
-                    'message': f"I appreciate your time, but ${last_price:.2f} exceeds my maximum budget of ${self.max_price:.2f}. I'll have to look elsewhere unless you can work within my budget.",
-                    'price': self.max_price * 0.95
-                }
-        
-        # Check if price is acceptable (within budget and reasonable)
-        if last_price <= self.max_price and last_price <= self.max_price * 0.95:
-            # Accept if it's a good deal (within 95% of max)
+            intent, new_price = 'hold', self.max_price * 0.95
+        else:
+            # The strategy picks the move (strategies.py); the limits still apply
+            intent, new_price = self.strategy.respond(self, last_price)
+            if intent == 'accept' and last_price <= self.max_price:
+                new_price = last_price
+            else:
+                # Absolute safety check - NEVER exceed budget
+                intent, new_price = 'counter', min(new_price, self.max_price * 0.99)
+        self.own_price, self.their_price = new_price, last_price
+        return intent, new_price
+
+    def describe(self, item, intent, new_price, last_price, last_message):
+        """The plan (prompt and template text) for a move made by decide()"""
+        if intent == 'hold':
+            return {
+                'agent': 'buyer',
+                'intent': 'hold',
+                'price': new_price,
+                'prompt': None,
+                'fallback': f"I appreciate your time, but ${last_price:.2f} exceeds my maximum budget of ${self.max_price:.2f}. I'll have to look elsewhere unless you can work within my budget.",
+                'label': 'buyer response'
+            }
+
+        if intent == 'accept':
             prompt = f"""You are a buyer who has been negotiating for a {item}. The seller's offer of ${last_price:.2f} is within your budget of ${self.max_price:.2f}.
 
 Generate an acceptance message that:
@@ -71,37 +192,16 @@ Generate an acceptance message that:
 
 Return ONLY a valid JSON response with 'message' and 'price' keys.
 Example: {{"message": "That works for me! I'm happy to proceed...", "price": {last_price}}}"""
-            
-            try:
-                response = self.model.generate_content(prompt)
-                text = response.text
-                json_match = re.search(r'\{.*\}', text, re.DOTALL)
-                if json_match:
-                    acceptance = json.loads(json_match.group())
-                    acceptance['price'] = last_price
-                    return acceptance
-            except Exception as e:
-                print(f"Error generating acceptance: {e}")
-            
+
             return {
-                'message': f"${last_price:.2f} works for me! I'm happy to proceed today. Shall we move forward with the paperwork?",
-                'price': last_price
+                'agent': 'buyer',
+                'intent': 'accept',
+                'price': last_price,
+                'prompt': prompt,
+                'fallback': f"${last_price:.2f} works for me! I'm happy to proceed today. Shall we move forward with the paperwork?",
+                'label': 'acceptance'
             }
-        
-        # Calculate strategic counter-offer (NEVER exceed max budget)
-        if self.rounds_count == 1:
-            # First counter - modest increase but stay under budget
-            new_price = min(last_price * 1.1, self.max_price * 0.9)
-        elif self.rounds_count == 2:
-            # Second counter - bigger move but respect budget
-            new_price = min((last_price + self.max_price * 0.9) / 2, self.max_price * 0.95)
-        else:
-            # Later rounds - smaller increments, approach max budget carefully
-            new_price = min(last_price * 1.03, self.max_price * 0.98)
-        
-        # Absolute safety check - NEVER exceed budget
-        new_price = min(new_price, self.max_price * 0.99)
-        
+
         prompt = f"""You are a buyer negotiating for a {item}. Your maximum budget is ${self.max_price:.2f}.
         
 The seller's last offer was ${last_price:.2f} with message: "{last_message}"
@@ -116,46 +216,87 @@ Generate a realistic counter-offer message that:
 
 Return ONLY a valid JSON response with 'message' and 'price' keys.
 Example: {{"message": "I appreciate the information. While I understand...", "price": {new_price:.2f}}}"""
-        
-        try:
-            response = self.model.generate_content(prompt)
-            text = response.text
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                counter = json.loads(json_match.group())
-                counter['price'] = new_price
-                return counter
-        except Exception as e:
-            print(f"Error generating buyer response: {e}")
-        
-        # Fallback response
+
         return {
-            'message': f"I appreciate the information. While I understand the value, ${last_price:.2f} is above my budget. Could we meet at ${new_price:.2f}? This reflects similar items I've seen in the area.",
-            'price': new_price
+            'agent': 'buyer',
+            'intent': 'counter',
+            'price': new_price,
+            'prompt': prompt,
+            'fallback': f"I appreciate the information. While I understand the value, ${last_price:.2f} is above my budget. Could we meet at ${new_price:.2f}? This reflects similar items I've seen in the area.",
+            'label': 'buyer response'
         }
 
 class SellerAgent:
-    def __init__(self, model, min_price):
+    role = 'seller'
+    direction = -1  # conceding lowers the price
+
+    def __init__(self, model, min_price, rng=None, strategy='default'):
         self.model = model
+        self.rng = rng or random  # anything with uniform(), for reproducible runs
         self.min_price = min_price
         self.target_price = min_price * 1.2  # Initial target is 20% above min
         self.rounds_count = 0
-        self.negotiation_strategy = "firm"  # Start firm, become more flexible
-    
-    def respond_to_offer(self, item, last_price, last_message):
+        self.negotiation_strategy = get_strategy(strategy).name  # see strategies.py
+        self.own_price = None    # our latest offer
+        self.their_price = None  # the buyer's latest offer
+
+    @property
+    def strategy(self):
+        return get_strategy(self.negotiation_strategy)
+
+    def limit_price(self):
+        return self.min_price
+
+    def reservation(self):
+        """The least we will ever ask"""
+        return self.min_price * 1.001
+
+    def prefers(self, price, other):
+        """Whether `price` is at least as good for us as `other`"""
+        return price >= other
+
+    def respond_to_offer(self, item, last_price, last_message, on_token=None, deadline=None):
+        return render_turn(self.model, self.plan_response(item, last_price, last_message), on_token, deadline)
+
+    async def respond_to_offer_async(self, item, last_price, last_message, on_token=None, deadline=None):
+        return await render_turn_async(self.model, self.plan_response(item, last_price, last_message), on_token, deadline)
+
+    def plan_response(self, item, last_price, last_message):
+        """Decide the next price locally and build the prompt that will phrase it"""
+        intent, new_price = self.decide(last_price)
+        return self.describe(item, intent, new_price, last_price, last_message)
+
+    def decide(self, last_price):
+        """The next move against the buyer's `last_price`, as (intent, price), without any text"""
         self.rounds_count += 1
-        
+
         # NEVER accept prices below minimum
-        if last_price < self.min_price:
-            if self.rounds_count >= 3:
-                return {
-                    'message': f"I understand you're working within a budget, but ${last_price:.2f} is below my minimum of ${self.min_price:.2f}. I'm afraid I can't go any lower than that.",
-                    'price': self.min_price
-                }
-        
-        # Check if offer is acceptable (at or above minimum)
-        if last_price >= self.min_price:
-            # Accept if it meets minimum requirement
+        if last_price < self.min_price and self.rounds_count >= 3:
+            intent, new_price = 'hold', self.min_price
+        else:
+            # The strategy picks the move (strategies.py); the limits still apply
+            intent, new_price = self.strategy.respond(self, last_price)
+            if intent == 'accept' and last_price >= self.min_price:
+                new_price = last_price
+            else:
+                # Absolute safety check - NEVER go below minimum
+                intent, new_price = 'counter', max(new_price, self.min_price * 1.001)
+        self.own_price, self.their_price = new_price, last_price
+        return intent, new_price
+
+    def describe(self, item, intent, new_price, last_price, last_message):
+        """The plan (prompt and template text) for a move made by decide()"""
+        if intent == 'hold':
+            return {
+                'agent': 'seller',
+                'intent': 'hold',
+                'price': new_price,
+                'prompt': None,
+                'fallback': f"I understand you're working within a budget, but ${last_price:.2f} is below my minimum of ${self.min_price:.2f}. I'm afraid I can't go any lower than that.",
+                'label': 'seller response'
+            }
+
+        if intent == 'accept':
             prompt = f"""You are a seller who has been negotiating for a {item}. The buyer's offer of ${last_price:.2f} meets your minimum price requirement of ${self.min_price:.2f}.
 
 Generate an acceptance message that:
@@ -166,37 +307,16 @@ Generate an acceptance message that:
 
 Return ONLY a valid JSON response with 'message' and 'price' keys.
 Example: {{"message": "I accept your offer! It's a deal...", "price": {last_price}}}"""
-            
-            try:
-                response = self.model.generate_content(prompt)
-                text = response.text
-                json_match = re.search(r'\{.*\}', text, re.DOTALL)
-                if json_match:
-                    acceptance = json.loads(json_match.group())
-                    acceptance['price'] = last_price
-                    return acceptance
-            except Exception as e:
-                print(f"Error generating seller acceptance: {e}")
-            
+
             return {
-                'message': f"I accept your offer of ${last_price:.2f} for the {item}. It's a deal! Let's proceed with the paperwork.",
-                'price': last_price
+                'agent': 'seller',
+                'intent': 'accept',
+                'price': last_price,
+                'prompt': prompt,
+                'fallback': f"I accept your offer of ${last_price:.2f} for the {item}. It's a deal! Let's proceed with the paperwork.",
+                'label': 'seller acceptance'
             }
-        
-        # Calculate strategic counter-offer (NEVER go below minimum)
-        if self.rounds_count == 1:
-            # First response - start high but reasonable (105-110% of min)
-            new_price = self.min_price * random.uniform(1.05, 1.10)
-        elif self.rounds_count == 2:
-            # Second response - make a meaningful concession but stay above min
-            new_price = max(self.min_price * 1.02, (last_price + self.min_price * 1.05) / 2)
-        else:
-            # Later rounds - smaller concessions, approach minimum carefully
-            new_price = max(self.min_price * 1.01, last_price * 0.98)
-        
-        # Absolute safety check - NEVER go below minimum
-        new_price = max(new_price, self.min_price * 1.001)
-        
+
         prompt = f"""You are a seller negotiating for a {item}. Your minimum acceptable price is ${self.min_price:.2f}.
         
 The buyer's last offer was ${last_price:.2f} with message: "{last_message}"
@@ -211,48 +331,57 @@ Generate a realistic counter-offer message that:
 
 Return ONLY a valid JSON response with 'message' and 'price' keys.
 Example: {{"message": "Thank you for your interest. While I appreciate the offer...", "price": {new_price:.2f}}}"""
-        
-        try:
-            response = self.model.generate_content(prompt)
-            text = response.text
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                counter = json.loads(json_match.group())
-                counter['price'] = new_price
-                return counter
-        except Exception as e:
-            print(f"Error generating seller response: {e}")
-        
-        # Fallback response
+
         reason = "excellent condition and low mileage" if self.rounds_count == 1 else "its quality and market value"
         return {
-            'message': f"Thank you for your interest. ${last_price:.2f} is quite low for this {item} given its {reason}. The lowest I could go would be ${new_price:.2f}.",
-            'price': new_price
+            'agent': 'seller',
+            'intent': 'counter',
+            'price': new_price,
+            'prompt': prompt,
+            'fallback': f"Thank you for your interest. ${last_price:.2f} is quite low for this {item} given its {reason}. The lowest I could go would be ${new_price:.2f}.",
+            'label': 'seller response'
         }
 
 class MediatorAgent:
     def __init__(self, model):
         self.model = model
-    
-    def intervene(self, item, prices, messages):
-        if len(prices) < 3:
+
+    def intervene(self, item, state, on_token=None, deadline=None):
+        plan = self.plan_intervention(item, state)
+        if plan is None:
+            return None
+        return render_turn(self.model, plan, on_token, deadline)
+
+    async def intervene_async(self, item, state, on_token=None, deadline=None):
+        plan = self.plan_intervention(item, state)
+        if plan is None:
+            return None
+        return await render_turn_async(self.model, plan, on_token, deadline)
+
+    def plan_intervention(self, item, state):
+        """Decide whether and where to mediate, without calling the model.
+
+        `state` is the engine's NegotiationState, which already tracks both
+        sides' latest offers and messages.
+        """
+        if state.count < 3 or state.gap() is None:
             return None  # Don't intervene too early
-            
+
         # Analyze the negotiation pattern
-        last_two_prices = prices[-2:]
-        price_gap = abs(last_two_prices[0] - last_two_prices[1])
-        avg_price = sum(last_two_prices) / 2
-        
+        last_two_prices = state.offers()
+        price_gap = state.gap()
+        avg_price = state.midpoint()
+
         # Only intervene if there's still a significant gap and negotiation seems stalled
         if price_gap < (avg_price * 0.05):  # If gap is less than 5%, no need to intervene
             return None
-            
+
         prompt = f"""You are a professional mediator facilitating a negotiation for a {item}.
 
 Current situation:
 - Recent offers: ${last_two_prices[0]:.2f} and ${last_two_prices[1]:.2f}
 - Price gap: ${price_gap:.2f}
-- Conversation context: {' | '.join(messages[-2:])}
+- Conversation context: {' | '.join(state.messages())}
 
 Generate a helpful mediation message that:
 - Acknowledges the progress made so far
@@ -264,21 +393,13 @@ Generate a helpful mediation message that:
 
 Return ONLY a valid JSON response with 'message' and 'price' keys.
 Example: {{"message": "I've been following your negotiation. You've made good progress...", "price": {avg_price:.2f}}}"""
-        
-        try:
-            response = self.model.generate_content(prompt)
-            text = response.text
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                mediation = json.loads(json_match.group())
-                mediation['price'] = avg_price
-                return mediation
-        except Exception as e:
-            print(f"Error generating mediator response: {e}")
-        
-        # Fallback response
-        progress_msg = f"the buyer started at ${prices[0]:.2f} and the seller came down from their initial position"
+
+        progress_msg = f"the buyer started at ${state.first_price:.2f} and the seller came down from their initial position"
         return {
-            'message': f"I've been following your negotiation. You've made good progress - {progress_msg}. Perhaps we can find middle ground around ${avg_price:.2f}? You're very close to a deal.",
-            'price': avg_price
+            'agent': 'mediator',
+            'intent': 'mediate',
+            'price': avg_price,
+            'prompt': prompt,
+            'fallback': f"I've been following your negotiation. You've made good progress - {progress_msg}. Perhaps we can find middle ground around ${avg_price:.2f}? You're very close to a deal.",
+            'label': 'mediator response'
         }
\ No newline at end of file
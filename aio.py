@@ -0,0 +1,44 @@
+"""The process's asyncio event loop for the async negotiation code.
+
+Under the ASGI entry point (asgi.py) this is the server's own loop, attached
+at startup. Otherwise, e.g. under Flask's threaded server, a daemon thread
+runs a loop of its own, and sync code hands it coroutines with run() and
+async generators with iterate(). Everything uses the one loop because async
+model clients (Gemini's gRPC channels) are tied to the loop they first ran on.
+"""
+import asyncio
+import threading
+
+class LoopRunner:
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def attach(self, loop):
+        """Run coroutines on `loop` (the ASGI server's) instead of a thread of our own"""
+        with self.lock:
+            self.loop = loop
+
+    def get_loop(self):
+        with self.lock:
+            if self.loop is None or self.loop.is_closed():
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name='asyncio', daemon=True).start()
+            return self.loop
+
+    def run(self, coro):
+        """Run a coroutine on the loop and wait for its result from this (non-loop) thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result()
+
+    def iterate(self, agen):
+        """Iterate an async generator from sync code, one item at a time"""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+runner = LoopRunner()
@@ -1,71 +1,249 @@
-from flask import Flask, render_template, request, jsonify, make_response
-from agents import BuyerAgent, SellerAgent, MediatorAgent
-from database import init_db, save_negotiation, get_negotiation_history
+from flask import Blueprint, Flask, Response, current_app, g, render_template, request, jsonify, make_response, stream_with_context
+from agents import BuyerAgent, SellerAgent, MediatorAgent, render_turn
+from database import (init_db, save_negotiation, save_negotiation_report, get_negotiation, get_negotiation_history,
+                      get_negotiation_page, get_history_version, write_count)
+from engine import RENDER_MODES, NegotiationState, iter_negotiation_async, scenario_rng
+from orderbook import run_order_book
+from strategies import get_strategy
+from llm_cache import CachedModel, LRUCache, SQLiteCache
+from batch import ConcurrencyLimitedModel, run_batch
+from sessions import SessionStore, SQLiteSessionTier
+from jobs import JobQueue
+from reports import ReportService, report_filename
+from backends import create_backend, generate_async
+from governor import GovernedModel
+from deadline import Deadline, DeadlineExceeded, call_seconds, timed_call
+from aio import runner
+from werkzeug.http import is_resource_modified
+from datetime import datetime, timezone
+import metrics
+import asyncio
+import base64
+import hashlib
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-import io
+import json
 import time
+import uuid
 
-# Load environment variables
-load_dotenv()
-
-app = Flask(__name__)
-app.config['DATABASE'] = 'negotiations.db'
-
-# Configure Gemini API
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    print("ERROR: GEMINI_API_KEY environment variable not set!")
-    print("Please set your Gemini API key:")
-    print("Set GEMINI_API_KEY=your_api_key_here")
-    print("Get your API key from: https://makersuite.google.com/app/apikey")
-    exit(1)
-
-try:
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    print("✅ Gemini API configured successfully")
-except Exception as e:
-    print(f"❌ Failed to configure Gemini API: {e}")
-    exit(1)
-
-# Initialize database
-init_db(app.config['DATABASE'])
-
-@app.route('/')
+routes = Blueprint('negotiation', __name__)
+
+# Summary and analysis calls run side by side, inline or as background jobs
+REPORT_MODES = ('inline', 'background')
+
+def load_config(app):
+    """Read the settings from the environment (and .env) into app.config"""
+    load_dotenv()
+    app.config['DATABASE'] = 'negotiations.db'
+    app.config['OFFLINE_MODE'] = os.getenv('OFFLINE_MODE', '0') == '1'
+    app.config['MODEL_BACKEND'] = os.getenv('MODEL_BACKEND', 'gemini')
+    app.config['MODEL_SEED'] = int(os.environ['MODEL_SEED']) if os.getenv('MODEL_SEED') else None
+    app.config['RENDER_WORKERS'] = int(os.getenv('RENDER_WORKERS', '8'))
+    app.config['RENDER_MODE'] = os.getenv('RENDER_MODE', 'parallel')
+    app.config['STREAM_TOKENS'] = os.getenv('STREAM_TOKENS', '1') == '1'
+    app.config['BATCH_WORKERS'] = int(os.getenv('BATCH_WORKERS', '8'))
+    app.config['BATCH_LLM_CONCURRENCY'] = int(os.getenv('BATCH_LLM_CONCURRENCY', '4'))
+    app.config['ORDER_BOOK_MAX_PARTICIPANTS'] = int(os.getenv('ORDER_BOOK_MAX_PARTICIPANTS', '10000'))
+    app.config['HISTORY_PAGE_SIZE'] = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+    app.config['HISTORY_PAGE_MAX'] = int(os.getenv('HISTORY_PAGE_MAX', '100'))
+    app.config['HISTORY_CACHE_SIZE'] = int(os.getenv('HISTORY_CACHE_SIZE', '256'))
+    app.config['HISTORY_CACHE_TTL'] = float(os.getenv('HISTORY_CACHE_TTL', '5'))
+    app.config['LLM_CACHE'] = os.getenv('LLM_CACHE', '1') == '1'
+    app.config['LLM_CACHE_SIZE'] = int(os.getenv('LLM_CACHE_SIZE', '1024'))
+    app.config['LLM_CACHE_TTL'] = int(os.getenv('LLM_CACHE_TTL', '3600'))
+    app.config['LLM_CACHE_DB'] = os.getenv('LLM_CACHE_DB', '')
+    app.config['LLM_CACHE_PRICE_BUCKET'] = float(os.getenv('LLM_CACHE_PRICE_BUCKET', '1.0'))
+    app.config['SESSION_CACHE_SIZE'] = int(os.getenv('SESSION_CACHE_SIZE', '1024'))
+    app.config['SESSION_TTL'] = int(os.getenv('SESSION_TTL', '3600'))
+    app.config['SESSION_DB'] = os.getenv('SESSION_DB', '')
+    app.config['REPORT_MODE'] = os.getenv('REPORT_MODE', 'inline')
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '4'))
+    app.config['REPORT_PROCESSES'] = int(os.getenv('REPORT_PROCESSES', '2'))
+    app.config['REPORT_CACHE_MB'] = int(os.getenv('REPORT_CACHE_MB', '64'))
+    app.config['REPORT_EXPORT_MAX'] = int(os.getenv('REPORT_EXPORT_MAX', '100'))
+    app.config['TRACE_IDS'] = os.getenv('TRACE_IDS', '0') == '1'
+    app.config['NEGOTIATION_DEADLINE'] = float(os.getenv('NEGOTIATION_DEADLINE', '0'))
+    app.config['DEADLINE_CALL_SECONDS'] = float(os.getenv('DEADLINE_CALL_SECONDS', '0'))
+    app.config['LLM_GOVERNOR'] = os.getenv('LLM_GOVERNOR', '1') == '1'
+    app.config['LLM_RPM'] = int(os.getenv('LLM_RPM', '0'))
+    app.config['LLM_TPM'] = int(os.getenv('LLM_TPM', '0'))
+    app.config['LLM_MAX_CONCURRENCY'] = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))
+    app.config['LLM_MAX_WAIT'] = float(os.getenv('LLM_MAX_WAIT', '10'))
+    app.config['LLM_RETRIES'] = int(os.getenv('LLM_RETRIES', '3'))
+    app.config['LLM_BREAKER_THRESHOLD'] = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))
+    app.config['LLM_BREAKER_RESET'] = float(os.getenv('LLM_BREAKER_RESET', '30'))
+
+def create_app(config=None):
+    """Build the Flask app and the services behind it.
+
+    `config` overrides the settings read from the environment. Startup stays
+    light: the Gemini client is created on the first model call and reportlab
+    is loaded on the first PDF. Raises RuntimeError if the model backend
+    can't be configured. Each app gets its own NegotiationServices, kept in
+    app.extensions['negotiation'].
+    """
+    app = Flask(__name__)
+    load_config(app)
+    app.config.update(config or {})
+
+    app.extensions['negotiation'] = NegotiationServices(app.config)
+    # Deadlines start from the configured typical call time, or from the first timed call
+    call_seconds.reset(app.config['DEADLINE_CALL_SECONDS'] or None)
+
+    app.register_blueprint(routes)
+    return app
+
+class NegotiationServices:
+    """The models, stores and caches behind one app.
+
+    Routes reach them through get_services(); code that runs away from the
+    request (on the asyncio runner or a job thread) is handed them instead.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.model = create_model(config)  # every model call goes through this
+
+        # Cache agent prompts in front of the model
+        self.agent_model = self.model
+        if self.model is not None and config['LLM_CACHE']:
+            self.agent_model = CachedModel(
+                self.model,
+                memory=LRUCache(config['LLM_CACHE_SIZE'], config['LLM_CACHE_TTL']),
+                disk=SQLiteCache(config['LLM_CACHE_DB']) if config['LLM_CACHE_DB'] else None,
+                price_bucket=config['LLM_CACHE_PRICE_BUCKET']
+            )
+
+        # Batch negotiations share one cap on concurrent model calls
+        self.batch_model = ConcurrencyLimitedModel(self.agent_model, config['BATCH_LLM_CONCURRENCY']) if self.agent_model is not None else None
+
+        init_db(config['DATABASE'])
+
+        # Step-by-step negotiations keep their agents server-side between requests
+        self.sessions = SessionStore(
+            self.agent_model,
+            memory=LRUCache(config['SESSION_CACHE_SIZE'], config['SESSION_TTL']),
+            disk=SQLiteSessionTier(config['SESSION_DB'], config['SESSION_TTL']) if config['SESSION_DB'] else None
+        )
+
+        self.jobs = JobQueue(config['JOB_WORKERS'])
+
+        # PDF reports render off the request threads and are cached by content
+        self.reports = ReportService(config['REPORT_PROCESSES'], config['REPORT_CACHE_MB'] * 1024 * 1024)
+
+        # History pages and the index page's list, keyed by the history version.
+        # Saves through this app clear it at once; the TTL bounds how long a
+        # save by another worker process goes unnoticed
+        self.history_cache = LRUCache(config['HISTORY_CACHE_SIZE'], config['HISTORY_CACHE_TTL'])
+
+def get_services():
+    """The NegotiationServices of the app handling the current request"""
+    return current_app.extensions['negotiation']
+
+def create_model(config):
+    """The model configured by MODEL_BACKEND behind the shared governor, or None offline"""
+    if config['OFFLINE_MODE']:
+        print("Running in offline mode: template messages only, no Gemini calls")
+        return None
+    if config['MODEL_BACKEND'] == 'gemini' and not os.getenv('GEMINI_API_KEY'):
+        raise RuntimeError("GEMINI_API_KEY environment variable not set!\n"
+                           "Please set your Gemini API key:\n"
+                           "Set GEMINI_API_KEY=your_api_key_here\n"
+                           "Get your API key from: https://makersuite.google.com/app/apikey\n"
+                           "Or set OFFLINE_MODE=1 to run without Gemini, or MODEL_BACKEND=stub for a local stand-in")
+    try:
+        backend = create_backend(config['MODEL_BACKEND'])
+    except Exception as e:
+        raise RuntimeError(f"Failed to configure model backend '{config['MODEL_BACKEND']}': {e}")
+    print(f"✅ Model backend '{config['MODEL_BACKEND']}' configured successfully")
+    if not config['LLM_GOVERNOR']:
+        return backend
+    # Every model call in the process shares one set of limits, retries and
+    # circuit breaker; it sits under the cache so cache hits don't use quota
+    return GovernedModel(
+        backend,
+        requests_per_minute=config['LLM_RPM'],
+        tokens_per_minute=config['LLM_TPM'],
+        max_concurrency=config['LLM_MAX_CONCURRENCY'],
+        max_wait=config['LLM_MAX_WAIT'],
+        retries=config['LLM_RETRIES'],
+        breaker_threshold=config['LLM_BREAKER_THRESHOLD'],
+        breaker_reset=config['LLM_BREAKER_RESET']
+    )
+
+@routes.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if current_app.config['TRACE_IDS']:
+        g.trace_id = request.headers.get('X-Trace-Id') or uuid.uuid4().hex
+
+@routes.after_app_request
+def record_request(response):
+    # For streamed responses this is the time until the stream starts
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.http_seconds.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    if current_app.config['TRACE_IDS']:
+        response.headers['X-Trace-Id'] = g.trace_id
+        print(f"[trace {g.trace_id}] {request.method} {request.path} {response.status_code} {elapsed * 1000:.0f}ms")
+    return response
+
+@routes.route('/metrics')
+def prometheus_metrics():
+    """Counters and histograms in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@routes.route('/')
 def index():
-    history = get_negotiation_history(app.config['DATABASE'])
+    history = cached_history('index', lambda: get_negotiation_history(current_app.config['DATABASE']))
     return render_template('index.html', history=history)
 
-@app.route('/start_auto_negotiation', methods=['POST'])
+@routes.route('/api/negotiations')
+def list_negotiations():
+    """Saved negotiations, newest first, a page at a time.
+
+    ?limit=N (default HISTORY_PAGE_SIZE), ?item= (part of the item name),
+    ?min_price= and ?max_price= (final price) filter; pass the response's
+    `next_cursor` as ?cursor= for the following page. Answers 304 when the
+    client's ETag or Last-Modified is still current, without reading a page.
+    """
+    try:
+        query = parse_history_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    newest_id, newest_timestamp = history_version()
+    etag = hashlib.sha1(f"{newest_id}|{newest_timestamp}".encode('utf-8')).hexdigest()[:20]
+    last_modified = http_time(newest_timestamp)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+    else:
+        response = jsonify(cached_history(('page',) + query, lambda: history_page(*query)))
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Clients may keep the page but must check back; the check is cheap
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@routes.route('/start_auto_negotiation', methods=['POST'])
 def start_auto_negotiation():
     try:
         print("Starting auto negotiation...")
         data = request.json
         print(f"Request data: {data}")
         
-        item = data['item']
-        buyer_max = float(data['buyer_max'])
-        seller_min = float(data['seller_min'])
-        
-        print(f"Item: {item}, Buyer Max: {buyer_max}, Seller Min: {seller_min}")
+        try:
+            item, buyer_max, seller_min, render_mode = parse_negotiation_request(data)
+            report_mode = parse_report_mode(data)
+            deadline = parse_deadline(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Validate that negotiation is possible
-        if seller_min > buyer_max:
-            return jsonify({
-                'error': f'Negotiation impossible: Seller minimum (${seller_min:.2f}) exceeds buyer maximum (${buyer_max:.2f})'
-            }), 400
+        offline = bool(data.get('offline', False))
         
         # Run automatic negotiation
         print("Running negotiation...")
-        negotiation_result = run_automatic_negotiation(item, buyer_max, seller_min)
+        negotiation_result = run_automatic_negotiation(get_services(), item, buyer_max, seller_min, render_mode, offline, report_mode, deadline)
         print("Negotiation completed successfully")
         
         return jsonify(negotiation_result)
@@ -75,136 +253,367 @@ def start_auto_negotiation():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-def run_automatic_negotiation(item, buyer_max, seller_min):
-    """Run a complete automatic negotiation with minimum 6 rounds"""
-    print("Initializing agents...")
-    buyer = BuyerAgent(model, max_price=buyer_max)
-    seller = SellerAgent(model, min_price=seller_min)
-    mediator = MediatorAgent(model)
+@routes.route('/start_auto_negotiation/stream', methods=['POST'])
+def start_auto_negotiation_stream():
+    """Stream an automatic negotiation as Server-Sent Events, one round at a time"""
+    data = request.json
+    try:
+        item, buyer_max, seller_min, render_mode = parse_negotiation_request(data)
+        report_mode = parse_report_mode(data)
+        deadline = parse_deadline(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    negotiation = {
-        'item': item,
-        'buyer_max': buyer_max,
-        'seller_min': seller_min,
-        'rounds': [],
-        'status': 'ongoing'
-    }
+    stream_tokens = bool(data.get('stream_tokens', current_app.config['STREAM_TOKENS']))
+    offline = bool(data.get('offline', False))
+    services = get_services()
     
-    print("Starting negotiation rounds...")
-    # Round 1: Buyer's initial offer
-    buyer_offer = buyer.make_initial_offer(item)
-    print(f"Buyer initial offer: {buyer_offer}")
-    negotiation['rounds'].append({
-        'round': 1,
-        'agent': 'buyer',
-        'message': buyer_offer['message'],
-        'price': buyer_offer['price']
-    })
+    def generate():
+        try:
+            for event, payload in iter_automatic_negotiation(services, item, buyer_max, seller_min, render_mode, offline, stream_tokens, report_mode, deadline):
+                yield format_sse(event, payload)
+        except Exception as e:
+            print(f"Error streaming auto negotiation: {e}")
+            yield format_sse('error', {'error': str(e)})
     
-    # Continue negotiation for at least 6 rounds
-    round_count = 1
-    while round_count < 6 or negotiation['status'] == 'ongoing':
-        round_count += 1
-        last_round = negotiation['rounds'][-1]
-        
-        # Determine whose turn it is
-        if last_round['agent'] == 'buyer':
-            response = seller.respond_to_offer(item, last_round['price'], last_round['message'])
-            agent = 'seller'
-        elif last_round['agent'] == 'seller':
-            response = buyer.respond_to_offer(item, last_round['price'], last_round['message'])
-            agent = 'buyer'
-        else:  # mediator just spoke
-            # Continue with whoever didn't speak last before mediator
-            prev_agent = None
-            for i in range(len(negotiation['rounds']) - 2, -1, -1):
-                if negotiation['rounds'][i]['agent'] != 'mediator':
-                    prev_agent = negotiation['rounds'][i]['agent']
-                    break
-            
-            if prev_agent == 'buyer':
-                response = seller.respond_to_offer(item, last_round['price'], last_round['message'])
-                agent = 'seller'
-            else:
-                response = buyer.respond_to_offer(item, last_round['price'], last_round['message'])
-                agent = 'buyer'
-        
-        print(f"Round {round_count} - {agent}: {response}")
-        
-        # Add mediator intervention periodically
-        if round_count == 4 or (round_count > 6 and round_count % 3 == 0):
-            mediation = mediator.intervene(
-                item,
-                [r['price'] for r in negotiation['rounds'] if r.get('price')],
-                [r['message'] for r in negotiation['rounds']]
-            )
-            if mediation:
-                negotiation['rounds'].append({
-                    'round': round_count,
-                    'agent': 'mediator',
-                    'message': mediation['message'],
-                    'price': mediation.get('price')
-                })
-                round_count += 1
-        
-        # Add the main response
-        negotiation['rounds'].append({
-            'round': round_count,
-            'agent': agent,
-            'message': response['message'],
-            'price': response['price']
-        })
-        
-        # Check for agreement after minimum rounds
-        if round_count >= 6:
-            # Check for explicit acceptance
-            acceptance_keywords = ['accept', 'deal', 'agreed', 'proceed', 'paperwork', 'finalize']
-            if any(keyword in response['message'].lower() for keyword in acceptance_keywords):
-                if seller_min <= response['price'] <= buyer_max:
-                    negotiation['status'] = 'agreed'
-                    negotiation['final_price'] = response['price']
-                    break
-            
-            # Check if prices are converging
-            if len(negotiation['rounds']) >= 2:
-                last_two_prices = [negotiation['rounds'][-1]['price'], negotiation['rounds'][-2]['price']]
-                if abs(last_two_prices[0] - last_two_prices[1]) < 10:  # Within $10
-                    avg_price = sum(last_two_prices) / 2
-                    if seller_min <= avg_price <= buyer_max:
-                        negotiation['status'] = 'agreed'
-                        negotiation['final_price'] = avg_price
-                        break
-        
-        # Prevent infinite loops
-        if round_count >= 12:
-            negotiation['status'] = 'failed'
-            negotiation['reason'] = 'Maximum rounds reached without agreement'
-            break
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@routes.route('/batch_negotiate', methods=['POST'])
+def batch_negotiate():
+    """Negotiate a JSONL file of scenarios, streaming one JSON result per line as each finishes"""
+    upload = request.files.get('file')
+    lines = (upload.read() if upload else request.get_data()).decode('utf-8').splitlines()
     
-    # Generate AI summary and analysis
-    negotiation['summary'] = generate_negotiation_summary(negotiation)
-    negotiation['analysis'] = generate_negotiation_analysis(negotiation)
+    try:
+        workers = int(request.args.get('workers', current_app.config['BATCH_WORKERS']))
+    except ValueError:
+        return jsonify({'error': 'workers must be an integer'}), 400
+    if workers < 1:
+        return jsonify({'error': 'workers must be at least 1'}), 400
+    render_mode = request.args.get('render_mode', current_app.config['RENDER_MODE'])
+    if render_mode not in RENDER_MODES:
+        return jsonify({
+            'error': f"Unknown render mode '{render_mode}', expected one of: {', '.join(RENDER_MODES)}"
+        }), 400
+    offline = request.args.get('offline') in ('1', 'true') or current_app.config['OFFLINE_MODE']
     
-    # Save to database if successful
-    if negotiation['status'] == 'agreed':
-        save_negotiation(
-            app.config['DATABASE'],
-            negotiation['item'],
-            negotiation['buyer_max'],
-            negotiation['seller_min'],
-            negotiation['final_price'],
-            "\n".join([f"Round {r['round']} - {r['agent'].title()}: {r['message']}" for r in negotiation['rounds']])
-        )
-        print("Negotiation saved to database")
+    print(f"Starting batch of {len(lines)} lines with {workers} workers")
+    results = run_batch(
+        lines,
+        None if offline else get_services().batch_model,
+        workers,
+        render_mode,
+        current_app.config['RENDER_WORKERS'],
+        current_app.config['DATABASE'],
+        seed=current_app.config['MODEL_SEED']
+    )
+    
+    def generate():
+        for result in results:
+            yield json.dumps(result) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@routes.route('/order_book', methods=['POST'])
+def order_book():
+    """Negotiate one listing with many buyers, or one buyer's request with many sellers.
+
+    Send `buyers` (each bidder's maximum price) with `seller_min`, or
+    `sellers` (each seller's minimum price) with `buyer_max`. Only the best
+    offer and the answer to it are written by the model each round; see
+    orderbook.py.
+    """
+    data = request.json
+    try:
+        item, side, limit, limits, strategy = parse_order_book_request(data)
+    except KeyError as e:
+        return jsonify({'error': f"Missing field {e}"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    offline = bool(data.get('offline', False)) or current_app.config['OFFLINE_MODE']
+    services = get_services()
+    negotiation = run_order_book(item, side, limit, limits, None if offline else services.agent_model, strategy,
+                                 scenario_rng(current_app.config['MODEL_SEED'], item, side, limit, limits),
+                                 max_workers=current_app.config['RENDER_WORKERS'])
+    print(f"Order book for {item}: {negotiation['status']} with {negotiation['participants']} {side}, "
+          f"{negotiation['pruned']} pruned")
+    save_agreed_negotiation(services, negotiation)
+    return jsonify(negotiation)
+
+def parse_order_book_request(data):
+    """Validate an order book request, raising ValueError with a message for the client"""
+    item = data['item']
+    if 'buyers' in data:
+        side, limit, values = 'buyers', float(data['seller_min']), data['buyers']
+    elif 'sellers' in data:
+        side, limit, values = 'sellers', float(data['buyer_max']), data['sellers']
+    else:
+        raise ValueError("Send 'buyers' (maximum prices) with 'seller_min', or 'sellers' (minimum prices) with 'buyer_max'")
+    limits = [float(value) for value in values]
+    if not limits:
+        raise ValueError(f"'{side}' must list at least one price")
+    if len(limits) > current_app.config['ORDER_BOOK_MAX_PARTICIPANTS']:
+        raise ValueError(f"At most {current_app.config['ORDER_BOOK_MAX_PARTICIPANTS']} {side} per order book")
+    strategy = get_strategy(data.get('strategy', 'default')).name
+    return item, side, limit, limits, strategy
+
+def parse_history_query(args):
+    """(limit, before, item, min_price, max_price) from /api/negotiations' query string"""
+    try:
+        limit = int(args.get('limit', current_app.config['HISTORY_PAGE_SIZE']))
+        min_price = float(args['min_price']) if args.get('min_price') else None
+        max_price = float(args['max_price']) if args.get('max_price') else None
+    except ValueError:
+        raise ValueError('limit must be a whole number and min_price/max_price numbers')
+    if not 1 <= limit <= current_app.config['HISTORY_PAGE_MAX']:
+        raise ValueError(f"limit must be between 1 and {current_app.config['HISTORY_PAGE_MAX']}")
+    before = decode_cursor(args['cursor']) if args.get('cursor') else None
+    return limit, before, args.get('item') or None, min_price, max_price
+
+def encode_cursor(entry):
+    return base64.urlsafe_b64encode(json.dumps([entry['timestamp'], entry['id']]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        timestamp, negotiation_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(timestamp), int(negotiation_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def history_page(limit, before, item, min_price, max_price):
+    page, more = get_negotiation_page(current_app.config['DATABASE'], limit, before, item, min_price, max_price)
+    return {'negotiations': page, 'next_cursor': encode_cursor(page[-1]) if more else None}
+
+def history_version():
+    """(newest id, newest timestamp) of the history, read again after each save through this process"""
+    history_cache = get_services().history_cache
+    key = ('version', write_count(current_app.config['DATABASE']))
+    version = history_cache.get(key)
+    if version is None:
+        version = get_history_version(current_app.config['DATABASE'])
+        history_cache.set(key, version)
+    return version
+
+def cached_history(key, load):
+    """load() for the current history version, cached until the next save"""
+    history_cache = get_services().history_cache
+    key = (key, history_version())
+    value = history_cache.get(key)
+    if value is None:
+        value = load()
+        history_cache.set(key, value)
+    return value
+
+def http_time(timestamp):
+    """A stored (local, naive) timestamp as an aware UTC datetime for Last-Modified"""
+    try:
+        return datetime.fromisoformat(timestamp).astimezone(timezone.utc) if timestamp else None
+    except (ValueError, TypeError):
+        return None
+
+def format_sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def parse_negotiation_request(data):
+    """Validate a start request, raising ValueError with a message for the client"""
+    try:
+        item = data['item']
+        buyer_max = float(data['buyer_max'])
+        seller_min = float(data['seller_min'])
+        render_mode = data.get('render_mode', current_app.config['RENDER_MODE'])
+    except KeyError as e:
+        raise ValueError(f"Missing field {e}")
+    except TypeError as e:
+        raise ValueError(f"Invalid request: {e}")
+    
+    print(f"Item: {item}, Buyer Max: {buyer_max}, Seller Min: {seller_min}")
     
+    # Validate that negotiation is possible
+    if seller_min > buyer_max:
+        raise ValueError(f'Negotiation impossible: Seller minimum (${seller_min:.2f}) exceeds buyer maximum (${buyer_max:.2f})')
+    
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode '{render_mode}', expected one of: {', '.join(RENDER_MODES)}")
+    
+    return item, buyer_max, seller_min, render_mode
+
+def parse_posted_negotiation(data, fields=('item', 'buyer_max', 'seller_min', 'rounds')):
+    """The `negotiation` a client posted back, raising ValueError with a message for the client"""
+    try:
+        negotiation = data['negotiation']
+        # Each lookup raises the KeyError (or TypeError) the client is told about
+        for field in fields:
+            negotiation[field]
+        negotiation['buyer_max'] = float(negotiation['buyer_max'])
+        negotiation['seller_min'] = float(negotiation['seller_min'])
+        for round_data in negotiation['rounds']:
+            round_data['agent'], round_data['message']
+    except KeyError as e:
+        raise ValueError(f"Missing field {e}")
+    except TypeError as e:
+        raise ValueError(f"Invalid negotiation: {e}")
     return negotiation
 
-def generate_negotiation_summary(negotiation):
-    """Generate AI-powered negotiation summary"""
+def parse_report_mode(data):
+    report_mode = data.get('report_mode', current_app.config['REPORT_MODE'])
+    if report_mode not in REPORT_MODES:
+        raise ValueError(f"Unknown report mode '{report_mode}', expected one of: {', '.join(REPORT_MODES)}")
+    return report_mode
+
+def parse_deadline(data):
+    """The request's time budget: `deadline` seconds from the body, else NEGOTIATION_DEADLINE (0 is none)"""
+    seconds = float(data.get('deadline', current_app.config['NEGOTIATION_DEADLINE']) or 0)
+    if seconds < 0:
+        raise ValueError('deadline must be a number of seconds, or 0 for none')
+    return Deadline.after(seconds)
+
+def run_automatic_negotiation(services, item, buyer_max, seller_min, render_mode='parallel', offline=False, report_mode='inline', deadline=None):
+    """Run a complete automatic negotiation with minimum 6 rounds"""
+    return runner.run(run_automatic_negotiation_async(services, item, buyer_max, seller_min, render_mode, offline, report_mode, deadline))
+
+async def run_automatic_negotiation_async(services, item, buyer_max, seller_min, render_mode='parallel', offline=False, report_mode='inline', deadline=None):
+    async for event, payload in iter_automatic_negotiation_async(services, item, buyer_max, seller_min, render_mode, offline, report_mode=report_mode, deadline=deadline):
+        if event == 'done':
+            return payload
+
+def iter_automatic_negotiation(services, item, buyer_max, seller_min, render_mode='parallel', offline=False, stream_tokens=False, report_mode='inline', deadline=None):
+    """iter_automatic_negotiation_async for sync callers such as the Flask routes"""
+    return runner.iterate(iter_automatic_negotiation_async(services, item, buyer_max, seller_min, render_mode, offline, stream_tokens, report_mode, deadline))
+
+async def iter_automatic_negotiation_async(services, item, buyer_max, seller_min, render_mode='parallel', offline=False, stream_tokens=False, report_mode='inline', deadline=None):
+    """Run an automatic negotiation, yielding (event, payload) pairs as it progresses.
+
+    Prices and the outcome are planned locally first; the messages for every
+    round are then generated concurrently ('parallel') or all together in a
+    single model call ('batch'). Rounds are yielded as soon as they are
+    rendered, followed by the summary and the analysis (in whichever order
+    they finish) and finally the complete negotiation under 'done'. In
+    'background' report mode the negotiation is saved and returned straight
+    away with a `report_job` ID; the summary and analysis arrive through
+    /jobs/<id> and are then saved with the record. With stream_tokens, 'token' events carry each
+    message's text while it is being generated (parallel mode only).
+    Offline negotiations (or OFFLINE_MODE) use template text throughout and
+    never call the model. With a deadline, rounds and report parts that would
+    not finish in time use their template text instead: such rounds are
+    marked `degraded`, and a 'degraded' event lists the report parts.
+    `services` are the app's NegotiationServices; this runs on the asyncio
+    runner, away from the request.
+    """
+    offline = offline or services.config['OFFLINE_MODE']
+    llm = None if offline else services.agent_model
+    
+    print("Planning negotiation rounds...")
+    rng = scenario_rng(services.config['MODEL_SEED'], item, buyer_max, seller_min)
+    events = iter_negotiation_async(item, buyer_max, seller_min, llm, render_mode, stream_tokens, deadline, rng)
+    async for event, payload in events:
+        if event == 'start':
+            negotiation = payload
+            print(f"Planned {len(negotiation['rounds'])} rounds, outcome: {negotiation['status']}")
+            yield 'start', dict(negotiation, rounds=len(negotiation['rounds']))
+        else:
+            yield event, payload
+    
+    if report_mode == 'background':
+        negotiation['summary'] = negotiation['analysis'] = None
+        negotiation_id = await asyncio.to_thread(save_agreed_negotiation, services, negotiation)
+        negotiation['report_job'] = services.jobs.submit(iter_background_report, services, negotiation_id, dict(negotiation), offline).id
+        yield 'done', negotiation
+        return
+    
+    # Generate AI summary and analysis
+    async for event, text in iter_report_async(services, negotiation, offline, deadline):
+        negotiation[event] = text
+        yield event, {event: text}
+    
+    await asyncio.to_thread(save_agreed_negotiation, services, negotiation)
+    yield 'done', negotiation
+
+def save_agreed_negotiation(services, negotiation):
+    """Save the negotiation if it reached a deal, returning the record id"""
+    if negotiation['status'] != 'agreed':
+        return None
+    negotiation['id'] = save_negotiation(
+        services.config['DATABASE'],
+        negotiation['item'],
+        negotiation['buyer_max'],
+        negotiation['seller_min'],
+        negotiation['final_price'],
+        negotiation['rounds'],
+        negotiation.get('summary'),
+        negotiation.get('analysis')
+    )
+    print("Negotiation saved to database")
+    return negotiation['id']
+
+def iter_report(services, negotiation, offline=False, deadline=None):
+    """iter_report_async for sync callers"""
+    return runner.iterate(iter_report_async(services, negotiation, offline, deadline))
+
+async def iter_report_async(services, negotiation, offline=False, deadline=None):
+    """Generate the summary and analysis concurrently, yielding each as it finishes.
+
+    Parts the deadline left no time for get their template text, and are
+    listed in a final ('degraded', parts) pair.
+    """
+    tasks = {asyncio.create_task(generate_report_part(services, part, negotiation, offline, deadline)): part for part in REPORT_PARTS}
+    pending = set(tasks)
+    degraded = []
     try:
-        rounds_text = "\n".join([f"Round {r['round']} - {r['agent'].title()}: {r['message']} (${r['price']:.2f})" for r in negotiation['rounds']])
-        
-        prompt = f"""Generate a professional negotiation summary for the following negotiation:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                part = tasks[task]
+                try:
+                    text = task.result()
+                except DeadlineExceeded as e:
+                    print(f"Using the template {part}: {e}")
+                    text = REPORT_PARTS[part][1](negotiation)
+                    degraded.append(part)
+                yield part, text
+    finally:
+        for task in pending:
+            task.cancel()
+    if degraded:
+        yield 'degraded', degraded
+
+def iter_background_report(services, negotiation_id, negotiation, offline):
+    """Job body for background reports: publish each part, then save both with the record"""
+    report = {}
+    for event, text in iter_report(services, negotiation, offline):
+        report[event] = text
+        yield event, text
+    if negotiation_id is not None:
+        save_negotiation_report(services.config['DATABASE'], negotiation_id, report['summary'], report['analysis'])
+
+async def generate_report_part(services, part, negotiation, offline=False, deadline=None):
+    """Generate the AI-powered summary or analysis; raises DeadlineExceeded when there's no time for it"""
+    build_prompt, template = REPORT_PARTS[part]
+    if offline or services.model is None:
+        return template(negotiation)
+    if deadline is not None and not deadline.allows_call():
+        raise DeadlineExceeded(f"No time left for the {part}")
+    try:
+        prompt = build_prompt(negotiation)
+        with timed_call(), metrics.llm_span('report', part) as span:
+            span.prompt(prompt)
+            call = generate_async(services.model, prompt)
+            response = await (call if deadline is None else deadline.run_async(call))
+            span.response(response)
+        return response.text.strip()
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return f"{part.title()} generation failed: {str(e)}"
+
+def summary_prompt(negotiation):
+    rounds_text = "\n".join([f"Round {r['round']} - {r['agent'].title()}: {r['message']} (${r['price']:.2f})" for r in negotiation['rounds']])
+    
+    return f"""Generate a professional negotiation summary for the following negotiation:
 
 Item: {negotiation['item']}
 Buyer Maximum: ${negotiation['buyer_max']:.2f}
@@ -221,17 +630,10 @@ Create a concise summary (150-200 words) that includes:
 - Final outcome
 - Professional tone suitable for a business report"""
 
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        return f"Summary generation failed: {str(e)}"
-
-def generate_negotiation_analysis(negotiation):
-    """Generate AI-powered negotiation analysis"""
-    try:
-        prices = [r['price'] for r in negotiation['rounds'] if r['price']]
-        
-        prompt = f"""Analyze this negotiation and provide strategic insights:
+def analysis_prompt(negotiation):
+    prices = [r['price'] for r in negotiation['rounds'] if r['price']]
+    
+    return f"""Analyze this negotiation and provide strategic insights:
 
 Item: {negotiation['item']}
 Buyer Maximum: ${negotiation['buyer_max']:.2f}
@@ -249,221 +651,262 @@ Provide analysis covering:
 
 Keep it professional and analytical (200-250 words)."""
 
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        return f"Analysis generation failed: {str(e)}"
+def template_summary(negotiation):
+    """Summary used in offline mode"""
+    outcome = (f"reached agreement at ${negotiation['final_price']:.2f}" if negotiation['status'] == 'agreed'
+               else f"ended without agreement ({negotiation.get('reason', 'no deal')})")
+    return (f"The negotiation for the {negotiation['item']} {outcome} after {len(negotiation['rounds'])} rounds. "
+            f"The buyer's maximum was ${negotiation['buyer_max']:.2f} and the seller's minimum was ${negotiation['seller_min']:.2f}.")
 
-@app.route('/continue_negotiation', methods=['POST'])
-def continue_negotiation():
+def template_analysis(negotiation):
+    """Analysis used in offline mode"""
+    prices = [r['price'] for r in negotiation['rounds'] if r['price']]
+    return (f"Offers ranged from ${min(prices):.2f} to ${max(prices):.2f} over {len(negotiation['rounds'])} rounds. "
+            f"This report was generated offline from the agents' pricing rules without AI commentary.")
+
+# Report part -> (prompt builder, offline template)
+REPORT_PARTS = {
+    'summary': (summary_prompt, template_summary),
+    'analysis': (analysis_prompt, template_analysis)
+}
+
+@routes.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Poll a background job; ?wait=N holds the request up to N seconds until it finishes"""
+    job = get_services().jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    wait = min(float(request.args.get('wait', 0) or 0), 30.0)
+    if wait > 0:
+        job.wait(wait)
+    return jsonify(job.to_dict())
+
+@routes.route('/jobs/<job_id>/stream')
+def job_stream(job_id):
+    """Stream a background job's results as Server-Sent Events, ending with 'done' or 'error'"""
+    job = get_services().jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    
+    def generate():
+        seen = 0
+        while True:
+            for key, value in job.follow(seen, timeout=15):
+                seen += 1
+                yield format_sse(key, {key: value})
+            if job.done():
+                break
+            # Keep idle connections open through proxies
+            yield ": keep-alive\n\n"
+        if job.status == 'error':
+            yield format_sse('error', {'error': job.error})
+        else:
+            yield format_sse('done', job.to_dict())
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@routes.route('/llm_cache/stats')
+def llm_cache_stats():
+    agent_model = get_services().agent_model
+    if not isinstance(agent_model, CachedModel):
+        return jsonify({'enabled': False})
+    return jsonify(dict(agent_model.stats(), enabled=True))
+
+@routes.route('/llm/governor')
+def llm_governor_stats():
+    model = get_services().model
+    if not isinstance(model, GovernedModel):
+        return jsonify({'enabled': False})
+    return jsonify(dict(model.stats(), enabled=True))
+
+@routes.route('/start_negotiation', methods=['POST'])
+def start_negotiation():
+    """Open a step-by-step negotiation with the buyer's opening offer"""
     data = request.json
-    negotiation = data['negotiation']
-    last_round = negotiation['rounds'][-1]
+    try:
+        item, buyer_max, seller_min, _ = parse_negotiation_request(data)
+        deadline = parse_deadline(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    buyer = BuyerAgent(model, max_price=negotiation['buyer_max'])
-    seller = SellerAgent(model, min_price=negotiation['seller_min'])
-    mediator = MediatorAgent(model)
+    sessions = get_services().sessions
+    session = sessions.create(item, buyer_max, seller_min, scenario_rng(current_app.config['MODEL_SEED'], item, buyer_max, seller_min))
+    with session.lock:
+        opening = session.buyer.make_initial_offer(item, deadline=deadline)
+        session.state.push(to_step_round('buyer', opening))
+        sessions.save(session)
+    return jsonify(dict(session.negotiation(), session_id=session.session_id))
+
+@routes.route('/continue_negotiation', methods=['POST'])
+def continue_negotiation():
+    """Advance a negotiation by one response.
+
+    With a session_id (from /start_negotiation) only the rounds added by this
+    step are returned. Older clients may still post the whole negotiation and
+    get it back in full; their agents start from scratch on every step.
+    A `deadline` in seconds bounds the model calls for the step.
+    """
+    data = request.json or {}
+    try:
+        deadline = parse_deadline(data)
+        negotiation = parse_posted_negotiation(data) if 'session_id' not in data else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if negotiation is not None:
+        rng = scenario_rng(current_app.config['MODEL_SEED'], negotiation['item'], negotiation['buyer_max'], negotiation['seller_min'])
+        agent_model = get_services().agent_model
+        buyer = BuyerAgent(agent_model, negotiation['buyer_max'], rng)
+        seller = SellerAgent(agent_model, negotiation['seller_min'], rng)
+        mediator = MediatorAgent(agent_model)
+        state = NegotiationState(negotiation['buyer_max'], negotiation['seller_min'], negotiation['rounds'])
+        advance_negotiation(negotiation, state, buyer, seller, mediator, deadline)
+        return jsonify(negotiation)
     
-    if last_round['agent'] == 'buyer':
-        # Seller's turn to respond
-        response = seller.respond_to_offer(
-            negotiation['item'],
-            last_round['price'],
-            last_round['message']
-        )
-        agent = 'seller'
-    else:
-        # Buyer's turn to respond
-        response = buyer.respond_to_offer(
-            negotiation['item'],
-            last_round['price'],
-            last_round['message']
-        )
-        agent = 'buyer'
+    sessions = get_services().sessions
+    session = sessions.get(data['session_id'])
+    if session is None:
+        return jsonify({'error': 'Unknown or expired session'}), 404
     
-    # Check if mediator should intervene
-    if len(negotiation['rounds']) >= 4 and len(negotiation['rounds']) % 2 == 0:  # After every 2 rounds starting from round 4
-        mediation = mediator.intervene(
-            negotiation['item'],
-            [r['price'] for r in negotiation['rounds']],
-            [r['message'] for r in negotiation['rounds']]
-        )
-        if mediation:
-            negotiation['rounds'].append({
-                'agent': 'mediator',
-                'message': mediation['message'],
-                'price': mediation.get('price')
-            })
+    with session.lock:
+        negotiation = session.negotiation()
+        seen = len(negotiation['rounds'])
+        if negotiation['status'] == 'ongoing':
+            advance_negotiation(negotiation, session.state, session.buyer, session.seller, session.mediator, deadline)
+            session.update(negotiation)
+            sessions.save(session)
     
-    negotiation['rounds'].append({
+    return jsonify({
+        'session_id': session.session_id,
+        'status': negotiation['status'],
+        'final_price': negotiation.get('final_price'),
+        'reason': negotiation.get('reason'),
+        'round_count': len(negotiation['rounds']),
+        'rounds': negotiation['rounds'][seen:]
+    })
+
+def to_step_round(agent, response):
+    """The round stored for one agent response in a step-by-step negotiation"""
+    step = {
         'agent': agent,
         'message': response['message'],
-        'price': response['price']
-    })
+        'price': response.get('price')
+    }
+    if response.get('degraded'):
+        step['degraded'] = True
+    return step
+
+def advance_negotiation(negotiation, state, buyer, seller, mediator, deadline=None):
+    """Add the next response (and any mediation) to negotiation, updating its status.
+
+    `state` is the NegotiationState over negotiation['rounds']; agreement
+    follows the same rule as automatic negotiations (engine.py).
+    """
+    responder = seller if state.next_party() == 'seller' else buyer
+    plan = responder.plan_response(negotiation['item'], *state.last_offer())
+    response = render_turn(responder.model, plan, deadline=deadline)
     
-    # Check for agreement - look for acceptance keywords or very close prices
-    if len(negotiation['rounds']) >= 2:
-        last_round = negotiation['rounds'][-1]
-        prev_round = negotiation['rounds'][-2]
-        
-        # Check if someone accepted explicitly
-        acceptance_keywords = ['accept', 'deal', 'agreed', 'proceed', 'paperwork', 'finalize']
-        if any(keyword in last_round['message'].lower() for keyword in acceptance_keywords):
-            final_price = last_round['price']
-            # Validate final price is within acceptable range
-            if negotiation['seller_min'] <= final_price <= negotiation['buyer_max']:
-                negotiation['status'] = 'agreed'
-                negotiation['final_price'] = final_price
-                save_negotiation(
-                    app.config['DATABASE'],
-                    negotiation['item'],
-                    negotiation['buyer_max'],
-                    negotiation['seller_min'],
-                    negotiation['final_price'],
-                    "\n".join([f"{r['agent'].title()}: {r['message']}" for r in negotiation['rounds']])
-                )
-            else:
-                negotiation['status'] = 'failed'
-                negotiation['reason'] = f'Final price ${final_price:.2f} outside acceptable range'
-        # Check if prices are very close (within 2% of average) AND within valid range
-        elif (prev_round['agent'] != last_round['agent'] and 
-              abs(prev_round['price'] - last_round['price']) < ((prev_round['price'] + last_round['price']) / 2 * 0.02)):
-            final_price = (prev_round['price'] + last_round['price']) / 2
-            # Validate final price is within acceptable range
-            if negotiation['seller_min'] <= final_price <= negotiation['buyer_max']:
-                negotiation['status'] = 'agreed'
-                negotiation['final_price'] = final_price
-                save_negotiation(
-                    app.config['DATABASE'],
-                    negotiation['item'],
-                    negotiation['buyer_max'],
-                    negotiation['seller_min'],
-                    negotiation['final_price'],
-                    "\n".join([f"{r['agent'].title()}: {r['message']}" for r in negotiation['rounds']])
-                )
-            else:
-                negotiation['status'] = 'failed'
-                negotiation['reason'] = f'Final price ${final_price:.2f} outside acceptable range'
-        # Check for negotiation failure (too many rounds without progress)
-        elif len(negotiation['rounds']) >= 10:
-            negotiation['status'] = 'failed'
+    # Check if mediator should intervene
+    if state.count >= 4 and state.count % 2 == 0:  # After every 2 rounds starting from round 4
+        mediation = mediator.intervene(negotiation['item'], state, deadline=deadline)
+        if mediation:
+            state.push(to_step_round('mediator', mediation))
     
-    return jsonify(negotiation)
+    state.push(to_step_round(plan['agent'], response))
+    
+    accepted = plan['intent'] == 'accept'
+    final_price = state.agreed_price(accepted)
+    rejected_price = state.rejected_price(accepted) if final_price is None else None
+    if final_price is not None:
+        negotiation['status'] = 'agreed'
+        negotiation['final_price'] = final_price
+        save_negotiation(
+            current_app.config['DATABASE'],
+            negotiation['item'],
+            negotiation['buyer_max'],
+            negotiation['seller_min'],
+            negotiation['final_price'],
+            negotiation['rounds']
+        )
+    elif rejected_price is not None:
+        # The sides met, but on a price one of them can't take
+        negotiation['status'] = 'failed'
+        negotiation['reason'] = f'Final price ${rejected_price:.2f} outside acceptable range'
+    # Check for negotiation failure (too many rounds without progress)
+    elif state.count >= 10:
+        negotiation['status'] = 'failed'
 
-@app.route('/download_report/<int:negotiation_id>')
+@routes.route('/download_report/<int:negotiation_id>')
 def download_report(negotiation_id):
-    """Generate and download PDF report for a negotiation"""
+    """Download the PDF report for a saved negotiation"""
     try:
-        # Get negotiation data from database (simplified - you'd implement this)
-        # For now, we'll generate a sample report
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Title
-        title = Paragraph("Negotiation Report", styles['Title'])
-        story.append(title)
-        story.append(Spacer(1, 12))
-        
-        # Sample content - in real implementation, you'd fetch from database
-        content = Paragraph("This is a sample negotiation report. Full implementation would include actual negotiation data.", styles['Normal'])
-        story.append(content)
-        
-        doc.build(story)
-        buffer.seek(0)
-        
-        response = make_response(buffer.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=negotiation_report_{negotiation_id}.pdf'
-        
-        return response
+        negotiation = get_negotiation(current_app.config['DATABASE'], negotiation_id)
+        if negotiation is None:
+            return jsonify({'error': f'Negotiation {negotiation_id} not found'}), 404
+        return pdf_response(get_services().reports.render(negotiation), report_filename(negotiation))
+    except Exception as e:
+        print(f"PDF generation error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@routes.route('/download_reports')
+def download_reports():
+    """Download a zip of reports: ?ids=1,2,3, or the latest ?limit=N saved negotiations"""
+    try:
+        if request.args.get('ids'):
+            ids = [int(i) for i in request.args['ids'].split(',') if i.strip()]
+        else:
+            limit = int(request.args.get('limit', 10))
+            ids = [n['id'] for n in get_negotiation_history(current_app.config['DATABASE'], limit)]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of numbers and limit a number'}), 400
+    if len(ids) > current_app.config['REPORT_EXPORT_MAX']:
+        return jsonify({'error': f"At most {current_app.config['REPORT_EXPORT_MAX']} reports per export"}), 400
+    
+    negotiations = [get_negotiation(current_app.config['DATABASE'], negotiation_id) for negotiation_id in ids]
+    missing = [negotiation_id for negotiation_id, n in zip(ids, negotiations) if n is None]
+    if missing:
+        return jsonify({'error': f"Negotiations not found: {', '.join(map(str, missing))}"}), 404
+    
+    try:
+        archive = get_services().reports.export_zip(negotiations)
     except Exception as e:
+        print(f"PDF export error: {e}")
         return jsonify({'error': str(e)}), 500
+    response = make_response(archive)
+    response.headers['Content-Type'] = 'application/zip'
+    response.headers['Content-Disposition'] = 'attachment; filename=negotiation_reports.zip'
+    return response
 
-@app.route('/generate_pdf_report', methods=['POST'])
+@routes.route('/generate_pdf_report', methods=['POST'])
 def generate_pdf_report():
     """Generate PDF report from negotiation data"""
     try:
-        data = request.json
-        negotiation = data['negotiation']
-        
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=1*inch)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Title
-        title = Paragraph("NEGOTIATION ANALYSIS REPORT", styles['Title'])
-        story.append(title)
-        story.append(Spacer(1, 20))
-        
-        # Executive Summary
-        summary_title = Paragraph("Executive Summary", styles['Heading1'])
-        story.append(summary_title)
-        summary_text = Paragraph(negotiation.get('summary', 'No summary available'), styles['Normal'])
-        story.append(summary_text)
-        story.append(Spacer(1, 15))
-        
-        # Negotiation Details Table
-        details_title = Paragraph("Negotiation Details", styles['Heading1'])
-        story.append(details_title)
-        
-        details_data = [
-            ['Item', negotiation['item']],
-            ['Buyer Maximum Price', f"${negotiation['buyer_max']:.2f}"],
-            ['Seller Minimum Price', f"${negotiation['seller_min']:.2f}"],
-            ['Final Status', negotiation['status'].title()],
-            ['Final Price', f"${negotiation.get('final_price', 0):.2f}"],
-            ['Total Rounds', str(len(negotiation['rounds']))]
-        ]
-        
-        details_table = Table(details_data, colWidths=[2*inch, 3*inch])
-        details_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        story.append(details_table)
-        story.append(Spacer(1, 20))
-        
-        # Round by Round Analysis
-        rounds_title = Paragraph("Round-by-Round Breakdown", styles['Heading1'])
-        story.append(rounds_title)
-        
-        for round_data in negotiation['rounds']:
-            round_text = f"<b>Round {round_data.get('round', 'N/A')} - {round_data['agent'].title()}:</b><br/>"
-            round_text += f"Price: ${round_data['price']:.2f}<br/>"
-            round_text += f"Message: {round_data['message']}"
-            
-            round_para = Paragraph(round_text, styles['Normal'])
-            story.append(round_para)
-            story.append(Spacer(1, 10))
-        
-        story.append(Spacer(1, 20))
-        
-        # Strategic Analysis
-        analysis_title = Paragraph("Strategic Analysis", styles['Heading1'])
-        story.append(analysis_title)
-        analysis_text = Paragraph(negotiation.get('analysis', 'No analysis available'), styles['Normal'])
-        story.append(analysis_text)
-        
-        doc.build(story)
-        buffer.seek(0)
-        
-        response = make_response(buffer.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=negotiation_report_{negotiation["item"].replace(" ", "_")}.pdf'
-        
-        return response
+        negotiation = parse_posted_negotiation(request.json or {}, ('item', 'buyer_max', 'seller_min', 'status', 'rounds'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return pdf_response(get_services().reports.render(negotiation), report_filename(negotiation))
     except Exception as e:
         print(f"PDF generation error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@routes.route('/reports/stats')
+def report_stats():
+    return jsonify(get_services().reports.stats())
+
+def pdf_response(pdf, filename):
+    response = make_response(pdf)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
 if __name__ == '__main__':
+    try:
+        app = create_app()
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        exit(1)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""ASGI entry point.
+
+    uvicorn asgi:application --port 5000
+
+Automatic negotiations (`POST /start_auto_negotiation` and its `/stream`
+variant) run natively on the server's event loop: a negotiation waiting on
+the model is a suspended coroutine rather than a blocked thread, so one
+process keeps hundreds in flight. Every other route is served by the Flask
+app through a small WSGI bridge on a thread pool.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import app as negotiation_app
+import metrics
+from aio import runner
+
+class NegotiationASGI:
+    def __init__(self, config=None, bridge_workers=None):
+        self.config = config
+        self.flask_app = None
+        self.services = None
+        self.bridge = ThreadPoolExecutor(
+            max_workers=bridge_workers or int(os.getenv('ASGI_BRIDGE_WORKERS', '32')),
+            thread_name_prefix='wsgi'
+        )
+        self.routes = {
+            ('POST', '/start_auto_negotiation'): self.start_auto_negotiation,
+            ('POST', '/start_auto_negotiation/stream'): self.start_auto_negotiation_stream
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self.startup()
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            await self.wsgi(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = await handler(scope, receive, send)
+        metrics.http_seconds.observe(time.perf_counter() - started, endpoint=scope['path'], method=scope['method'], status=status)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    self.startup()
+                except RuntimeError as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.bridge.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def startup(self):
+        if self.flask_app is None:
+            # Flask routes running on the bridge threads hand their coroutines to this loop too
+            runner.attach(asyncio.get_running_loop())
+            self.flask_app = negotiation_app.create_app(self.config)
+            self.services = self.flask_app.extensions['negotiation']
+
+    async def start_auto_negotiation(self, scope, receive, send):
+        data = await read_json(receive)
+        try:
+            with self.flask_app.app_context():
+                item, buyer_max, seller_min, render_mode = negotiation_app.parse_negotiation_request(data)
+                report_mode = negotiation_app.parse_report_mode(data)
+                deadline = negotiation_app.parse_deadline(data)
+        except ValueError as e:
+            return await send_json(send, 400, {'error': str(e)})
+        except Exception as e:
+            return await send_json(send, 500, {'error': str(e)})
+        try:
+            negotiation = await negotiation_app.run_automatic_negotiation_async(
+                self.services, item, buyer_max, seller_min, render_mode, bool(data.get('offline', False)), report_mode, deadline)
+        except Exception as e:
+            print(f"Error starting auto negotiation: {e}")
+            return await send_json(send, 500, {'error': str(e)})
+        return await send_json(send, 200, negotiation)
+
+    async def start_auto_negotiation_stream(self, scope, receive, send):
+        """Server-Sent Events, as from the Flask route; stops work when the client goes away"""
+        data = await read_json(receive)
+        try:
+            with self.flask_app.app_context():
+                item, buyer_max, seller_min, render_mode = negotiation_app.parse_negotiation_request(data)
+                report_mode = negotiation_app.parse_report_mode(data)
+                deadline = negotiation_app.parse_deadline(data)
+        except ValueError as e:
+            return await send_json(send, 400, {'error': str(e)})
+        except Exception as e:
+            return await send_json(send, 500, {'error': str(e)})
+        stream_tokens = bool(data.get('stream_tokens', self.flask_app.config['STREAM_TOKENS']))
+        offline = bool(data.get('offline', False))
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ]})
+
+        async def stream():
+            try:
+                async for event, payload in negotiation_app.iter_automatic_negotiation_async(
+                        self.services, item, buyer_max, seller_min, render_mode, offline, stream_tokens, report_mode, deadline):
+                    await send_body(send, negotiation_app.format_sse(event, payload))
+            except Exception as e:
+                print(f"Error streaming auto negotiation: {e}")
+                await send_body(send, negotiation_app.format_sse('error', {'error': str(e)}))
+
+        streaming = asyncio.create_task(stream())
+        disconnected = asyncio.create_task(wait_for_disconnect(receive))
+        await asyncio.wait({streaming, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if not streaming.done():
+            streaming.cancel()
+            return 499
+        disconnected.cancel()
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        return 200
+
+    async def wsgi(self, scope, receive, send):
+        """Serve the request with the Flask app on a bridge thread"""
+        environ = wsgi_environ(scope, await read_body(receive))
+        loop = asyncio.get_running_loop()
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        body = await loop.run_in_executor(self.bridge, self.flask_app, environ, start_response)
+        chunks = iter(body)
+        done = object()
+        try:
+            await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+            # Streamed Flask responses (SSE) produce their chunks on the bridge thread as they come
+            while True:
+                chunk = await loop.run_in_executor(self.bridge, next, chunks, done)
+                if chunk is done:
+                    break
+                if chunk:
+                    await send_body(send, chunk)
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(body, 'close'):
+                await loop.run_in_executor(self.bridge, body.close)
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return body
+
+async def read_json(receive):
+    body = await read_body(receive)
+    try:
+        return json.loads(body) if body else {}
+    except ValueError:
+        return {}
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def send_body(send, text):
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8') if isinstance(text, str) else text, 'more_body': True})
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('latin-1'))]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+application = NegotiationASGI()
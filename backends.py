@@ -0,0 +1,308 @@
+"""Model backends.
+
+Everything that talks to a model expects one method,
+`generate_content(prompt, stream=False)`, returning a response with `.text`,
+or with stream=True an iterable of chunks that each have `.text` (the shape
+of google.generativeai's GenerativeModel). The asyncio code also uses
+`generate_content_async(prompt, stream=False)`, which is awaited for the
+response, or for an async iterable of chunks; generate_async falls back to
+a worker thread for models that only have the sync method. The backends
+here provide both:
+
+- GeminiBackend: the real model
+- StubBackend: deterministic local replies with simulated latency and errors,
+  for benchmarks and load tests that must not touch the network
+- CassetteBackend: records another backend's replies to a JSONL file and
+  replays them later, for reproducible runs against real model output
+
+create_backend picks one from the MODEL_BACKEND settings.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+BACKENDS = ('gemini', 'stub', 'cassette')
+
+class BackendError(Exception):
+    """A backend can't be created, e.g. because its configuration is missing"""
+
+class StubError(Exception):
+    """A failure injected by StubBackend"""
+
+class CassetteMiss(Exception):
+    """Replay found no recording for a prompt"""
+
+class TextResponse:
+    """A response (or streamed chunk) made from plain text"""
+    def __init__(self, text):
+        self.text = text
+
+    def __iter__(self):
+        return iter([self])
+
+    def __aiter__(self):
+        return async_chunks([self])
+
+async def async_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+async def generate_async(model, prompt, **kwargs):
+    """Await `model`'s reply, on a worker thread if it has no async method"""
+    if hasattr(model, 'generate_content_async'):
+        return await model.generate_content_async(prompt, **kwargs)
+    response = await asyncio.to_thread(model.generate_content, prompt, **kwargs)
+    if kwargs.get('stream'):
+        return thread_chunks(iter(response))
+    return response
+
+async def thread_chunks(chunks):
+    """Pull a blocking chunk iterator one chunk at a time on a worker thread"""
+    done = object()
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+class GeminiBackend:
+    """The Gemini API. google.generativeai is slow to import, so the client is
+    created on the first call rather than at startup."""
+    def __init__(self, api_key, model_name='gemini-2.0-flash'):
+        if not api_key:
+            raise BackendError("GEMINI_API_KEY is not set")
+        self.api_key = api_key
+        self.model_name = model_name
+        self.model = None
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        return self.client().generate_content(prompt, **kwargs)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return await self.client().generate_content_async(prompt, **kwargs)
+
+    def client(self):
+        if self.model is None:
+            with self.lock:
+                if self.model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self.model = genai.GenerativeModel(self.model_name)
+        return self.model
+
+# Prompt shapes the agents and the batch renderer use
+TRAJECTORY_PATTERN = re.compile(r'^Round (\d+) \| (\w+) \| [^|\n]+ \| \$([\d.]+)$', re.MULTILINE)
+EXAMPLE_PRICE_PATTERN = re.compile(r'"price": ([\d.]+)\}')
+ROLE_PATTERN = re.compile(r'You are an? (?:professional )?(buyer|seller|mediator)')
+
+STUB_PHRASES = {
+    'buyer': ["I'd like to settle this at ${price:.2f}.", "Would ${price:.2f} work for you?", "My offer is ${price:.2f}."],
+    'seller': ["I can do ${price:.2f}.", "The best I can offer is ${price:.2f}.", "Let's say ${price:.2f}."],
+    'mediator': ["Both sides might consider ${price:.2f}.", "A fair middle ground looks like ${price:.2f}.", "How about meeting at ${price:.2f}?"]
+}
+
+class StubBackend:
+    """Answers every prompt locally with a reply of the shape the caller asked for.
+
+    Agent prompts get a JSON message quoting the planned price, batch render
+    prompts get the JSON array they ask for, anything else (summaries,
+    analyses) gets a short paragraph. Each call sleeps for a latency drawn
+    from a log-normal distribution around `latency` seconds (`latency_sigma`
+    0 makes it fixed) and fails with probability `error_rate`.
+
+    Replies, latencies and failures are drawn from a hash of the seed, the
+    prompt and how many times that prompt has been seen, so a run is
+    reproducible however its calls interleave across threads.
+    """
+    def __init__(self, latency=0.2, latency_sigma=0.0, error_rate=0.0, seed=0, chunk_size=24):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.seen = {}
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        rng = self.call_rng(prompt)
+        delay = self.draw_latency(rng)
+        fails = rng.random() < self.error_rate
+        text = self.reply(prompt, rng)
+        if stream:
+            return self.stream(text, delay, fails)
+        time.sleep(delay)
+        if fails:
+            raise StubError("Simulated model error")
+        return TextResponse(text)
+
+    def stream(self, text, delay, fails):
+        chunks = self.split(text)
+        for chunk in chunks:
+            time.sleep(delay / len(chunks))
+            if fails:
+                raise StubError("Simulated model error")
+            yield TextResponse(chunk)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        rng = self.call_rng(prompt)
+        delay = self.draw_latency(rng)
+        fails = rng.random() < self.error_rate
+        text = self.reply(prompt, rng)
+        if stream:
+            return self.stream_async(text, delay, fails)
+        await asyncio.sleep(delay)
+        if fails:
+            raise StubError("Simulated model error")
+        return TextResponse(text)
+
+    async def stream_async(self, text, delay, fails):
+        chunks = self.split(text)
+        for chunk in chunks:
+            await asyncio.sleep(delay / len(chunks))
+            if fails:
+                raise StubError("Simulated model error")
+            yield TextResponse(chunk)
+
+    def split(self, text):
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or ['']
+
+    def call_rng(self, prompt):
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        with self.lock:
+            count = self.seen.get(digest, 0)
+            self.seen[digest] = count + 1
+        return random.Random(f"{self.seed}:{digest}:{count}")
+
+    def draw_latency(self, rng):
+        if not self.latency:
+            return 0.0
+        if not self.latency_sigma:
+            return self.latency
+        return self.latency * math.exp(rng.gauss(0, self.latency_sigma))
+
+    def reply(self, prompt, rng):
+        trajectory = TRAJECTORY_PATTERN.findall(prompt)
+        if trajectory:
+            return json.dumps([
+                {'round': int(number), 'agent': agent, 'message': stub_message(agent, float(price), rng)}
+                for number, agent, price in trajectory
+            ])
+        price = EXAMPLE_PRICE_PATTERN.search(prompt)
+        if price:
+            role = ROLE_PATTERN.search(prompt)
+            agent = role.group(1) if role else 'buyer'
+            return json.dumps({'message': stub_message(agent, float(price.group(1)), rng), 'price': float(price.group(1))})
+        return ("This is a stub response generated locally for load testing. "
+                f"It stands in for model commentary (reference {rng.randrange(10 ** 6):06d}).")
+
+def stub_message(agent, price, rng):
+    return rng.choice(STUB_PHRASES.get(agent, STUB_PHRASES['buyer'])).format(price=price)
+
+class CassetteBackend:
+    """Record/replay of model replies, keyed by prompt, stored as JSONL.
+
+    mode 'replay' only plays back recordings (a miss raises CassetteMiss, so
+    agents fall back to their templates), 'record' always calls `model` and
+    saves what it says, and 'auto' replays what it has and records the rest.
+    """
+    def __init__(self, path, model=None, mode='replay'):
+        if mode not in ('replay', 'record', 'auto'):
+            raise BackendError(f"Unknown cassette mode '{mode}', expected replay, record or auto")
+        if mode != 'replay' and model is None:
+            raise BackendError(f"Cassette mode '{mode}' needs a model to record from")
+        self.path = path
+        self.model = model
+        self.mode = mode
+        self.recordings = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recordings[entry['key']] = entry['text']
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        key, recorded = self.lookup(prompt)
+        if recorded is not None:
+            return recorded
+        if stream:
+            return self.record_stream(key, self.model.generate_content(prompt, stream=True, **kwargs))
+        response = self.model.generate_content(prompt, **kwargs)
+        self.record(key, response.text)
+        return response
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        key, recorded = self.lookup(prompt)
+        if recorded is not None:
+            return recorded
+        if stream:
+            return self.record_stream_async(key, await generate_async(self.model, prompt, stream=True, **kwargs))
+        response = await generate_async(self.model, prompt, **kwargs)
+        self.record(key, response.text)
+        return response
+
+    def lookup(self, prompt):
+        """The prompt's key, and its recorded reply unless this call should record"""
+        key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        if self.mode != 'record':
+            text = self.recordings.get(key)
+            if text is not None:
+                return key, TextResponse(text)
+            if self.mode == 'replay':
+                raise CassetteMiss(f"No recording for prompt {key[:12]}")
+        return key, None
+
+    def record_stream(self, key, chunks):
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk.text)
+            yield chunk
+        self.record(key, ''.join(parts))
+
+    async def record_stream_async(self, key, chunks):
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk.text)
+            yield chunk
+        self.record(key, ''.join(parts))
+
+    def record(self, key, text):
+        with self.lock:
+            self.recordings[key] = text
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'text': text}) + "\n")
+
+    def __len__(self):
+        return len(self.recordings)
+
+def create_backend(name, env=None):
+    """Build the backend called `name`, reading its settings from env (default os.environ)"""
+    env = os.environ if env is None else env
+    if name == 'gemini':
+        return GeminiBackend(env.get('GEMINI_API_KEY'), env.get('GEMINI_MODEL', 'gemini-2.0-flash'))
+    if name == 'stub':
+        return StubBackend(
+            latency=float(env.get('STUB_LATENCY', '0.2')),
+            latency_sigma=float(env.get('STUB_LATENCY_SIGMA', '0')),
+            error_rate=float(env.get('STUB_ERROR_RATE', '0')),
+            seed=int(env.get('STUB_SEED', '0'))
+        )
+    if name == 'cassette':
+        path = env.get('CASSETTE_PATH')
+        if not path:
+            raise BackendError("CASSETTE_PATH is not set")
+        mode = env.get('CASSETTE_MODE', 'replay')
+        source = env.get('CASSETTE_SOURCE', 'gemini')
+        if source == 'cassette':
+            raise BackendError("CASSETTE_SOURCE can't be another cassette")
+        model = create_backend(source, env) if mode != 'replay' else None
+        return CassetteBackend(path, model, mode)
+    raise BackendError(f"Unknown model backend '{name}', expected one of: {', '.join(BACKENDS)}")
@@ -0,0 +1,88 @@
+"""Backfill the rounds table from old conversation blobs.
+
+Negotiations saved before the rounds table existed only have a flattened
+`conversation` string. This parses each one back into rounds, in lines of
+either form the app has written:
+
+    Round 3 - Seller: I can come down to $950.00.
+    Seller: I can come down to $950.00.
+
+A line that doesn't start with a known agent continues the previous message.
+The price is only recorded when a message quotes exactly one dollar amount;
+otherwise it is left NULL rather than guessed.
+
+    python backfill_rounds.py negotiations.db
+    python backfill_rounds.py negotiations.db --drop-blobs
+"""
+import argparse
+import re
+import sys
+from database import get_pool, init_db, insert_rounds
+
+LINE_PATTERN = re.compile(r'^(?:Round (\d+) - )?(Buyer|Seller|Mediator): ?(.*)$')
+PRICE_PATTERN = re.compile(r'\$\s?(\d[\d,]*(?:\.\d+)?)')
+
+def parse_conversation(text):
+    """Split a conversation blob back into round dicts"""
+    rounds = []
+    for line in text.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            number, agent, message = match.groups()
+            rounds.append({
+                'round': int(number) if number else len(rounds) + 1,
+                'agent': agent.lower(),
+                'message': message
+            })
+        elif rounds:
+            rounds[-1]['message'] += "\n" + line
+    for r in rounds:
+        r['price'] = quoted_price(r['message'])
+    return rounds
+
+def quoted_price(message):
+    prices = {float(p.replace(',', '')) for p in PRICE_PATTERN.findall(message)}
+    return prices.pop() if len(prices) == 1 else None
+
+def backfill(db_path, batch_size=500, drop_blobs=False):
+    """Parse every blob that has no rounds yet; returns (negotiations, rounds) written.
+
+    Works in batches of `batch_size` negotiations, one transaction each, so
+    the app can keep writing while a large database is backfilled.
+    """
+    pool = get_pool(db_path)
+    negotiations = rounds_written = 0
+    last_id = 0
+    while True:
+        with pool.connection('backfill_rounds') as conn:
+            rows = conn.execute('''SELECT id, conversation FROM negotiations
+                                   WHERE id > ? AND conversation IS NOT NULL
+                                   AND NOT EXISTS (SELECT 1 FROM rounds WHERE negotiation_id = negotiations.id)
+                                   ORDER BY id LIMIT ?''', (last_id, batch_size)).fetchall()
+            for negotiation_id, conversation in rows:
+                rounds = parse_conversation(conversation)
+                insert_rounds(conn, negotiation_id, rounds)
+                if drop_blobs and rounds:
+                    conn.execute('UPDATE negotiations SET conversation = NULL WHERE id = ?', (negotiation_id,))
+                rounds_written += len(rounds)
+            negotiations += len(rows)
+        if len(rows) < batch_size:
+            return negotiations, rounds_written
+        last_id = rows[-1][0]
+        print(f"Backfilled {negotiations} negotiations...", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse saved conversation blobs into the rounds table")
+    parser.add_argument('database', help="SQLite database to backfill")
+    parser.add_argument('--batch-size', type=int, default=500, help="negotiations per transaction")
+    parser.add_argument('--drop-blobs', action='store_true',
+                        help="clear each conversation blob once its rounds are written")
+    args = parser.parse_args(argv)
+
+    init_db(args.database)
+    negotiations, rounds = backfill(args.database, args.batch_size, args.drop_blobs)
+    print(f"Backfilled {rounds} rounds from {negotiations} negotiations")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
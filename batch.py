@@ -0,0 +1,189 @@
+"""Batch negotiations from JSONL.
+
+Each input line is a JSON object with `item`, `buyer_max` and `seller_min`.
+Scenarios run on a worker pool and one JSON result per line is written as
+soon as each negotiation finishes (results carry their input `line` number,
+since they arrive out of order). Agreed negotiations are saved in bulk.
+
+    python batch.py scenarios.jsonl --workers 8 --llm-concurrency 4 --output results.jsonl
+    python batch.py scenarios.jsonl --offline --db negotiations.db
+    python batch.py scenarios.jsonl --backend cassette --seed 7   # replay a run recorded with --seed 7
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from aio import runner
+from database import init_db, save_negotiations
+from engine import RENDER_MODES, run_negotiation, scenario_rng
+from backends import BACKENDS, BackendError, create_backend, generate_async
+
+class ConcurrencyLimitedModel:
+    """Caps how many model calls are in flight at once, across all negotiations.
+
+    Rounds render on aio.runner's event loop (see engine.py), so the cap is
+    an asyncio semaphore there; sync calls are run on the loop as well and
+    share it. The semaphore is made on first use in each loop, so a model
+    used from another loop (a test, the ASGI server's) gets its own cap
+    rather than one bound to a foreign loop.
+    """
+    def __init__(self, model, limit):
+        self.model = model
+        self.limit = limit
+        self.loops = weakref.WeakKeyDictionary()  # event loop -> its semaphore
+        self.lock = threading.Lock()
+
+    def slots(self):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            semaphore = self.loops.get(loop)
+            if semaphore is None:
+                semaphore = self.loops[loop] = asyncio.Semaphore(self.limit)
+            return semaphore
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return runner.iterate(self.stream_async(prompt, **kwargs))
+        return runner.run(self.generate_content_async(prompt, **kwargs))
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self.stream_async(prompt, **kwargs)
+        async with self.slots():
+            return await generate_async(self.model, prompt, **kwargs)
+
+    async def stream_async(self, prompt, **kwargs):
+        async with self.slots():
+            async for chunk in await generate_async(self.model, prompt, stream=True, **kwargs):
+                yield chunk
+
+def parse_scenario(line):
+    """Read one JSONL scenario, raising ValueError with a message for the result line"""
+    try:
+        data = json.loads(line)
+        item = str(data['item'])
+        buyer_max = float(data['buyer_max'])
+        seller_min = float(data['seller_min'])
+    except KeyError as e:
+        raise ValueError(f"Missing field {e}")
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid scenario: {e}")
+
+    if seller_min > buyer_max:
+        raise ValueError(f'Negotiation impossible: Seller minimum (${seller_min:.2f}) exceeds buyer maximum (${buyer_max:.2f})')
+    return item, buyer_max, seller_min
+
+def run_batch(lines, model, workers=4, render_mode='parallel', render_workers=4, db_path=None, save_every=100, seed=None):
+    """Negotiate every scenario in `lines`, yielding a result dict as each one finishes.
+
+    At most `workers` negotiations run at once. Agreed negotiations are written
+    to `db_path` with one bulk insert per `save_every` deals. With a `seed`,
+    each scenario's agents draw the same prices on every run.
+    """
+    agreed = []
+
+    def negotiate(line_number, item, buyer_max, seller_min):
+        try:
+            negotiation = run_negotiation(item, buyer_max, seller_min, model, render_mode, render_workers,
+                                          rng=scenario_rng(seed, item, buyer_max, seller_min))
+        except Exception as e:
+            print(f"Error negotiating batch line {line_number}: {e}", file=sys.stderr)
+            return {'line': line_number, 'item': item, 'error': str(e)}
+        return dict(negotiation, line=line_number)
+
+    def finish(futures):
+        for future in futures:
+            result = future.result()
+            if result.get('status') == 'agreed':
+                agreed.append(result)
+                if db_path and len(agreed) >= save_every:
+                    flush()
+            yield result
+
+    def flush():
+        if db_path and agreed:
+            save_negotiations(db_path, [
+                (n['item'], n['buyer_max'], n['seller_min'], n['final_price'], n['rounds'])
+                for n in agreed
+            ])
+        agreed.clear()
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        in_flight = set()
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                scenario = parse_scenario(line)
+            except ValueError as e:
+                yield {'line': line_number, 'error': str(e)}
+                continue
+
+            in_flight.add(pool.submit(negotiate, line_number, *scenario))
+            # Keep a bounded window of queued work so huge files stream through
+            if len(in_flight) >= workers * 4:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from finish(done)
+
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            yield from finish(done)
+    finally:
+        # Also runs when the consumer stops early (a client closing the
+        # stream): queued negotiations nobody will read are dropped, and
+        # deals already reported are never left unsaved
+        pool.shutdown(wait=True, cancel_futures=True)
+        flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of negotiations and stream JSONL results")
+    parser.add_argument('input', help="JSONL file of {item, buyer_max, seller_min} scenarios, or - for stdin")
+    parser.add_argument('--output', help="write results here instead of stdout")
+    parser.add_argument('--workers', type=int, default=8, help="negotiations run at once")
+    parser.add_argument('--llm-concurrency', type=int, default=4, help="Gemini calls in flight at once")
+    parser.add_argument('--render-mode', choices=RENDER_MODES, default='batch')
+    parser.add_argument('--db', help="save agreed negotiations to this SQLite database")
+    parser.add_argument('--offline', action='store_true', help="use template messages, never call Gemini")
+    parser.add_argument('--backend', choices=BACKENDS, default=os.getenv('MODEL_BACKEND', 'gemini'),
+                        help="model backend (default: MODEL_BACKEND or gemini)")
+    parser.add_argument('--seed', type=int, default=int(os.environ['MODEL_SEED']) if os.getenv('MODEL_SEED') else None,
+                        help="make the agents' prices, and so the prompts, repeatable (default: MODEL_SEED)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    model = None
+    if not args.offline:
+        try:
+            backend = create_backend(args.backend)
+        except BackendError as e:
+            parser.error(f"{e} (use --offline to run without a model)")
+        model = ConcurrencyLimitedModel(backend, args.llm_concurrency)
+
+    if args.db:
+        init_db(args.db)
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    counts = {'agreed': 0, 'failed': 0, 'error': 0}
+    try:
+        for result in run_batch(source, model, args.workers, args.render_mode, db_path=args.db, seed=args.seed):
+            counts['error' if 'error' in result else result['status']] += 1
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"Agreed: {counts['agreed']}, failed: {counts['failed']}, errors: {counts['error']}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Compare the pooled WAL data layer with the original connect-per-call code.
+
+Several writer threads insert negotiations while reader threads load the
+history page, the way concurrent Flask workers would. Reports write
+throughput and history read latency percentiles for both implementations.
+
+    python benchmarks/bench_database.py --writers 4 --readers 4 --seconds 5
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+from engine import conversation_text
+
+class LegacyDatabase:
+    """The data layer as it was: a fresh rollback-journal connection per call, no index"""
+    def init_db(self, db_path):
+        conn = sqlite3.connect(db_path)
+        conn.execute('''CREATE TABLE IF NOT EXISTS negotiations
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT, item TEXT, buyer_max REAL,
+                         seller_min REAL, final_price REAL, conversation TEXT, timestamp DATETIME)''')
+        conn.commit()
+        conn.close()
+
+    def save_negotiation(self, db_path, item, buyer_max, seller_min, final_price, rounds):
+        conversation = conversation_text(rounds)
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute('''INSERT INTO negotiations
+                        (item, buyer_max, seller_min, final_price, conversation, timestamp)
+                        VALUES (?, ?, ?, ?, ?, ?)''',
+                     (item, buyer_max, seller_min, final_price, conversation, datetime.now().isoformat()))
+        conn.commit()
+        conn.close()
+
+    def save_negotiations(self, db_path, negotiations):
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.executemany('''INSERT INTO negotiations
+                            (item, buyer_max, seller_min, final_price, conversation, timestamp)
+                            VALUES (?, ?, ?, ?, ?, ?)''',
+                         [(item, buyer_max, seller_min, final_price, conversation_text(rounds), datetime.now().isoformat())
+                          for item, buyer_max, seller_min, final_price, rounds in negotiations])
+        conn.commit()
+        conn.close()
+
+    def get_negotiation_history(self, db_path):
+        conn = sqlite3.connect(db_path, timeout=30)
+        rows = conn.execute('''SELECT id, item, buyer_max, seller_min, final_price, timestamp
+                               FROM negotiations ORDER BY timestamp DESC LIMIT 10''').fetchall()
+        conn.close()
+        return rows
+
+ROUNDS = [{'round': i, 'agent': 'buyer', 'price': 900.0 + i, 'message': f"I could do ${900 + i:.2f} for this item."}
+          for i in range(1, 9)]
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def run(layer, db_path, writers, readers, seconds, preload):
+    layer.init_db(db_path)
+    if preload:
+        layer.save_negotiations(db_path, [('preload', 1000.0, 800.0, 900.0, ROUNDS)] * preload)
+    stop = threading.Event()
+    writes = [0] * writers
+    latencies = [[] for _ in range(readers)]
+
+    def write(slot):
+        while not stop.is_set():
+            layer.save_negotiation(db_path, 'bench item', 1000.0, 800.0, 900.0, ROUNDS)
+            writes[slot] += 1
+
+    def read(slot):
+        while not stop.is_set():
+            started = time.perf_counter()
+            layer.get_negotiation_history(db_path)
+            latencies[slot].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    samples = [s for slot in latencies for s in slot]
+    return {
+        'writes_per_second': sum(writes) / seconds,
+        'reads_per_second': len(samples) / seconds,
+        'read_p50_ms': percentile(samples, 50) * 1000,
+        'read_p99_ms': percentile(samples, 99) * 1000
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the negotiation data layer")
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--preload', type=int, default=50000, help="rows inserted before measuring")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            'legacy': run(LegacyDatabase(), os.path.join(tmp, 'legacy.db'), args.writers, args.readers, args.seconds, args.preload),
+            'pooled': run(database, os.path.join(tmp, 'pooled.db'), args.writers, args.readers, args.seconds, args.preload)
+        }
+        database.close_pools()
+
+    print(f"{'layer':<8} {'writes/s':>10} {'reads/s':>10} {'read p50':>10} {'read p99':>10}")
+    for name, r in results.items():
+        print(f"{name:<8} {r['writes_per_second']:>10.0f} {r['reads_per_second']:>10.0f} "
+              f"{r['read_p50_ms']:>8.2f}ms {r['read_p99_ms']:>8.2f}ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""HTTP load test for the Flask app.
+
+Starts the app with the stub model backend (or targets --url), then runs N
+virtual users for --duration seconds. Each user repeatedly loads the index
+page, runs an automatic negotiation, downloads its PDF report and steps a
+negotiation through /start_negotiation and /continue_negotiation.
+Reports throughput, p50/p95/p99 latency and error rate per endpoint.
+
+Give several user counts to find where one worker process saturates:
+throughput stops growing and latency climbs as requests start to queue.
+
+    python benchmarks/loadtest.py --users 1,4,16,64 --duration 20 --stub-latency 0.4
+    python benchmarks/loadtest.py --url http://localhost:5000 --users 8
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_database import percentile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SCENARIO = {'item': 'used car', 'buyer_max': 1000.0, 'seller_min': 800.0}
+
+class Recorder:
+    """Latency samples and errors per endpoint, shared by all virtual users"""
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'requests_per_s': len(samples) / elapsed,
+                'error_rate': self.errors.get(endpoint, 0) / len(samples),
+                'p50_ms': percentile(samples, 50) * 1000,
+                'p95_ms': percentile(samples, 95) * 1000,
+                'p99_ms': percentile(samples, 99) * 1000
+            }
+        return endpoints
+
+def request(recorder, base_url, endpoint, path, body=None, timeout=120):
+    """Send one request and record it; returns the decoded JSON body (or raw bytes), None on failure"""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data,
+                                 headers={'Content-Type': 'application/json'} if data else {})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            payload = response.read()
+            ok = True
+    except (urllib.error.URLError, OSError) as e:
+        payload = None
+        ok = False
+        if not isinstance(e, urllib.error.HTTPError):
+            print(f"{endpoint}: {e}", file=sys.stderr)
+    recorder.record(endpoint, time.perf_counter() - started, ok)
+    if not ok:
+        return None
+    if response.headers.get('Content-Type', '').startswith('application/json'):
+        return json.loads(payload)
+    return payload
+
+def virtual_user(recorder, base_url, stop, steps):
+    while not stop.is_set():
+        request(recorder, base_url, 'GET /', '/')
+        negotiation = request(recorder, base_url, 'POST /start_auto_negotiation', '/start_auto_negotiation', SCENARIO)
+        if negotiation:
+            request(recorder, base_url, 'POST /generate_pdf_report', '/generate_pdf_report', {'negotiation': negotiation})
+
+        session = request(recorder, base_url, 'POST /start_negotiation', '/start_negotiation', SCENARIO)
+        if not session:
+            continue
+        for _ in range(steps):
+            if stop.is_set():
+                break
+            step = request(recorder, base_url, 'POST /continue_negotiation', '/continue_negotiation',
+                           {'session_id': session['session_id']})
+            if not step or step['status'] != 'ongoing':
+                break
+
+def run_stage(base_url, users, duration, steps):
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [threading.Thread(target=virtual_user, args=(recorder, base_url, stop, steps), daemon=True)
+               for _ in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    # In-flight requests finish after the stop, so count the real elapsed time
+    return recorder.summary(time.perf_counter() - started)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(port, stub_latency, stub_error_rate, extra_env):
+    """Run the app in a subprocess on the threaded development server"""
+    env = dict(os.environ, MODEL_BACKEND='stub', STUB_LATENCY=str(stub_latency),
+               STUB_ERROR_RATE=str(stub_error_rate), PYTHONPATH=os.path.abspath(ROOT))
+    env.update(extra_env)
+    workdir = tempfile.mkdtemp(prefix='negotiation-load-')
+    code = f"import app; app.create_app().run(host='127.0.0.1', port={port}, threaded=True)"
+    server = subprocess.Popen([sys.executable, '-c', code], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The app exited during startup")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("The app did not start listening within 30s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the negotiation app over HTTP")
+    parser.add_argument('--url', help="test a running server instead of starting one")
+    parser.add_argument('--users', default='1,4,16', help="comma-separated concurrent user counts, one stage each")
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds per stage")
+    parser.add_argument('--steps', type=int, default=5, help="continue_negotiation calls per session")
+    parser.add_argument('--stub-latency', type=float, default=0.2, help="seconds per stub model call")
+    parser.add_argument('--stub-error-rate', type=float, default=0.0)
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help="extra app setting for the started server, e.g. --env RENDER_MODE=batch")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    try:
+        user_counts = [int(n) for n in args.users.split(',')]
+        extra_env = dict(setting.split('=', 1) for setting in args.env)
+    except ValueError:
+        parser.error("--users takes numbers like 1,4,16 and --env takes NAME=VALUE")
+
+    server = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        port = free_port()
+        server = start_server(port, args.stub_latency, args.stub_error_rate, extra_env)
+        base_url = f'http://127.0.0.1:{port}'
+
+    stages = []
+    try:
+        for users in user_counts:
+            print(f"Running {users} virtual user(s) for {args.duration:.0f}s...", file=sys.stderr)
+            stages.append({'users': users, 'endpoints': run_stage(base_url, users, args.duration, args.steps)})
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    for stage in stages:
+        print(f"\n{stage['users']} user(s)")
+        print(f"{'endpoint':<32} {'reqs':>6} {'req/s':>8} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for endpoint, r in stage['endpoints'].items():
+            print(f"{endpoint:<32} {r['requests']:>6} {r['requests_per_s']:>8.2f} {r['error_rate']:>7.1%} "
+                  f"{r['p50_ms']:>7.0f}ms {r['p95_ms']:>7.0f}ms {r['p99_ms']:>7.0f}ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'stub_latency': args.stub_latency, 'duration': args.duration, 'stages': stages}, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
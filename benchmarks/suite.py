@@ -0,0 +1,274 @@
+"""Benchmarks for the negotiation hot paths, run against the local stub model.
+
+Writes a JSON baseline; --compare checks a new run against an older one and
+exits non-zero when a metric got worse by more than --threshold.
+
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --compare baseline.json
+    python benchmarks/suite.py --quick --only agents,pdf
+    python benchmarks/suite.py --only startup
+
+Metric names say which way is better: `_ms`/`_us` and `_calls` should go
+down, `_per_s` should go up.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from bench_database import percentile
+
+class CountingModel:
+    """Counts calls on their way to the wrapped model"""
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        return self.model.generate_content(prompt, **kwargs)
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def latency_stats(samples, scale=1000, unit='ms'):
+    return {
+        f'mean_{unit}': statistics.mean(samples) * scale,
+        f'p50_{unit}': percentile(samples, 50) * scale,
+        f'p95_{unit}': percentile(samples, 95) * scale
+    }
+
+def bench_negotiation(args):
+    """run_automatic_negotiation end to end, with a fixed-latency stub"""
+    os.environ.update(MODEL_BACKEND='stub', LLM_CACHE='0', STUB_LATENCY=str(args.stub_latency))
+    import app
+    from backends import StubBackend
+
+    services = app.create_app().extensions['negotiation']
+    results = {}
+    for render_mode in ('parallel', 'batch'):
+        model = CountingModel(StubBackend(latency=args.stub_latency))
+        services.model = services.agent_model = model
+        samples = timed(lambda: app.run_automatic_negotiation(services, 'used car', 1000.0, 800.0, render_mode), args.negotiations)
+        results[render_mode] = dict(latency_stats(samples), llm_calls=model.calls / args.negotiations)
+    return results
+
+def bench_agents(args):
+    """Agent planning overhead per round and model reply parsing, with no model latency"""
+    from agents import BuyerAgent, SellerAgent, MediatorAgent, render_turn
+    from backends import StubBackend
+    from engine import plan_negotiation
+
+    turns = 0
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        plan = plan_negotiation('used car', BuyerAgent(None, 1000.0), SellerAgent(None, 800.0), MediatorAgent(None))
+        turns += len(plan['turns'])
+    plan_seconds = time.perf_counter() - started
+
+    model = StubBackend(latency=0)
+    sample_plan = BuyerAgent(None, 1000.0).plan_initial_offer('used car')
+    render = timed(lambda: render_turn(model, sample_plan), args.iterations)
+    stream = timed(lambda: render_turn(model, sample_plan, on_token=lambda text: None), args.iterations)
+    return {
+        'plan_per_round_us': plan_seconds / turns * 1e6,
+        'rounds_planned_per_s': turns / plan_seconds,
+        'render_turn_us': statistics.mean(render) * 1e6,
+        'render_turn_streamed_us': statistics.mean(stream) * 1e6
+    }
+
+def bench_database(args):
+    """save_negotiation and get_negotiation_history as the table grows"""
+    import database
+
+    rounds = [{'round': i, 'agent': 'buyer' if i % 2 else 'seller', 'price': 800.0 + i, 'message': f"Offer of ${800 + i:.2f}."}
+              for i in range(1, 9)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        database.init_db(db_path)
+        size = 0
+        for target in args.table_sizes:
+            if target > size:
+                database.save_negotiations(db_path, [('filler', 1000.0, 800.0, 900.0, rounds)] * (target - size))
+                size = target
+            writes = timed(lambda: database.save_negotiation(db_path, 'used car', 1000.0, 800.0, 900.0, rounds), args.iterations // 10)
+            size += len(writes)
+            reads = timed(lambda: database.get_negotiation_history(db_path), args.iterations // 10)
+            results[f'rows_{target}'] = {
+                'saves_per_s': len(writes) / sum(writes),
+                'history_p50_ms': percentile(reads, 50) * 1000,
+                'history_p95_ms': percentile(reads, 95) * 1000
+            }
+        database.close_pools()
+    return results
+
+def bench_pdf(args):
+    """PDF report rendering time as the number of rounds grows"""
+    from reports import build_pdf
+
+    results = {}
+    for count in args.round_counts:
+        negotiation = {
+            'item': 'used car', 'buyer_max': 1000.0, 'seller_min': 800.0, 'status': 'agreed', 'final_price': 900.0,
+            'summary': 'A summary paragraph. ' * 20, 'analysis': 'An analysis paragraph. ' * 25,
+            'rounds': [{'round': i, 'agent': 'buyer' if i % 2 else 'seller', 'price': 800.0 + i,
+                        'message': f"I could do ${800 + i:.2f} given the condition and the market for similar items."}
+                       for i in range(1, count + 1)]
+        }
+        results[f'rounds_{count}'] = latency_stats(timed(lambda: build_pdf(negotiation), max(3, args.iterations // 100)))
+    return results
+
+# Runs in a fresh interpreter for each sample, so nothing is imported yet
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+flask_app.test_client().get('/')
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': served - created,
+    'heavy_modules': [name for name in ('reportlab', 'google.generativeai') if name in sys.modules]
+}))
+"""
+
+def bench_startup(args):
+    """Cold start: a new process importing the app, creating it and serving its first request"""
+    env = dict(os.environ, MODEL_BACKEND='gemini', GEMINI_API_KEY='startup-benchmark', OFFLINE_MODE='0',
+               PYTHONPATH=os.path.abspath(ROOT))
+    samples = {'process': [], 'import': [], 'create_app': [], 'first_request': []}
+    heavy = 0
+    for _ in range(args.startup_runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], env=env, capture_output=True, text=True, check=True).stdout
+        samples['process'].append(time.perf_counter() - started)
+        timings = json.loads(output.strip().splitlines()[-1])
+        for name in ('import', 'create_app', 'first_request'):
+            samples[name].append(timings[name])
+        heavy = max(heavy, len(timings['heavy_modules']))
+    results = {f'{name}_p50_ms': percentile(values, 50) * 1000 for name, values in samples.items()}
+    results['heavy_modules_loaded'] = heavy
+    return results
+
+BENCHMARKS = {
+    'negotiation': bench_negotiation,
+    'agents': bench_agents,
+    'database': bench_database,
+    'pdf': bench_pdf,
+    'startup': bench_startup
+}
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+def higher_is_better(metric):
+    return metric.endswith('_per_s')
+
+def compare(baseline, current, threshold):
+    """Return (metric, old, new, change) rows and the metrics that regressed"""
+    old, new = flatten(baseline['results']), flatten(current['results'])
+    rows, regressions = [], []
+    for metric in sorted(old.keys() & new.keys()):
+        if not old[metric]:
+            continue
+        change = (new[metric] - old[metric]) / old[metric]
+        worse = -change if higher_is_better(metric) else change
+        rows.append((metric, old[metric], new[metric], change))
+        if worse > threshold:
+            regressions.append(metric)
+    return rows, regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the negotiation hot paths against a stub model")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="allowed slowdown before a metric counts as a regression")
+    parser.add_argument('--only', help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--quick', action='store_true', help="smaller sizes for a fast smoke run")
+    parser.add_argument('--stub-latency', type=float, default=0.05, help="seconds per stub model call")
+    args = parser.parse_args(argv)
+
+    args.negotiations = 5 if args.quick else 20
+    args.iterations = 500 if args.quick else 5000
+    args.table_sizes = [0, 10000] if args.quick else [0, 10000, 100000]
+    args.round_counts = [6, 24] if args.quick else [6, 24, 96]
+    args.startup_runs = 3 if args.quick else 10
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    # The app writes its database to the working directory
+    os.chdir(tempfile.mkdtemp(prefix='negotiation-bench-'))
+    results = {}
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = BENCHMARKS[name](args)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'quick': args.quick,
+            'stub_latency': args.stub_latency
+        },
+        'results': results
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if not args.compare:
+        for metric, value in flatten(results).items():
+            print(f"{metric:<50} {value:>14.3f}")
+        return 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    rows, regressions = compare(baseline, report, args.threshold)
+    print(f"{'metric':<50} {'baseline':>12} {'current':>12} {'change':>8}")
+    for metric, old, new, change in rows:
+        flag = '  <-- regression' if metric in regressions else ''
+        print(f"{metric:<50} {old:>12.3f} {new:>12.3f} {change:>+8.1%}{flag}")
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
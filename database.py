@@ -1,52 +1,282 @@
 import sqlite3
+import queue
+import threading
+import metrics
+from contextlib import contextmanager
 from datetime import datetime
 
+POOL_SIZE = 8
+
+# Applied to every pooled connection. WAL lets readers run alongside a writer,
+# and synchronous=NORMAL is durable in WAL mode apart from the last commits
+# before a power loss.
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-8000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA foreign_keys=ON'
+)
+
+# Schema changes applied in order by init_db. PRAGMA user_version records how
+# many have run, so each one runs exactly once per database file.
+MIGRATIONS = [
+    # 1: one row per message instead of the flattened conversation blob.
+    # `position` orders messages; a mediator shares its round number with the
+    # response that follows it.
+    ('''CREATE TABLE rounds
+        (negotiation_id INTEGER NOT NULL REFERENCES negotiations (id) ON DELETE CASCADE,
+         position INTEGER NOT NULL,
+         round INTEGER,
+         agent TEXT,
+         price REAL,
+         message TEXT,
+         PRIMARY KEY (negotiation_id, position)) WITHOUT ROWID''',
+     'CREATE INDEX idx_rounds_agent_round ON rounds (agent, round)'),
+    # 2: the AI summary and analysis are kept with the record
+    ('ALTER TABLE negotiations ADD COLUMN summary TEXT',
+     'ALTER TABLE negotiations ADD COLUMN analysis TEXT'),
+    # 3: history is read newest first, a page at a time from a (timestamp, id) cursor
+    ('CREATE INDEX idx_negotiations_timestamp_id ON negotiations (timestamp, id)',
+     'DROP INDEX IF EXISTS idx_negotiations_timestamp'),
+]
+
+INSERT_NEGOTIATION = '''INSERT INTO negotiations
+                        (item, buyer_max, seller_min, final_price, summary, analysis, timestamp)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+INSERT_ROUND = '''INSERT INTO rounds
+                  (negotiation_id, position, round, agent, price, message)
+                  VALUES (?, ?, ?, ?, ?, ?)'''
+
+SELECT_ROUNDS = '''SELECT round, agent, price, message
+                   FROM rounds WHERE negotiation_id = ? ORDER BY position'''
+
+SELECT_HISTORY = '''SELECT id, item, buyer_max, seller_min, final_price, timestamp
+                    FROM negotiations {where} ORDER BY timestamp DESC, id DESC LIMIT ?'''
+
+# Changes whenever a negotiation is added; each half is a single index lookup
+SELECT_HISTORY_VERSION = '''SELECT (SELECT max(id) FROM negotiations),
+                                   (SELECT max(timestamp) FROM negotiations)'''
+
+SELECT_NEGOTIATION = '''SELECT id, item, buyer_max, seller_min, final_price, summary, analysis, timestamp
+                        FROM negotiations WHERE id = ?'''
+
+class ConnectionPool:
+    """A fixed-size pool of SQLite connections to one database file.
+
+    Connections are shared between threads (one at a time), so sqlite3's
+    per-connection statement cache keeps the queries above prepared.
+    """
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self, operation='query'):
+        """Borrow a connection; the block runs in a transaction committed on success.
+
+        The time taken, including any wait for a free connection, is recorded
+        under `operation` in the db_operation_seconds metric.
+        """
+        with metrics.db_seconds.time(operation=operation), self.slots:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self.connect()
+            try:
+                with conn:
+                    yield conn
+            except sqlite3.Error:
+                # Don't hand a connection in an unknown state to the next caller
+                conn.close()
+                raise
+            except BaseException:
+                self.idle.put(conn)
+                raise
+            else:
+                self.idle.put(conn)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=64)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Saves through this process, per database; in-process caches of the history
+# compare it to notice their own writes straight away
+_writes = {}
+
+def get_pool(db_path):
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(db_path, ConnectionPool(db_path))
+    return pool
+
+def close_pools():
+    """Close every idle pooled connection, e.g. at shutdown or between tests"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+def record_write(db_path):
+    with _pools_lock:
+        _writes[db_path] = _writes.get(db_path, 0) + 1
+
+def write_count(db_path):
+    return _writes.get(db_path, 0)
+
 def init_db(db_path):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS negotiations
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  item TEXT,
-                  buyer_max REAL,
-                  seller_min REAL,
-                  final_price REAL,
-                  conversation TEXT,
-                  timestamp DATETIME)''')
-    conn.commit()
-    conn.close()
-
-def save_negotiation(db_path, item, buyer_max, seller_min, final_price, conversation):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute('''INSERT INTO negotiations 
-                 (item, buyer_max, seller_min, final_price, conversation, timestamp)
-                 VALUES (?, ?, ?, ?, ?, ?)''',
-              (item, buyer_max, seller_min, final_price, conversation, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
-
-def get_negotiation_history(db_path):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute('''SELECT id, item, buyer_max, seller_min, final_price, timestamp 
-                 FROM negotiations ORDER BY timestamp DESC LIMIT 10''')
-    history = []
-    for row in c.fetchall():
+    with get_pool(db_path).connection('init_db') as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS negotiations
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         item TEXT,
+                         buyer_max REAL,
+                         seller_min REAL,
+                         final_price REAL,
+                         conversation TEXT,
+                         timestamp DATETIME)''')
+    migrate(db_path)
+
+def migrate(db_path):
+    """Apply any MIGRATIONS this database hasn't seen yet"""
+    with get_pool(db_path).connection('migrate') as conn:
+        # Take the write lock before reading the version so two processes
+        # starting at once can't both apply the same migration
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for statements in MIGRATIONS[version:]:
+            for statement in statements:
+                conn.execute(statement)
+        if version < len(MIGRATIONS):
+            conn.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
+            print(f"Migrated {db_path} to schema version {len(MIGRATIONS)}")
+
+def insert_negotiation(conn, item, buyer_max, seller_min, final_price, rounds, timestamp, summary=None, analysis=None):
+    negotiation_id = conn.execute(INSERT_NEGOTIATION,
+                                  (item, buyer_max, seller_min, final_price, summary, analysis, timestamp)).lastrowid
+    insert_rounds(conn, negotiation_id, rounds)
+    return negotiation_id
+
+def insert_rounds(conn, negotiation_id, rounds):
+    conn.executemany(INSERT_ROUND, [
+        (negotiation_id, position, r.get('round', position), r['agent'], r.get('price'), r['message'])
+        for position, r in enumerate(rounds, 1)
+    ])
+
+def save_negotiation(db_path, item, buyer_max, seller_min, final_price, rounds, summary=None, analysis=None):
+    """Save a negotiation and its rounds in one transaction, returning its id"""
+    with get_pool(db_path).connection('save_negotiation') as conn:
+        negotiation_id = insert_negotiation(conn, item, buyer_max, seller_min, final_price, rounds,
+                                            datetime.now().isoformat(), summary, analysis)
+    record_write(db_path)
+    return negotiation_id
+
+def save_negotiation_report(db_path, negotiation_id, summary, analysis):
+    """Attach a summary and analysis generated after the negotiation was saved"""
+    with get_pool(db_path).connection('save_negotiation_report') as conn:
+        conn.execute('UPDATE negotiations SET summary = ?, analysis = ? WHERE id = ?',
+                     (summary, analysis, negotiation_id))
+
+def save_negotiations(db_path, negotiations):
+    """Save many negotiations in one transaction.
+
+    Each entry is an (item, buyer_max, seller_min, final_price, rounds) tuple.
+    """
+    timestamp = datetime.now().isoformat()
+    with get_pool(db_path).connection('save_negotiations') as conn:
+        for n in negotiations:
+            insert_negotiation(conn, *n, timestamp)
+    record_write(db_path)
+
+def get_negotiation_rounds(db_path, negotiation_id):
+    """Return a saved negotiation's rounds in order"""
+    with get_pool(db_path).connection('get_negotiation_rounds') as conn:
+        rows = conn.execute(SELECT_ROUNDS, (negotiation_id,)).fetchall()
+    return [{'round': row[0], 'agent': row[1], 'price': row[2], 'message': row[3]} for row in rows]
+
+def get_negotiation(db_path, negotiation_id):
+    """Load a saved negotiation with its rounds, summary and analysis, or None"""
+    with get_pool(db_path).connection('get_negotiation') as conn:
+        row = conn.execute(SELECT_NEGOTIATION, (negotiation_id,)).fetchone()
+        if row is None:
+            return None
+        rounds = conn.execute(SELECT_ROUNDS, (negotiation_id,)).fetchall()
+    return {
+        'id': row[0],
+        'item': row[1],
+        'buyer_max': row[2],
+        'seller_min': row[3],
+        # Only agreed negotiations are saved
+        'status': 'agreed',
+        'final_price': row[4],
+        'summary': row[5],
+        'analysis': row[6],
+        'timestamp': row[7],
+        'rounds': [{'round': r[0], 'agent': r[1], 'price': r[2], 'message': r[3]} for r in rounds]
+    }
+
+def get_negotiation_history(db_path, limit=10):
+    history, _ = get_negotiation_page(db_path, limit)
+    for entry in history:
         # Convert timestamp string back to datetime object
-        timestamp_str = row[5]
+        timestamp_str = entry['timestamp']
         try:
-            timestamp = datetime.fromisoformat(timestamp_str) if timestamp_str else None
+            entry['timestamp'] = datetime.fromisoformat(timestamp_str) if timestamp_str else None
         except (ValueError, TypeError):
             # If conversion fails, keep as string
-            timestamp = timestamp_str
-        
-        history.append({
-            'id': row[0],
-            'item': row[1],
-            'buyer_max': row[2],
-            'seller_min': row[3],
-            'final_price': row[4],
-            'timestamp': timestamp
-        })
-    conn.close()
-    return history
\ No newline at end of file
+            pass
+    return history
+
+def get_negotiation_page(db_path, limit=20, before=None, item=None, min_price=None, max_price=None):
+    """One page of saved negotiations, newest first, and whether more follow.
+
+    `before` is the (timestamp, id) of the last entry on the previous page:
+    the page starts right after it, so it costs the same however deep it is
+    and doesn't shift when new negotiations arrive. `item` matches part of
+    the item name; min_price and max_price bound the final price.
+    """
+    clauses, params = [], []
+    if before is not None:
+        clauses.append('(timestamp, id) < (?, ?)')
+        params.extend(before)
+    if item:
+        clauses.append("item LIKE ? ESCAPE '\\'")
+        params.append('%' + item.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if min_price is not None:
+        clauses.append('final_price >= ?')
+        params.append(min_price)
+    if max_price is not None:
+        clauses.append('final_price <= ?')
+        params.append(max_price)
+    where = 'WHERE ' + ' AND '.join(clauses) if clauses else ''
+    with get_pool(db_path).connection('get_negotiation_page') as conn:
+        rows = conn.execute(SELECT_HISTORY.format(where=where), params + [limit + 1]).fetchall()
+    page = [{
+        'id': row[0],
+        'item': row[1],
+        'buyer_max': row[2],
+        'seller_min': row[3],
+        'final_price': row[4],
+        'timestamp': row[5]
+    } for row in rows[:limit]]
+    return page, len(rows) > limit
+
+def get_history_version(db_path):
+    """(newest id, newest timestamp) of the saved negotiations; changes with every save"""
+    with get_pool(db_path).connection('get_history_version') as conn:
+        return tuple(conn.execute(SELECT_HISTORY_VERSION).fetchone())
@@ -0,0 +1,121 @@
+"""Latency budgets for negotiation requests.
+
+A Deadline is created when a request arrives and passed down to every model
+call made for it: agent turns, batch rendering, summary and analysis. Before
+calling the model, code checks that the time left still covers a typical
+call (a running average of recent call times). When it doesn't, or a call
+overruns the deadline, the template text is used and the result is marked
+as degraded, so the request answers on time with plainer prose instead of
+waiting on a slow model.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the model answered"""
+    fallback_reason = 'deadline'
+
+class CallEstimate:
+    """Exponentially weighted average of recent model call times.
+
+    There is no estimate until a call has been timed (or one is given to
+    reset()), and calls are allowed meanwhile. The estimate halves for every
+    `half_life` seconds without a sample: only calls that run are timed, so
+    after a slow spell that priced the model out of every budget it has to
+    wear off on its own for calls to be tried again.
+    """
+    def __init__(self, initial=None, weight=0.2, half_life=30.0):
+        self.weight = weight
+        self.half_life = half_life
+        self.lock = threading.Lock()
+        self.reset(initial)
+
+    def reset(self, initial=None):
+        with self.lock:
+            self.value = initial
+            self.updated = time.monotonic()
+
+    @property
+    def seconds(self):
+        """The current estimate, or None before the first sample"""
+        with self.lock:
+            return self.decayed(time.monotonic())
+
+    def observe(self, seconds):
+        with self.lock:
+            now = time.monotonic()
+            current = self.decayed(now)
+            self.value = seconds if current is None else current + self.weight * (seconds - current)
+            self.updated = now
+
+    def decayed(self, now):
+        if self.value is None or not self.half_life:
+            return self.value
+        return self.value * 0.5 ** ((now - self.updated) / self.half_life)
+
+call_seconds = CallEstimate()
+
+# The call timed_call() is timing in this context, so a cache that answers it can say so
+current_call = contextvars.ContextVar('current_call', default=None)
+
+@contextmanager
+def timed_call():
+    """Time the model call in the block into call_seconds.
+
+    A call the deadline cut off is counted with the time it had run, a lower
+    bound on what it would have taken. A call the prompt cache answered (see
+    answered_from_cache) isn't counted: it says nothing about the model.
+    """
+    call = {'cached': False}
+    token = current_call.set(call)
+    started = time.perf_counter()
+    timed = False
+    try:
+        yield
+        timed = True
+    except DeadlineExceeded:
+        timed = True
+        raise
+    finally:
+        current_call.reset(token)
+        if timed and not call['cached']:
+            call_seconds.observe(time.perf_counter() - started)
+
+def answered_from_cache():
+    """Mark the call being timed, if any, as answered without the model"""
+    call = current_call.get()
+    if call is not None:
+        call['cached'] = True
+
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    @classmethod
+    def after(cls, seconds):
+        """A deadline `seconds` from now, or None (no limit) for 0 or None"""
+        return cls(seconds) if seconds else None
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def allows_call(self):
+        """Whether the time left covers a typical model call (any time will do before one has been timed)"""
+        estimate = call_seconds.seconds
+        if estimate is None:
+            return not self.expired()
+        return self.remaining() >= estimate
+
+    async def run_async(self, awaitable):
+        """Await `awaitable`, cancelling it with DeadlineExceeded once the deadline passes"""
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"No reply within the {self.seconds:g}s budget")
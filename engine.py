@@ -0,0 +1,456 @@
+from agents import BuyerAgent, SellerAgent, MediatorAgent, render_turn_async
+from aio import runner
+from backends import generate_async
+from deadline import DeadlineExceeded, timed_call
+import asyncio
+import json
+import metrics
+import random
+import re
+
+MIN_ROUNDS = 6
+MAX_ROUNDS = 12
+RENDER_MODES = ('parallel', 'batch')
+AGREEMENT_GAP = 0.02  # offers this close (as a share of their midpoint) settle on the midpoint
+
+INTENT_DESCRIPTIONS = {
+    'offer': 'opening offer',
+    'counter': 'counter-offer',
+    'accept': 'accepts the last offer',
+    'mediate': 'suggests a compromise'
+}
+
+class NegotiationState:
+    """Running values for a negotiation in progress.
+
+    Rounds are appended through push(), which updates each side's latest
+    price and message, the gap between the sides and how far each side
+    moved on its last turn. Deciding who speaks next, whether the mediator
+    steps in and whether the sides have agreed then takes constant time,
+    however long the negotiation has run. Rounds are the dicts the caller
+    keeps: step rounds with a 'message', or planned turns whose template
+    text ('fallback') stands in for it.
+    """
+    __slots__ = ('buyer_max', 'seller_min', 'rounds', 'count', 'first_price', 'last_party',
+                 'buyer_price', 'seller_price', 'buyer_message', 'seller_message',
+                 'buyer_concession', 'seller_concession')
+
+    def __init__(self, buyer_max, seller_min, rounds=None):
+        self.buyer_max = buyer_max
+        self.seller_min = seller_min
+        self.rounds = rounds if rounds is not None else []
+        self.count = 0
+        self.first_price = None
+        self.last_party = None
+        self.buyer_price = self.seller_price = None
+        self.buyer_message = self.seller_message = None
+        self.buyer_concession = self.seller_concession = 0.0
+        # Rounds already played (e.g. posted back by a client) are replayed once
+        for entry in self.rounds:
+            self.observe(entry)
+
+    def push(self, entry):
+        """Append a round and update the running values"""
+        self.rounds.append(entry)
+        self.observe(entry)
+
+    def observe(self, entry):
+        self.count += 1
+        price = entry.get('price')
+        if self.first_price is None:
+            self.first_price = price
+        agent = entry['agent']
+        if agent == 'mediator' or price is None:
+            return
+        message = entry['message'] if 'message' in entry else entry['fallback']
+        if agent == 'buyer':
+            if self.buyer_price is not None:
+                self.buyer_concession = price - self.buyer_price
+            self.buyer_price, self.buyer_message = price, message
+        else:
+            if self.seller_price is not None:
+                self.seller_concession = self.seller_price - price
+            self.seller_price, self.seller_message = price, message
+        self.last_party = agent
+
+    def next_party(self):
+        return 'buyer' if self.last_party == 'seller' else 'seller'
+
+    def last_offer(self):
+        """The latest price and message from either side"""
+        if self.last_party == 'buyer':
+            return self.buyer_price, self.buyer_message
+        return self.seller_price, self.seller_message
+
+    def offers(self):
+        """Both sides' latest prices, in the order they were made"""
+        if self.last_party == 'buyer':
+            return self.seller_price, self.buyer_price
+        return self.buyer_price, self.seller_price
+
+    def messages(self):
+        """Both sides' latest messages, in the order they were sent"""
+        if self.last_party == 'buyer':
+            return self.seller_message, self.buyer_message
+        return self.buyer_message, self.seller_message
+
+    def gap(self):
+        """How far apart the sides' latest prices are, or None before both have one"""
+        if self.buyer_price is None or self.seller_price is None:
+            return None
+        return abs(self.seller_price - self.buyer_price)
+
+    def midpoint(self):
+        earlier, later = self.offers()
+        return (earlier + later) / 2
+
+    def agreed_price(self, accepted=False):
+        """The price the sides have settled on after the latest round, or None.
+
+        They settle on the latest price when its maker accepted, or on the
+        midpoint once the offers are within AGREEMENT_GAP of it; either way
+        only inside [seller_min, buyer_max].
+        """
+        if accepted:
+            price = self.last_offer()[0]
+            if self.seller_min <= price <= self.buyer_max:
+                return price
+        gap = self.gap()
+        if gap is None:
+            return None
+        midpoint = self.midpoint()
+        if gap < midpoint * AGREEMENT_GAP and self.seller_min <= midpoint <= self.buyer_max:
+            return midpoint
+        return None
+
+    def rejected_price(self, accepted=False):
+        """The price the sides converged on but agreed_price() turned down for
+        falling outside [seller_min, buyer_max], or None. Call it only when
+        agreed_price() found no agreement."""
+        if accepted:
+            price = self.last_offer()[0]
+            if not self.seller_min <= price <= self.buyer_max:
+                return price
+        gap = self.gap()
+        if gap is not None and gap < self.midpoint() * AGREEMENT_GAP:
+            return self.midpoint()
+        return None
+
+def plan_negotiation(item, buyer, seller, mediator):
+    """Run the pricing rules to completion without calling the model.
+
+    Returns the ordered list of planned turns plus the outcome. Each turn is an
+    agent plan (see agents.py) tagged with its round number; the previous turn's
+    template text stands in for the message the agents would otherwise quote.
+    """
+    state = NegotiationState(buyer.max_price, seller.min_price)
+    outcome = {'status': 'ongoing'}
+
+    # Round 1: Buyer's initial offer
+    opening = buyer.plan_initial_offer(item)
+    opening['round'] = 1
+    state.push(opening)
+
+    # Continue negotiation for at least 6 rounds
+    round_count = 1
+    while round_count < MIN_ROUNDS or outcome['status'] == 'ongoing':
+        round_count += 1
+        responder = seller if state.next_party() == 'seller' else buyer
+        response = responder.plan_response(item, *state.last_offer())
+
+        # Add mediator intervention periodically
+        if round_count == 4 or (round_count > MIN_ROUNDS and round_count % 3 == 0):
+            mediation = mediator.plan_intervention(item, state)
+            if mediation:
+                mediation['round'] = round_count
+                state.push(mediation)
+                round_count += 1
+
+        # Add the main response
+        response['round'] = round_count
+        state.push(response)
+
+        # Check for agreement after minimum rounds
+        if round_count >= MIN_ROUNDS:
+            final_price = state.agreed_price(response['intent'] == 'accept')
+            if final_price is not None:
+                outcome = {'status': 'agreed', 'final_price': final_price}
+                break
+
+        # Prevent infinite loops
+        if round_count >= MAX_ROUNDS:
+            outcome = {'status': 'failed', 'reason': 'Maximum rounds reached without agreement'}
+            break
+
+    outcome['turns'] = state.rounds
+    return outcome
+
+def scenario_rng(seed, *scenario):
+    """The agents' random source for a scenario (item, limits...) under `seed`, or None without one.
+
+    The same seed and scenario draw the same prices in every run, whatever
+    order negotiations run in, so the prompts repeat too; a cassette
+    recorded with a seed replays under it. None leaves the agents on the
+    module-level random.
+    """
+    if seed is None:
+        return None
+    return random.Random('|'.join(map(repr, (seed,) + scenario)))
+
+def iter_negotiation(item, buyer_max, seller_min, model, render_mode='parallel', max_workers=8, stream_tokens=False, deadline=None, rng=None):
+    """iter_negotiation_async for sync callers, driven on aio.runner's loop"""
+    return runner.iterate(iter_negotiation_async(item, buyer_max, seller_min, model, render_mode, stream_tokens, deadline, rng, max_workers))
+
+async def iter_negotiation_async(item, buyer_max, seller_min, model, render_mode='parallel', stream_tokens=False, deadline=None, rng=None, max_concurrency=None):
+    """Plan a negotiation, then render its messages, yielding events as it goes.
+
+    The first event is ('start', negotiation): the negotiation dict with the
+    planned outcome and a rounds list that is filled in as ('round', payload)
+    events arrive. With stream_tokens (parallel mode only), ('token', payload)
+    events carry partial message text. Without a model the template text is
+    used for every round. Rounds that had to use their template text because
+    the deadline ran out are marked `degraded`. `rng` is passed to the agents
+    (see scenario_rng).
+
+    Every round's model call is awaited concurrently on the event loop rather
+    than on a thread of its own, so a process can keep many negotiations in
+    flight; the governor in front of the model is what bounds the calls, and
+    max_concurrency caps this negotiation's share.
+    """
+    buyer = BuyerAgent(model, buyer_max, rng)
+    seller = SellerAgent(model, seller_min, rng)
+    mediator = MediatorAgent(model)
+    plan = plan_negotiation(item, buyer, seller, mediator)
+    turns = plan['turns']
+
+    negotiation = negotiation_record(item, buyer_max, seller_min, plan, [None] * len(turns))
+    yield 'start', negotiation
+
+    if model is None:
+        rendered = async_events([('round', index, r) for index, r in enumerate(render_templates(turns))])
+    elif render_mode == 'batch':
+        rounds = await render_rounds_batch_async(model, item, turns, deadline)
+        rendered = async_events([('round', index, r) for index, r in enumerate(rounds)])
+    else:
+        rendered = iter_rendered_rounds_async(model, turns, stream_tokens, deadline, max_concurrency)
+    async for event, index, data in rendered:
+        if event == 'token':
+            yield 'token', {'index': index, 'round': turns[index]['round'], 'agent': turns[index]['agent'], 'text': data}
+        else:
+            negotiation['rounds'][index] = data
+            yield 'round', dict(data, index=index)
+
+async def async_events(events):
+    for event in events:
+        yield event
+
+def run_negotiation(item, buyer_max, seller_min, model, render_mode='parallel', max_workers=8, deadline=None, rng=None):
+    """Plan and render a whole negotiation, returning the negotiation dict.
+
+    Sync callers (batch.py) hand the whole negotiation to aio.runner's loop
+    at once; its rounds render there, at most max_workers at a time.
+    """
+    return runner.run(run_negotiation_async(item, buyer_max, seller_min, model, render_mode, deadline, rng, max_workers))
+
+async def run_negotiation_async(item, buyer_max, seller_min, model, render_mode='parallel', deadline=None, rng=None, max_concurrency=None):
+    async for event, payload in iter_negotiation_async(item, buyer_max, seller_min, model, render_mode,
+                                                       deadline=deadline, rng=rng, max_concurrency=max_concurrency):
+        if event == 'start':
+            negotiation = payload
+    return negotiation
+
+def conversation_text(rounds):
+    """Flatten rounds into the transcript stored with a saved negotiation"""
+    return "\n".join([f"Round {r['round']} - {r['agent'].title()}: {r['message']}" for r in rounds])
+
+def render_templates(turns):
+    """Render every planned turn from its template text, without a model"""
+    return [to_round(turn, {'message': turn['fallback'], 'price': turn['price']}) for turn in turns]
+
+def degraded_round(turn):
+    """The template round used when the deadline leaves no time for the model"""
+    if not turn.get('prompt'):
+        return to_round(turn, {'message': turn['fallback'], 'price': turn['price']})
+    metrics.agent_fallbacks.inc(agent=turn['agent'], reason='deadline')
+    return to_round(turn, {'message': turn['fallback'], 'price': turn['price'], 'degraded': True})
+
+def run_offline_negotiation(item, buyer_max, seller_min, rng=None):
+    """Plan and render a whole negotiation without touching the network"""
+    plan = plan_negotiation(item, BuyerAgent(None, buyer_max, rng), SellerAgent(None, seller_min, rng), MediatorAgent(None))
+    return negotiation_record(item, buyer_max, seller_min, plan, render_templates(plan['turns']))
+
+def negotiation_record(item, buyer_max, seller_min, plan, rounds):
+    """Assemble the negotiation dict returned to clients from a plan and its rounds"""
+    negotiation = {
+        'item': item,
+        'buyer_max': buyer_max,
+        'seller_min': seller_min,
+        'rounds': rounds,
+        'status': plan['status']
+    }
+    if 'final_price' in plan:
+        negotiation['final_price'] = plan['final_price']
+    if 'reason' in plan:
+        negotiation['reason'] = plan['reason']
+    return negotiation
+
+def render_rounds(model, turns, max_workers=8):
+    """Render every planned turn concurrently, at most max_workers at a time"""
+    return runner.run(render_rounds_async(model, turns, max_workers))
+
+async def render_rounds_async(model, turns, max_concurrency=None):
+    rounds = [None] * len(turns)
+    async for event, index, rendered in iter_rendered_rounds_async(model, turns, max_concurrency=max_concurrency):
+        rounds[index] = rendered
+    return rounds
+
+def iter_rendered_rounds(model, turns, max_workers=8, stream_tokens=False, deadline=None):
+    """iter_rendered_rounds_async for sync callers, driven on aio.runner's loop"""
+    return runner.iterate(iter_rendered_rounds_async(model, turns, stream_tokens, deadline, max_workers))
+
+async def iter_rendered_rounds_async(model, turns, stream_tokens=False, deadline=None, max_concurrency=None):
+    """Yield ('round', index, round) as soon as each planned turn is rendered.
+
+    Each turn renders in a task of its own, at most max_concurrency at once
+    (no limit when None). With stream_tokens, ('token', index, text) events
+    carrying each new piece of a message are interleaved while the model is
+    still generating it. When the deadline passes, rounds still being
+    rendered are given their template text straight away and their tasks
+    are cancelled.
+    """
+    if not turns:
+        return
+    events = asyncio.Queue()
+    slots = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def render(index, turn):
+        on_token = (lambda text: events.put_nowait(('token', index, text))) if stream_tokens else None
+        try:
+            if slots is None:
+                result = await render_turn_async(model, turn, on_token, deadline)
+            else:
+                async with slots:
+                    result = await render_turn_async(model, turn, on_token, deadline)
+            events.put_nowait(('round', index, to_round(turn, result)))
+        except Exception as e:
+            events.put_nowait(('error', index, e))
+
+    tasks = [asyncio.create_task(render(index, turn)) for index, turn in enumerate(turns)]
+    try:
+        pending = set(range(len(turns)))
+        while pending:
+            try:
+                event = await asyncio.wait_for(events.get(), None if deadline is None else deadline.remaining())
+            except asyncio.TimeoutError:
+                for index in sorted(pending):
+                    yield 'round', index, degraded_round(turns[index])
+                return
+            if event[0] == 'error':
+                raise event[2]
+            if event[0] == 'round':
+                pending.discard(event[1])
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def to_round(turn, result):
+    rendered = {
+        'round': turn['round'],
+        'agent': turn['agent'],
+        'message': result['message'],
+        'price': result['price']
+    }
+    if 'participant' in turn:
+        rendered['participant'] = turn['participant']
+    if result.get('degraded'):
+        rendered['degraded'] = True
+    return rendered
+
+def render_rounds_batch(model, item, turns, deadline=None):
+    """render_rounds_batch_async for sync callers, run on aio.runner's loop"""
+    return runner.run(render_rounds_batch_async(model, item, turns, deadline))
+
+async def render_rounds_batch_async(model, item, turns, deadline=None):
+    """Render the whole planned negotiation with a single model call.
+
+    The model gets the full trajectory and must return a JSON array with one
+    message per round. Entries that are missing, out of order or that don't
+    quote their planned price fall back to the template text. If the deadline
+    can't cover the call, or it overruns, every round is degraded.
+    """
+    scripted = [turn for turn in turns if turn.get('prompt')]
+    messages = {}
+    out_of_time = deadline is not None and not deadline.allows_call()
+    if scripted and not out_of_time:
+        prompt = batch_prompt(item, scripted)
+        try:
+            with timed_call(), metrics.llm_span('batch', 'generate') as span:
+                span.prompt(prompt)
+                call = generate_async(model, prompt)
+                response = await (call if deadline is None else deadline.run_async(call))
+                span.response(response)
+            messages = batch_messages(response.text, scripted)
+        except DeadlineExceeded as e:
+            print(f"Error generating batch messages: {e}")
+            out_of_time = True
+        except Exception as e:
+            print(f"Error generating batch messages: {e}")
+    return batch_rounds(turns, scripted, messages, out_of_time)
+
+def batch_prompt(item, scripted):
+    trajectory = "\n".join([
+        f"Round {turn['round']} | {turn['agent']} | {INTENT_DESCRIPTIONS[turn['intent']]} | ${turn['price']:.2f}"
+        for turn in scripted
+    ])
+    return f"""You are writing the dialogue for a negotiation over a {item} between a buyer, a seller and a neutral mediator.
+The prices and decisions below are already fixed. Write one message for each line, in order.
+
+Round | Speaker | Move | Price
+{trajectory}
+
+Each message must:
+- Be written by the listed speaker and match the listed move
+- State the listed price exactly, formatted like $1234.56
+- Follow naturally from the previous messages
+- Sound natural, conversational and professional (1-3 sentences)
+
+Return ONLY a valid JSON array with one object per line above, each with 'round', 'agent' and 'message' keys.
+Example: [{{"round": {scripted[0]['round']}, "agent": "{scripted[0]['agent']}", "message": "..."}}]"""
+
+def batch_messages(text, scripted):
+    """The usable messages in a batch reply, keyed by id() of their turn"""
+    messages = {}
+    json_match = re.search(r'\[.*\]', text, re.DOTALL)
+    if json_match:
+        entries = json.loads(json_match.group())
+        for turn, entry in zip(scripted, entries):
+            if (isinstance(entry, dict)
+                    and entry.get('round') == turn['round']
+                    and entry.get('agent') == turn['agent']
+                    and isinstance(entry.get('message'), str)
+                    and mentions_price(entry['message'], turn['price'])):
+                messages[id(turn)] = entry['message']
+        if len(messages) < len(scripted):
+            print(f"Batch render kept {len(messages)} of {len(scripted)} messages, using templates for the rest")
+    return messages
+
+def batch_rounds(turns, scripted, messages, out_of_time):
+    for turn in scripted:
+        metrics.agent_turns.inc(agent=turn['agent'])
+    if out_of_time:
+        return [degraded_round(turn) for turn in turns]
+    for turn in scripted:
+        if id(turn) not in messages:
+            metrics.agent_fallbacks.inc(agent=turn['agent'], reason='batch')
+    return [
+        to_round(turn, {'message': messages.get(id(turn), turn['fallback']), 'price': turn['price']})
+        for turn in turns
+    ]
+
+def mentions_price(message, price):
+    """Check that a message quotes the planned price to the cent"""
+    for amount in re.findall(r'\$\s?(\d[\d,]*(?:\.\d+)?)', message):
+        if round(float(amount.replace(',', '')), 2) == round(price, 2):
+            return True
+    return False
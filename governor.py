@@ -0,0 +1,379 @@
+"""Shared guard in front of the model.
+
+GovernedModel wraps a backend so that every caller in the process goes
+through the same limits:
+
+- token buckets for requests and tokens per minute
+- a cap on calls in flight
+- jittered exponential retry for transient errors (quota, timeouts, 5xx)
+- a circuit breaker that fails calls straight away while the upstream is
+  down, so agents go to their template text instead of waiting out timeouts
+
+Calls that can't get through within `max_wait` seconds raise a GovernorError.
+Agents treat it like any other model error and fall back to their templates.
+Sync and async callers (generate_content_async) share the same limits.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+import metrics
+from backends import generate_async
+
+# Error class names (google.api_core, builtins, the stub backend) worth retrying
+TRANSIENT_ERRORS = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+    'DeadlineExceeded', 'GatewayTimeout', 'TimeoutError', 'ConnectionError', 'StubError'
+}
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class GovernorError(Exception):
+    """A call the governor refused to make"""
+    fallback_reason = 'governor'
+
+class CircuitOpenError(GovernorError):
+    fallback_reason = 'circuit_open'
+
+class RateLimitedError(GovernorError):
+    fallback_reason = 'rate_limited'
+
+def is_transient(error):
+    if type(error).__name__ in TRANSIENT_ERRORS:
+        return True
+    code = getattr(error, 'code', None)
+    code = getattr(code, 'value', code)  # grpc StatusCode-style enums
+    return code in TRANSIENT_STATUS_CODES
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+class TokenBucket:
+    """`rate` units per minute, bursting up to `capacity`"""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate / 60.0
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount, timeout):
+        """Take `amount`, waiting up to `timeout` seconds; False if that isn't enough"""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.take(amount)
+            if not wait:
+                return True
+            if wait > deadline - time.monotonic():
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, amount, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.take(amount)
+            if not wait:
+                return True
+            if wait > deadline - time.monotonic():
+                return False
+            await asyncio.sleep(wait)
+
+    def take(self, amount):
+        """Take `amount` if it's there and return 0, else return the seconds until it will be"""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+            return (amount - self.tokens) / self.rate
+
+    def debit(self, amount):
+        """Charge usage found out after the fact; the balance may go negative"""
+        with self.lock:
+            self.refill()
+            self.tokens -= amount
+
+class Slots:
+    """A cap on calls in flight, shared by threads and coroutines.
+
+    Waiters are served in arrival order: release() hands the slot straight
+    to the longest waiter, waking a thread through its Event or a coroutine
+    through its future on that coroutine's loop, so nobody polls.
+    """
+    def __init__(self, limit):
+        self.free = limit
+        self.waiters = deque()  # threading.Event or (loop, future)
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Wait up to `timeout` seconds for a slot; False if none came free"""
+        with self.lock:
+            if self.free and not self.waiters:
+                self.free -= 1
+                return True
+            waiter = threading.Event()
+            self.waiters.append(waiter)
+        if waiter.wait(timeout):
+            return True
+        return self.give_up(waiter)
+
+    async def acquire_async(self, timeout=None):
+        """acquire() for coroutines; the wait doesn't block the loop"""
+        with self.lock:
+            if self.free and not self.waiters:
+                self.free -= 1
+                return True
+            future = asyncio.get_running_loop().create_future()
+            waiter = (asyncio.get_running_loop(), future)
+            self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self.give_up(waiter)
+        except BaseException:
+            # Cancelled while waiting: a slot handed over meanwhile goes to the next waiter
+            if self.give_up(waiter):
+                self.release()
+            raise
+
+    def give_up(self, waiter):
+        """Stop waiting; True if release() granted the slot first"""
+        with self.lock:
+            try:
+                self.waiters.remove(waiter)
+                return False
+            except ValueError:
+                return True
+
+    def release(self):
+        with self.lock:
+            while self.waiters:
+                waiter = self.waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(grant, future)
+                    return
+                except RuntimeError:
+                    continue  # its loop has closed
+            self.free += 1
+
+def grant(future):
+    if not future.done():
+        future.set_result(True)
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `reset_after` seconds
+    one trial call is let through, and its result closes or reopens it."""
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record(self, success):
+        with self.lock:
+            self.trial_running = False
+            if success:
+                if self.opened_at is not None:
+                    print("Model circuit closed")
+                    metrics.circuit_state.set(0)
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"Model circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+                metrics.circuit_state.set(1)
+
+    def record_error(self, error):
+        """Count a failed call. Only quota, timeout and server errors say the
+        upstream is struggling; any other error (a bad request, say) leaves
+        the count and the state alone."""
+        if is_transient(error):
+            self.record(False)
+        else:
+            self.end_trial()
+
+    def end_trial(self):
+        """Let the next half-open trial through without counting this call either way"""
+        with self.lock:
+            self.trial_running = False
+
+class GovernedModel:
+    def __init__(self, model, requests_per_minute=0, tokens_per_minute=0, max_concurrency=16,
+                 max_wait=10.0, retries=3, backoff=0.5, max_backoff=8.0,
+                 breaker_threshold=5, breaker_reset=30.0):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.slots = Slots(max_concurrency)
+        self.max_wait = max_wait
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+
+    def generate_content(self, prompt, **kwargs):
+        if kwargs.get('stream'):
+            return self.stream(prompt, **kwargs)
+        return self.call(prompt, lambda: self.model.generate_content(prompt, **kwargs))
+
+    def stream(self, prompt, **kwargs):
+        # Retrying is only safe until the first chunk has gone to the caller
+        def first_chunk():
+            chunks = iter(self.model.generate_content(prompt, **kwargs))
+            return chunks, next(chunks, None)
+        chunks, first = self.call(prompt, first_chunk, release=False)
+        try:
+            if first is not None:
+                yield first
+            for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            self.breaker.record_error(e)
+            raise
+        finally:
+            self.slots.release()
+
+    async def generate_content_async(self, prompt, **kwargs):
+        if kwargs.get('stream'):
+            return self.stream_async(prompt, **kwargs)
+        return await self.call_async(prompt, lambda: generate_async(self.model, prompt, **kwargs))
+
+    async def stream_async(self, prompt, **kwargs):
+        async def first_chunk():
+            chunks = (await generate_async(self.model, prompt, **kwargs)).__aiter__()
+            try:
+                return chunks, await chunks.__anext__()
+            except StopAsyncIteration:
+                return chunks, None
+        chunks, first = await self.call_async(prompt, first_chunk, release=False)
+        try:
+            if first is not None:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            self.breaker.record_error(e)
+            raise
+        finally:
+            self.slots.release()
+
+    def call(self, prompt, attempt, release=True):
+        """Run attempt() within the limits, retrying transient errors.
+
+        With release=False the concurrency slot stays held after a successful
+        attempt and the caller must release it.
+        """
+        for retry in range(self.retries + 1):
+            self.admit(prompt)
+            try:
+                result = attempt()
+            except Exception as e:
+                self.slots.release()
+                transient = is_transient(e)
+                self.breaker.record_error(e)
+                if retry == self.retries or not transient:
+                    raise
+                metrics.llm_retries.inc(error=type(e).__name__)
+                time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry)))
+                continue
+            self.breaker.record(True)
+            if self.tokens is not None:
+                self.tokens.debit(estimate_tokens(getattr(result, 'text', '') or ''))
+            if release:
+                self.slots.release()
+            return result
+
+    async def call_async(self, prompt, attempt, release=True):
+        """call() for coroutines: attempt() returns an awaitable and waits don't block the loop"""
+        for retry in range(self.retries + 1):
+            await self.admit_async(prompt)
+            try:
+                result = await attempt()
+            except Exception as e:
+                self.slots.release()
+                transient = is_transient(e)
+                self.breaker.record_error(e)
+                if retry == self.retries or not transient:
+                    raise
+                metrics.llm_retries.inc(error=type(e).__name__)
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry)))
+                continue
+            except BaseException:
+                # Cancelled (e.g. by a deadline): give the slot back, the upstream isn't at fault
+                self.slots.release()
+                self.breaker.end_trial()
+                raise
+            self.breaker.record(True)
+            if self.tokens is not None:
+                self.tokens.debit(estimate_tokens(getattr(result, 'text', '') or ''))
+            if release:
+                self.slots.release()
+            return result
+
+    async def admit_async(self, prompt):
+        if not self.breaker.allow():
+            metrics.llm_rejections.inc(reason='circuit_open')
+            raise CircuitOpenError("Model circuit is open, skipping the call")
+        deadline = time.monotonic() + self.max_wait
+        if self.requests is not None and not await self.requests.acquire_async(1, self.max_wait):
+            self.reject('requests_per_minute')
+        if self.tokens is not None and not await self.tokens.acquire_async(estimate_tokens(prompt), max(0, deadline - time.monotonic())):
+            self.reject('tokens_per_minute')
+        if not await self.slots.acquire_async(max(0, deadline - time.monotonic())):
+            self.reject('concurrency')
+
+    def admit(self, prompt):
+        """Wait for the breaker, the rate limits and a free slot, or raise"""
+        if not self.breaker.allow():
+            metrics.llm_rejections.inc(reason='circuit_open')
+            raise CircuitOpenError("Model circuit is open, skipping the call")
+        deadline = time.monotonic() + self.max_wait
+        if self.requests is not None and not self.requests.acquire(1, self.max_wait):
+            self.reject('requests_per_minute')
+        if self.tokens is not None and not self.tokens.acquire(estimate_tokens(prompt), max(0, deadline - time.monotonic())):
+            self.reject('tokens_per_minute')
+        if not self.slots.acquire(timeout=max(0, deadline - time.monotonic())):
+            self.reject('concurrency')
+
+    def reject(self, reason):
+        # A half-open trial that never ran must not block the next one
+        self.breaker.end_trial()
+        metrics.llm_rejections.inc(reason=reason)
+        raise RateLimitedError(f"Model call not admitted within {self.max_wait:g}s ({reason})")
+
+    def stats(self):
+        return {'circuit': self.breaker.state, 'consecutive_failures': self.breaker.failures}
@@ -0,0 +1,97 @@
+"""In-process background jobs.
+
+A job runs a generator on a worker thread. Each (key, value) pair it yields
+is published straight away, so clients can poll for partial results or
+follow them as they arrive instead of waiting for the whole job.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from llm_cache import LRUCache
+
+class Job:
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'pending'
+        self.result = {}
+        self.error = None
+        self.events = []  # (key, value) pairs in the order they were published
+        self.condition = threading.Condition()
+
+    def publish(self, key, value):
+        with self.condition:
+            self.result[key] = value
+            self.events.append((key, value))
+            self.condition.notify_all()
+
+    def finish(self, status, error=None):
+        with self.condition:
+            self.status = status
+            self.error = error
+            self.condition.notify_all()
+
+    def done(self):
+        return self.status in ('done', 'error')
+
+    def to_dict(self):
+        with self.condition:
+            job = {'id': self.id, 'status': self.status, 'result': dict(self.result)}
+            if self.error is not None:
+                job['error'] = self.error
+            return job
+
+    def follow(self, start=0, timeout=None):
+        """Yield published (key, value) pairs from index `start` until the job finishes.
+
+        Stops early if nothing happens for `timeout` seconds.
+        """
+        seen = start
+        while True:
+            with self.condition:
+                if seen == len(self.events) and not self.done():
+                    self.condition.wait(timeout)
+                events = self.events[seen:]
+                finished = self.done()
+            seen += len(events)
+            yield from events
+            if finished or not events:
+                return
+
+    def wait(self, timeout=None):
+        """Block until the job finishes or `timeout` seconds pass"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while not self.done():
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+        return self.done()
+
+class JobQueue:
+    """Runs jobs on a fixed pool of threads; finished jobs are kept for `ttl` seconds"""
+    def __init__(self, workers=2, max_jobs=1024, ttl=3600):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.jobs = LRUCache(max_jobs, ttl)
+
+    def submit(self, fn, *args):
+        """Run the generator function fn(*args) in the background and return its Job"""
+        job = Job(uuid.uuid4().hex)
+        self.jobs.set(job.id, job)
+        self.pool.submit(self.run, job, fn, args)
+        return job
+
+    def run(self, job, fn, args):
+        job.status = 'running'
+        try:
+            for key, value in fn(*args):
+                job.publish(key, value)
+        except Exception as e:
+            print(f"Background job {job.id} failed: {e}")
+            job.finish('error', str(e))
+        else:
+            job.finish('done')
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
@@ -0,0 +1,218 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from backends import async_chunks, generate_async
+from database import get_pool
+from deadline import answered_from_cache
+
+# Decimal numbers in a prompt are treated as prices
+PRICE_PATTERN = re.compile(r'(?<![\w.])\d+\.\d+(?!\w|\.\d)')
+
+class CachedResponse:
+    """Stands in for a model response when the text comes from the cache"""
+    def __init__(self, text):
+        self.text = text
+
+    def __iter__(self):
+        # A streamed cache hit arrives as a single chunk
+        return iter([self])
+
+    def __aiter__(self):
+        return async_chunks([self])
+
+class LRUCache:
+    """In-memory LRU with a per-entry time to live"""
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl and time.time() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+class SQLiteCache:
+    """SQLite-backed tier that survives restarts, evicted by age and size.
+
+    Uses the pooled WAL connections from database.py. Eviction runs once
+    every `evict_every` writes rather than on each one, so the table may
+    hold up to that many entries over `max_entries` in between; expired
+    entries are never returned.
+    """
+    def __init__(self, db_path, max_entries=100000, ttl=7 * 24 * 3600, evict_every=256):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self.writes = 0
+        self.lock = threading.Lock()
+        with get_pool(db_path).connection('create_llm_cache_table') as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS llm_cache
+                            (key TEXT PRIMARY KEY,
+                             template TEXT,
+                             stored_at REAL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_stored_at ON llm_cache (stored_at)')
+
+    def get(self, key):
+        with get_pool(self.db_path).connection('get_llm_cache') as conn:
+            row = conn.execute('SELECT template, stored_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return row[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self.writes += 1
+            evict = self.writes % self.evict_every == 0
+        with get_pool(self.db_path).connection('save_llm_cache') as conn:
+            conn.execute('INSERT OR REPLACE INTO llm_cache (key, template, stored_at) VALUES (?, ?, ?)',
+                         (key, value, time.time()))
+            if evict:
+                self.evict(conn)
+
+    def evict(self, conn):
+        """Drop expired entries, then the oldest ones over max_entries; both walk the stored_at index"""
+        if self.ttl:
+            conn.execute('DELETE FROM llm_cache WHERE stored_at < ?', (time.time() - self.ttl,))
+        excess = conn.execute('SELECT count(*) FROM llm_cache').fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute('''DELETE FROM llm_cache WHERE key IN
+                            (SELECT key FROM llm_cache ORDER BY stored_at, rowid LIMIT ?)''', (excess,))
+
+class CachedModel:
+    """Wraps a model so repeated prompts skip the network.
+
+    Prices in the prompt are bucketed (to the nearest `price_bucket` dollars)
+    when building the key, and replaced by placeholders in the stored response.
+    A hit puts the exact prices of the new prompt back into the template.
+    """
+    def __init__(self, model, memory=None, disk=None, price_bucket=1.0):
+        self.model = model
+        self.memory = memory if memory is not None else LRUCache()
+        self.disk = disk
+        self.price_bucket = price_bucket
+        self.counts = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0}
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        key, prices, hit = self.lookup(prompt)
+        if hit is not None:
+            return hit
+        response = self.model.generate_content(prompt, **kwargs)
+        if kwargs.get('stream'):
+            return self.store_stream(key, prices, response)
+        self.store(key, prices, response.text)
+        return response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        key, prices, hit = self.lookup(prompt)
+        if hit is not None:
+            return hit
+        response = await generate_async(self.model, prompt, **kwargs)
+        if kwargs.get('stream'):
+            return self.store_stream_async(key, prices, response)
+        self.store(key, prices, response.text)
+        return response
+
+    def lookup(self, prompt):
+        """The prompt's cache key and prices, and the cached response on a hit"""
+        key, prices = self.make_key(prompt)
+
+        template = self.memory.get(key)
+        tier = 'memory_hits'
+        if template is None and self.disk is not None:
+            template = self.disk.get(key)
+            tier = 'disk_hits'
+            if template is not None:
+                self.memory.set(key, template)
+
+        if template is not None:
+            self.count('hits', tier)
+            answered_from_cache()
+            return key, prices, CachedResponse(fill_prices(template, prices))
+
+        self.count('misses')
+        return key, prices, None
+
+    def store(self, key, prices, text):
+        template = extract_prices(text, prices)
+        self.memory.set(key, template)
+        if self.disk is not None:
+            self.disk.set(key, template)
+
+    def store_stream(self, key, prices, response):
+        """Pass streamed chunks through and cache the text once the stream completes"""
+        parts = []
+        for chunk in response:
+            parts.append(chunk.text)
+            yield chunk
+        self.store(key, prices, ''.join(parts))
+
+    async def store_stream_async(self, key, prices, response):
+        parts = []
+        async for chunk in response:
+            parts.append(chunk.text)
+            yield chunk
+        self.store(key, prices, ''.join(parts))
+
+    def make_key(self, prompt):
+        """Normalize the prompt into a cache key and the exact prices it quotes"""
+        prices = PRICE_PATTERN.findall(prompt)
+        normalized = PRICE_PATTERN.sub(lambda m: f"<{self.bucket(m.group())}>", prompt)
+        normalized = ' '.join(normalized.split())
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest(), prices
+
+    def bucket(self, price):
+        if not self.price_bucket:
+            return price
+        return round(float(price) / self.price_bucket)
+
+    def count(self, *names):
+        with self.lock:
+            for name in names:
+                self.counts[name] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / total if total else 0.0
+        stats['memory_entries'] = len(self.memory)
+        return stats
+
+def extract_prices(text, prices):
+    """Replace the prompt's prices in a response with numbered placeholders"""
+    for index, price in enumerate(prices):
+        text = re.sub(rf'(?<![\d.,]){re.escape(price)}(?!\d)', f"{{{{P{index}}}}}", text)
+        grouped = f"{float(price):,.2f}"
+        if ',' in grouped:
+            text = re.sub(rf'(?<![\d.,]){re.escape(grouped)}(?!\d)', f"{{{{P{index},}}}}", text)
+    return text
+
+def fill_prices(template, prices):
+    """Put the exact prices of the current prompt back into a cached template"""
+    for index, price in enumerate(prices):
+        template = template.replace(f"{{{{P{index}}}}}", price)
+        template = template.replace(f"{{{{P{index},}}}}", f"{float(price):,.2f}")
+    return template
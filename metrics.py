@@ -0,0 +1,172 @@
+"""Process-wide metrics in the Prometheus text format.
+
+Counters and histograms are registered at import time and rendered by
+`/metrics`. Kept dependency-free: the exposition format is small enough to
+write directly.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers in-process work (ms) through slow model calls (tens of s)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+_metrics = []
+
+def label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{label_text(self.labels, key)} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes, even if it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for key, entry in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    lines.append(f'{self.name}_bucket{label_text(self.labels + ("le",), key + (bound,))} {count}')
+                lines.append(f'{self.name}_bucket{label_text(self.labels + ("le",), key + ("+Inf",))} {entry[-1]}')
+                lines.append(f'{self.name}_sum{label_text(self.labels, key)} {entry[-2]}')
+                lines.append(f'{self.name}_count{label_text(self.labels, key)} {entry[-1]}')
+        return lines
+
+class Gauge:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        _metrics.append(self)
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {self.value}']
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# Model calls
+llm_seconds = Histogram('llm_request_seconds', 'Model call time, to the last streamed chunk', ('agent', 'method', 'outcome'))
+llm_characters = Counter('llm_characters_total', 'Characters sent to and received from the model', ('agent', 'direction'))
+llm_tokens = Counter('llm_tokens_total', 'Model tokens as reported by the model, or estimated at 4 characters each', ('agent', 'direction'))
+llm_prompt_size = Histogram('llm_prompt_characters', 'Prompt size in characters', ('agent',), SIZE_BUCKETS)
+llm_retries = Counter('llm_retries_total', 'Model calls retried after a transient error', ('error',))
+llm_rejections = Counter('llm_rejections_total', 'Model calls refused by the governor', ('reason',))
+circuit_state = Gauge('llm_circuit_open', '1 while the model circuit breaker is open')
+
+# Agent turns and how often they fall back to template text
+agent_turns = Counter('agent_turns_total', 'Agent messages rendered', ('agent',))
+agent_fallbacks = Counter('agent_fallbacks_total', 'Agent messages that used the template text instead of the model', ('agent', 'reason'))
+
+# Storage, reports and requests
+db_seconds = Histogram('db_operation_seconds', 'Time spent in each database operation, including waiting for a connection', ('operation',))
+pdf_seconds = Histogram('pdf_render_seconds', 'PDF report render time', ())
+pdf_requests = Counter('pdf_requests_total', 'PDF report requests by cache result', ('result',))
+http_seconds = Histogram('http_request_seconds', 'HTTP request handling time', ('endpoint', 'method', 'status'))
+
+class LLMSpan:
+    """Collects what one model call sent and received; see llm_span"""
+    def __init__(self, agent):
+        self.agent = agent
+        self.usage = None
+        self.prompt_chars = 0
+        self.response_chars = 0
+
+    def prompt(self, text):
+        llm_characters.inc(len(text), agent=self.agent, direction='prompt')
+        llm_prompt_size.observe(len(text), agent=self.agent)
+        self.prompt_chars = len(text)
+
+    def response(self, response):
+        """Record a response or streamed chunk"""
+        self.response_chars += len(getattr(response, 'text', '') or '')
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.usage = usage
+
+    def finish(self):
+        llm_characters.inc(self.response_chars, agent=self.agent, direction='response')
+        prompt_tokens = getattr(self.usage, 'prompt_token_count', None)
+        response_tokens = getattr(self.usage, 'candidates_token_count', None)
+        llm_tokens.inc(prompt_tokens if prompt_tokens is not None else self.prompt_chars // 4,
+                       agent=self.agent, direction='prompt')
+        llm_tokens.inc(response_tokens if response_tokens is not None else self.response_chars // 4,
+                       agent=self.agent, direction='response')
+
+@contextmanager
+def llm_span(agent, method):
+    """Time one model call and count its prompt and response size.
+
+    The caller reports the prompt and each response (or streamed chunk) on
+    the yielded span.
+    """
+    span = LLMSpan(agent)
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield span
+        outcome = 'ok'
+    finally:
+        llm_seconds.observe(time.perf_counter() - started, agent=agent, method=method, outcome=outcome)
+        span.finish()
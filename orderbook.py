@@ -0,0 +1,210 @@
+"""Multi-party negotiations: many buyers bidding on one listing, or many
+sellers competing for one buyer.
+
+The competing side's offers sit in an OrderBook, a heap ordered best first
+(highest bid or lowest ask), so each round's best offer is found in
+O(log n). Every competitor prices its own move locally with its strategy,
+so a round is O(n) in the competitors still taking part: the new quotes go
+onto the book together, in one heapify when most of them moved. Only the
+best competitor's offer and the single party's answer become messages, so
+a round costs two model calls however many take part.
+Competitors whose limit can never meet the single party, or never beat the
+best offer on the book, are pruned without any model call. Offers on the
+book only ever improve, which is what makes the second pruning safe.
+
+Agreement follows the two-party rule (NegotiationState.agreed_price), so a
+listing closes as soon as the best offer and the answer to it agree.
+"""
+import heapq
+import itertools
+from agents import BuyerAgent, SellerAgent
+from engine import MAX_ROUNDS, NegotiationState, negotiation_record, render_rounds, render_templates
+
+ORDER_BOOK_SIDES = ('buyers', 'sellers')
+
+class OrderBook:
+    """Standing offers from one side, best first.
+
+    `direction` is the competitors' (see BuyerAgent.direction): bids are
+    ranked highest first and asks lowest first. Replaced offers stay in the
+    heap until they reach the top and are skipped there.
+    """
+    def __init__(self, direction):
+        self.direction = direction
+        self.heap = []
+        self.offers = {}  # participant -> current price
+        self.posted = {}  # participant -> sequence number of its current price
+        self.sequence = itertools.count()  # equal prices: the earlier offer ranks first
+
+    def __len__(self):
+        return len(self.offers)
+
+    def post(self, participant, price):
+        self.post_many({participant: price})
+
+    def post_many(self, offers):
+        """Post {participant: price}; a price that hasn't changed keeps its place.
+
+        A few changes are pushed one at a time. When more than a quarter of
+        the book moved it is rebuilt with a single heapify instead, so a
+        round where everyone re-quotes costs O(n) rather than O(n log n).
+        """
+        current, posted, sequence = self.offers, self.posted, self.sequence
+        changed = [participant for participant, price in offers.items() if current.get(participant) != price]
+        for participant in changed:
+            current[participant] = offers[participant]
+            posted[participant] = next(sequence)
+        if 4 * len(changed) > len(self.offers) or len(self.heap) + len(changed) > 2 * len(self.offers) + 64:
+            self.compact()
+            return
+        for participant in changed:
+            heapq.heappush(self.heap, self.entry(participant))
+
+    def remove(self, participant):
+        self.offers.pop(participant, None)
+        self.posted.pop(participant, None)
+
+    def best(self):
+        """(participant, price) of the best standing offer, or None if the book is empty"""
+        while self.heap:
+            _, sequence, participant, price = self.heap[0]
+            if self.posted.get(participant) == sequence:
+                return participant, price
+            heapq.heappop(self.heap)
+        return None
+
+    def entry(self, participant):
+        price = self.offers[participant]
+        return (-self.direction * price, self.posted[participant], participant, price)
+
+    def compact(self):
+        """Rebuild the heap from the current offers alone"""
+        sign, posted = -self.direction, self.posted
+        self.heap = [(sign * price, posted[participant], participant, price) for participant, price in self.offers.items()]
+        heapq.heapify(self.heap)
+
+def plan_order_book(item, principal, competitors, max_rounds=MAX_ROUNDS):
+    """Run the pricing rules for one agent against many, without calling the model.
+
+    `principal` is the single party; `competitors` are agents of the other
+    side. Returns the outcome like plan_negotiation, plus `winner` (the
+    index of the competitor that got the deal, or of the last best offer),
+    `participants` and `pruned`. Competitor turns carry their index as
+    `participant`.
+    """
+    direction = competitors[0].direction
+    buying = isinstance(principal, SellerAgent)
+    state = NegotiationState(None, None)
+    book = OrderBook(direction)
+    outcome = {'status': 'ongoing'}
+
+    # Competitors that can never meet the principal's limit don't take part
+    active = {}
+    for index, agent in enumerate(competitors):
+        if direction * (agent.limit_price() - principal.limit_price()) >= 0:
+            active[index] = agent
+    # Weakest limit first: those are the ones the best offer rules out
+    limits = [(direction * agent.limit_price(), index) for index, agent in active.items()]
+    heapq.heapify(limits)
+    intents = {}
+
+    def turn(plan, participant=None):
+        plan['round'] = state.count + 1
+        if participant is not None:
+            plan['participant'] = participant
+        state.push(plan)
+
+    offer = message = None
+    if not buying:
+        turn(principal.plan_initial_offer(item))
+        offer, message = state.last_offer()
+
+    while active:
+        # Every competitor answers the principal's latest offer (or opens)
+        quotes = {}
+        for index, agent in active.items():
+            if offer is None:
+                intent, price = 'offer', agent.opening_price()
+            else:
+                intent, price = agent.decide(offer)
+            standing = book.offers.get(index)
+            if standing is not None and direction * (price - standing) < 0:
+                intent, price = 'counter', standing  # offers on the book only improve
+            intents[index] = intent
+            quotes[index] = price
+        book.post_many(quotes)
+
+        leader, best = book.best()
+        while limits and limits[0][0] < direction * best:
+            _, index = heapq.heappop(limits)
+            del active[index]
+            book.remove(index)
+
+        # The limits that matter now are the leader's and the principal's
+        lead = competitors[leader]
+        state.buyer_max = lead.max_price if buying else principal.max_price
+        state.seller_min = principal.min_price if buying else lead.min_price
+
+        intent = intents[leader]
+        if offer is None:
+            turn(lead.describe_opening(item, best), leader)
+        else:
+            if direction * (best - offer) >= 0:
+                intent, best = 'accept', offer  # the best offer meets the principal's price
+            turn(lead.describe(item, intent, best, offer, message), leader)
+            final_price = state.agreed_price(intent == 'accept')
+            if final_price is not None:
+                outcome = {'status': 'agreed', 'final_price': final_price}
+                break
+        if state.count >= max_rounds:
+            break
+
+        # The principal answers the best offer
+        response = principal.plan_response(item, best, state.last_offer()[1])
+        turn(response)
+        offer, message = state.last_offer()
+        final_price = state.agreed_price(response['intent'] == 'accept')
+        if final_price is not None:
+            outcome = {'status': 'agreed', 'final_price': final_price}
+            break
+        if state.count >= max_rounds:
+            break
+
+    if outcome['status'] == 'ongoing':
+        reason = 'No competitor can meet the limit' if not active else 'Maximum rounds reached without agreement'
+        outcome = {'status': 'failed', 'reason': reason}
+    best = book.best()
+    outcome['winner'] = best[0] if best else None
+    outcome['participants'] = len(competitors)
+    outcome['pruned'] = len(competitors) - len(active)
+    outcome['turns'] = state.rounds
+    return outcome
+
+def run_order_book(item, side, limit, competitor_limits, model=None, strategy='default', rng=None, max_workers=8):
+    """Plan and render a multi-party negotiation, returning the negotiation dict.
+
+    With side='buyers', `competitor_limits` are the bidders' maximum prices
+    and `limit` is the seller's minimum; with side='sellers' they are the
+    sellers' minimums and `limit` is the buyer's maximum. Without a model the
+    template text is used for every round.
+    """
+    if side == 'buyers':
+        principal = SellerAgent(model, limit, rng, strategy)
+        competitors = [BuyerAgent(model, value, rng, strategy) for value in competitor_limits]
+    else:
+        principal = BuyerAgent(model, limit, rng, strategy)
+        competitors = [SellerAgent(model, value, rng, strategy) for value in competitor_limits]
+    plan = plan_order_book(item, principal, competitors)
+    turns = plan['turns']
+    rounds = render_templates(turns) if model is None else render_rounds(model, turns, max_workers)
+
+    winner = competitor_limits[plan['winner']] if plan['winner'] is not None else None
+    buyer_max, seller_min = (winner, limit) if side == 'buyers' else (limit, winner)
+    negotiation = negotiation_record(item, buyer_max, seller_min, plan, rounds)
+    negotiation.update({
+        'mode': side,
+        'winner': plan['winner'],
+        'participants': plan['participants'],
+        'pruned': plan['pruned']
+    })
+    return negotiation
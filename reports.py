@@ -0,0 +1,226 @@
+"""PDF negotiation reports.
+
+Reports are rendered from negotiation dicts (saved records or client JSON) on
+a process pool, so reportlab's CPU work doesn't hold up the web threads.
+Rendered PDFs are cached by a hash of the content that goes into them, in a
+cache bounded by total size, so downloading the same report again costs a
+lookup.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+import metrics
+
+# Everything in a negotiation that shows up in its report
+REPORT_FIELDS = ('item', 'buyer_max', 'seller_min', 'status', 'final_price', 'rounds', 'summary', 'analysis')
+
+def build_pdf(negotiation):
+    """Render a negotiation report and return the PDF bytes"""
+    # reportlab takes a while to import, so it's only loaded once a report is rendered
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=1*inch)
+    styles = getSampleStyleSheet()
+    story = []
+
+    # Title
+    title = Paragraph("NEGOTIATION ANALYSIS REPORT", styles['Title'])
+    story.append(title)
+    story.append(Spacer(1, 20))
+
+    # Executive Summary
+    summary_title = Paragraph("Executive Summary", styles['Heading1'])
+    story.append(summary_title)
+    summary_text = Paragraph(negotiation.get('summary') or 'No summary available', styles['Normal'])
+    story.append(summary_text)
+    story.append(Spacer(1, 15))
+
+    # Negotiation Details Table
+    details_title = Paragraph("Negotiation Details", styles['Heading1'])
+    story.append(details_title)
+
+    details_data = [
+        ['Item', negotiation['item']],
+        ['Buyer Maximum Price', f"${negotiation['buyer_max']:.2f}"],
+        ['Seller Minimum Price', f"${negotiation['seller_min']:.2f}"],
+        ['Final Status', negotiation['status'].title()],
+        ['Final Price', f"${negotiation.get('final_price') or 0:.2f}"],
+        ['Total Rounds', str(len(negotiation['rounds']))]
+    ]
+
+    details_table = Table(details_data, colWidths=[2*inch, 3*inch])
+    details_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    story.append(details_table)
+    story.append(Spacer(1, 20))
+
+    # Round by Round Analysis
+    rounds_title = Paragraph("Round-by-Round Breakdown", styles['Heading1'])
+    story.append(rounds_title)
+
+    for round_data in negotiation['rounds']:
+        round_text = f"<b>Round {round_data.get('round', 'N/A')} - {round_data['agent'].title()}:</b><br/>"
+        # Mediators don't always name a price
+        if round_data.get('price') is not None:
+            round_text += f"Price: ${round_data['price']:.2f}<br/>"
+        round_text += f"Message: {round_data['message']}"
+
+        round_para = Paragraph(round_text, styles['Normal'])
+        story.append(round_para)
+        story.append(Spacer(1, 10))
+
+    story.append(Spacer(1, 20))
+
+    # Strategic Analysis
+    analysis_title = Paragraph("Strategic Analysis", styles['Heading1'])
+    story.append(analysis_title)
+    analysis_text = Paragraph(negotiation.get('analysis') or 'No analysis available', styles['Normal'])
+    story.append(analysis_text)
+
+    doc.build(story)
+    return buffer.getvalue()
+
+def report_key(negotiation):
+    """Hash of the report's content; identical negotiations share a rendered PDF"""
+    content = {field: negotiation.get(field) for field in REPORT_FIELDS}
+    content['rounds'] = [
+        {'round': r.get('round'), 'agent': r['agent'], 'price': r.get('price'), 'message': r['message']}
+        for r in content['rounds'] or []
+    ]
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def report_filename(negotiation):
+    if negotiation.get('id') is not None:
+        return f"negotiation_report_{negotiation['id']}.pdf"
+    return f"negotiation_report_{negotiation['item'].replace(' ', '_')}.pdf"
+
+class ByteSizeLRU:
+    """LRU of bytes values, evicted once their total size passes max_bytes"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self.entries)
+
+class ReportService:
+    """Renders PDFs on a process pool behind the content-hash cache.
+
+    With processes=0 reports are rendered in the calling thread instead.
+    Concurrent requests for the same uncached report share one render.
+    """
+    def __init__(self, processes=2, cache_bytes=64 * 1024 * 1024):
+        self.processes = processes
+        self.cache = ByteSizeLRU(cache_bytes)
+        self.pool = None
+        self.rendering = {}  # report key -> Future for renders in progress
+        self.lock = threading.Lock()
+        self.counts = {'hits': 0, 'renders': 0}
+
+    def render(self, negotiation):
+        """Return the PDF bytes for a negotiation"""
+        return self.submit(negotiation).result()
+
+    def render_many(self, negotiations):
+        """Render several reports at once, in order"""
+        futures = [self.submit(negotiation) for negotiation in negotiations]
+        return [future.result() for future in futures]
+
+    def export_zip(self, negotiations):
+        """A zip archive with one report per negotiation"""
+        buffer = io.BytesIO()
+        # PDFs are already compressed
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            for negotiation, pdf in zip(negotiations, self.render_many(negotiations)):
+                archive.writestr(report_filename(negotiation), pdf)
+        return buffer.getvalue()
+
+    def submit(self, negotiation):
+        key = report_key(negotiation)
+        pdf = self.cache.get(key)
+        with self.lock:
+            if pdf is not None:
+                self.counts['hits'] += 1
+                metrics.pdf_requests.inc(result='hit')
+                future = Future()
+                future.set_result(pdf)
+                return future
+            future = self.rendering.get(key)
+            if future is not None:
+                metrics.pdf_requests.inc(result='shared')
+                return future
+            self.counts['renders'] += 1
+            metrics.pdf_requests.inc(result='render')
+            started = time.perf_counter()
+            future = self.start(negotiation)
+            self.rendering[key] = future
+        future.add_done_callback(lambda done: self.finish(key, done, started))
+        return future
+
+    def start(self, negotiation):
+        if not self.processes:
+            future = Future()
+            try:
+                future.set_result(build_pdf(negotiation))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        if self.pool is None:
+            # By now the app has other threads running (the asyncio runner, job
+            # workers, the model client); a forked child could inherit one of
+            # their locks held and hang, so the render processes are spawned
+            self.pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool.submit(build_pdf, negotiation)
+
+    def finish(self, key, future, started):
+        # Includes any wait for a free render process
+        metrics.pdf_seconds.observe(time.perf_counter() - started)
+        if not future.cancelled() and future.exception() is None:
+            self.cache.set(key, future.result())
+        with self.lock:
+            self.rendering.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, cached_reports=len(self.cache), cached_bytes=self.cache.size)
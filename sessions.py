@@ -0,0 +1,157 @@
+"""Server-side state for step-by-step negotiations.
+
+`/start_negotiation` opens a session and `/continue_negotiation` advances it
+by ID. The agents live in the session between steps, so their round counters
+(and with them the concession schedule) carry on where they left off.
+
+Sessions are kept in an in-memory LRU with a time to live. An optional SQLite
+tier stores each session after every step, so a session evicted from memory
+or started before a restart can still be resumed. The memory tier is per
+process: when several workers serve the app without sticky sessions, the
+SQLite tier is the one they share.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from agents import BuyerAgent, SellerAgent, MediatorAgent
+from database import get_pool
+from engine import NegotiationState
+from llm_cache import LRUCache
+
+# Agent attributes that change as a negotiation goes on
+AGENT_STATE = ('target_price', 'rounds_count', 'negotiation_strategy', 'own_price', 'their_price')
+
+class NegotiationSession:
+    """One negotiation in progress, with its live agents"""
+    def __init__(self, session_id, item, buyer_max, seller_min, model, rng=None):
+        self.session_id = session_id
+        self.item = item
+        self.buyer_max = buyer_max
+        self.seller_min = seller_min
+        self.rng = rng  # seeded random.Random shared by the agents (engine.scenario_rng), or None
+        self.buyer = BuyerAgent(model, buyer_max, rng)
+        self.seller = SellerAgent(model, seller_min, rng)
+        self.mediator = MediatorAgent(model)
+        self.rounds = []
+        self.state = NegotiationState(buyer_max, seller_min, self.rounds)
+        self.status = 'ongoing'
+        self.final_price = None
+        self.reason = None
+        # Steps on one session run one at a time
+        self.lock = threading.Lock()
+
+    def negotiation(self):
+        """The negotiation dict the legacy endpoint works on and returns"""
+        negotiation = {
+            'item': self.item,
+            'buyer_max': self.buyer_max,
+            'seller_min': self.seller_min,
+            'rounds': self.rounds,
+            'status': self.status
+        }
+        if self.final_price is not None:
+            negotiation['final_price'] = self.final_price
+        if self.reason is not None:
+            negotiation['reason'] = self.reason
+        return negotiation
+
+    def update(self, negotiation):
+        if negotiation['rounds'] is not self.rounds:
+            self.rounds = negotiation['rounds']
+            self.state = NegotiationState(self.buyer_max, self.seller_min, self.rounds)
+        self.status = negotiation['status']
+        self.final_price = negotiation.get('final_price')
+        self.reason = negotiation.get('reason')
+
+    def dumps(self):
+        return json.dumps({
+            'session_id': self.session_id,
+            'negotiation': self.negotiation(),
+            'buyer': {name: getattr(self.buyer, name) for name in AGENT_STATE},
+            'seller': {name: getattr(self.seller, name) for name in AGENT_STATE},
+            # A seeded session carries on with the same draws after a restore
+            'rng': self.rng.getstate() if self.rng is not None else None
+        })
+
+    @classmethod
+    def loads(cls, text, model):
+        state = json.loads(text)
+        negotiation = state['negotiation']
+        rng = None
+        if state.get('rng') is not None:
+            version, internal, gauss_next = state['rng']
+            rng = random.Random()
+            rng.setstate((version, tuple(internal), gauss_next))
+        session = cls(state['session_id'], negotiation['item'], negotiation['buyer_max'], negotiation['seller_min'], model, rng)
+        session.update(negotiation)
+        for name, value in state['buyer'].items():
+            setattr(session.buyer, name, value)
+        for name, value in state['seller'].items():
+            setattr(session.seller, name, value)
+        return session
+
+class SQLiteSessionTier:
+    """Stores serialized sessions so they outlive the memory tier and restarts"""
+    def __init__(self, db_path, ttl=24 * 3600):
+        self.db_path = db_path
+        self.ttl = ttl
+        with get_pool(db_path).connection('create_session_table') as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS negotiation_sessions
+                            (session_id TEXT PRIMARY KEY,
+                             state TEXT,
+                             updated_at REAL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_negotiation_sessions_updated_at ON negotiation_sessions (updated_at)')
+
+    def get(self, session_id):
+        with get_pool(self.db_path).connection('get_session') as conn:
+            row = conn.execute('SELECT state, updated_at FROM negotiation_sessions WHERE session_id = ?',
+                               (session_id,)).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return row[0]
+
+    def set(self, session_id, state):
+        now = time.time()
+        with get_pool(self.db_path).connection('save_session') as conn:
+            conn.execute('INSERT OR REPLACE INTO negotiation_sessions (session_id, state, updated_at) VALUES (?, ?, ?)',
+                         (session_id, state, now))
+            if self.ttl:
+                conn.execute('DELETE FROM negotiation_sessions WHERE updated_at < ?', (now - self.ttl,))
+
+class SessionStore:
+    """Sessions by ID: live objects in memory, optionally backed by SQLite"""
+    def __init__(self, model, memory=None, disk=None):
+        self.model = model
+        self.memory = memory if memory is not None else LRUCache(1024, 3600)
+        self.disk = disk
+        # Restores from disk run one at a time, so concurrent requests for a
+        # session missing from memory end up sharing one object (and its lock)
+        self.restore_lock = threading.Lock()
+
+    def create(self, item, buyer_max, seller_min, rng=None):
+        session = NegotiationSession(uuid.uuid4().hex, item, buyer_max, seller_min, self.model, rng)
+        self.memory.set(session.session_id, session)
+        return session
+
+    def get(self, session_id):
+        """Return the session, or None if it is unknown or has expired"""
+        session = self.memory.get(session_id)
+        if session is not None or self.disk is None:
+            return session
+        with self.restore_lock:
+            # Another request may have restored it while we waited
+            session = self.memory.get(session_id)
+            if session is None:
+                state = self.disk.get(session_id)
+                if state is not None:
+                    session = NegotiationSession.loads(state, self.model)
+                    self.memory.set(session_id, session)
+        return session
+
+    def save(self, session):
+        """Record a session after it has changed"""
+        self.memory.set(session.session_id, session)
+        if self.disk is not None:
+            self.disk.set(session.session_id, session.dumps())
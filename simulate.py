@@ -0,0 +1,81 @@
+"""Headless negotiation simulator.
+
+Runs negotiations with the agents' pricing rules and template messages only,
+so it never calls Gemini and needs no API key. Useful for regression testing
+pricing changes and for capacity planning.
+
+    python simulate.py --runs 10000 --buyer-max 1000 --seller-min 800
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from engine import run_offline_negotiation
+
+def simulate(item, buyer_max, seller_min, runs, jitter=0.0, dump=None):
+    """Run `runs` offline negotiations and return aggregate statistics"""
+    agreed = 0
+    final_prices = []
+    round_counts = []
+    started = time.perf_counter()
+    for _ in range(runs):
+        run_buyer_max = buyer_max * random.uniform(1 - jitter, 1 + jitter) if jitter else buyer_max
+        run_seller_min = seller_min * random.uniform(1 - jitter, 1 + jitter) if jitter else seller_min
+        negotiation = run_offline_negotiation(item, run_buyer_max, run_seller_min)
+        round_counts.append(len(negotiation['rounds']))
+        if negotiation['status'] == 'agreed':
+            agreed += 1
+            final_prices.append(negotiation['final_price'])
+        if dump:
+            dump.write(json.dumps(negotiation) + "\n")
+    elapsed = time.perf_counter() - started
+
+    return {
+        'runs': runs,
+        'seconds': elapsed,
+        'negotiations_per_second': runs / elapsed if elapsed else float('inf'),
+        'agreement_rate': agreed / runs if runs else 0.0,
+        'avg_final_price': sum(final_prices) / len(final_prices) if final_prices else None,
+        'avg_rounds': sum(round_counts) / len(round_counts) if round_counts else 0.0
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run offline negotiations without calling Gemini")
+    parser.add_argument('--item', default='used car')
+    parser.add_argument('--buyer-max', type=float, default=1000.0)
+    parser.add_argument('--seller-min', type=float, default=800.0)
+    parser.add_argument('--runs', type=int, default=1000)
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="randomize each run's limits by up to this fraction (e.g. 0.1 for +/-10%%)")
+    parser.add_argument('--seed', type=int, help="seed for reproducible runs")
+    parser.add_argument('--dump', help="write every negotiation to this JSONL file")
+    parser.add_argument('--json', action='store_true', help="print the statistics as JSON")
+    args = parser.parse_args(argv)
+
+    if args.seller_min > args.buyer_max:
+        parser.error(f"seller minimum (${args.seller_min:.2f}) exceeds buyer maximum (${args.buyer_max:.2f})")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    dump = open(args.dump, 'w') if args.dump else None
+    try:
+        stats = simulate(args.item, args.buyer_max, args.seller_min, args.runs, args.jitter, dump)
+    finally:
+        if dump:
+            dump.close()
+
+    if args.json:
+        print(json.dumps(stats))
+        return 0
+
+    print(f"Runs:             {stats['runs']}")
+    print(f"Elapsed:          {stats['seconds']:.3f}s ({stats['negotiations_per_second']:.0f} negotiations/s)")
+    print(f"Agreement rate:   {stats['agreement_rate']:.1%}")
+    if stats['avg_final_price'] is not None:
+        print(f"Avg final price:  ${stats['avg_final_price']:.2f}")
+    print(f"Avg rounds:       {stats['avg_rounds']:.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
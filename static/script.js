@@ -10,7 +10,6 @@ document.addEventListener('DOMContentLoaded', () => {
     
     let currentNegotiation = null;
     let loadingOverlay = null;
-    let currentStep = 0;
     
     // Create loading overlay
     function createLoadingOverlay() {
@@ -19,6 +18,7 @@ document.addEventListener('DOMContentLoaded', () => {
         loadingOverlay.innerHTML = `
             <div class="loading-spinner"></div>
             <div class="loading-text">Initializing Negotiation...</div>
+            <div class="loading-preview"></div>
             <div class="progress-bar">
                 <div class="progress-fill"></div>
             </div>
@@ -48,50 +48,69 @@ document.addEventListener('DOMContentLoaded', () => {
         document.body.appendChild(loadingOverlay);
     }
     
-    // Show loading with progress simulation
+    // Show loading overlay; progress is driven by events from the server
     function showLoading() {
         if (!loadingOverlay) createLoadingOverlay();
         
         loadingOverlay.classList.add('active');
-        currentStep = 0;
+        updateLoading(0, "Setting up intelligent agents...", 5);
+    }
+    
+    function updateLoading(currentStep, text, progress) {
+        if (!loadingOverlay) return;
+        
+        loadingOverlay.querySelector('.loading-text').textContent = text;
+        loadingOverlay.querySelector('.progress-fill').style.width = `${progress}%`;
+        
+        // Update step indicators
+        loadingOverlay.querySelectorAll('.loading-step').forEach((step, index) => {
+            step.classList.remove('active', 'completed');
+            if (index < currentStep) {
+                step.classList.add('completed');
+            } else if (index === currentStep) {
+                step.classList.add('active');
+            }
+        });
+    }
+    
+    // POST to a Server-Sent Events endpoint and call onEvent for each event
+    async function streamEvents(url, body, onEvent) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(body)
+        });
         
-        const steps = [
-            { text: "Setting up intelligent agents...", duration: 800 },
-            { text: "Configuring negotiation parameters...", duration: 600 },
-            { text: "Initiating multi-round negotiations...", duration: 1200 },
-            { text: "Analyzing strategic patterns...", duration: 900 },
-            { text: "Generating comprehensive report...", duration: 700 }
-        ];
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.error);
+        }
         
-        const progressFill = loadingOverlay.querySelector('.progress-fill');
-        const loadingText = loadingOverlay.querySelector('.loading-text');
-        const stepElements = loadingOverlay.querySelectorAll('.loading-step');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
         
-        function updateStep() {
-            if (currentStep < steps.length) {
-                // Update text
-                loadingText.textContent = steps[currentStep].text;
-                
-                // Update progress
-                const progress = ((currentStep + 1) / steps.length) * 100;
-                progressFill.style.width = `${progress}%`;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const chunk = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
                 
-                // Update step indicators
-                stepElements.forEach((step, index) => {
-                    step.classList.remove('active', 'completed');
-                    if (index < currentStep) {
-                        step.classList.add('completed');
-                    } else if (index === currentStep) {
-                        step.classList.add('active');
-                    }
+                let event = 'message';
+                let data = '';
+                chunk.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
                 });
-                
-                currentStep++;
-                setTimeout(updateStep, steps[currentStep - 1]?.duration || 500);
+                onEvent(event, data ? JSON.parse(data) : null);
             }
         }
-        
-        updateStep();
     }
     
     // Hide loading
@@ -171,43 +190,63 @@ document.addEventListener('DOMContentLoaded', () => {
         startBtn.classList.add('loading');
         
         try {
-            const response = await fetch('/start_auto_negotiation', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    item,
-                    buyer_max: buyerMax,
-                    seller_min: sellerMin
-                })
+            let totalRounds = 0;
+            let renderedRounds = 0;
+            const partialMessages = {};
+            currentNegotiation = null;
+            
+            await streamEvents('/start_auto_negotiation/stream', {
+                item,
+                buyer_max: buyerMax,
+                seller_min: sellerMin
+            }, (event, data) => {
+                switch (event) {
+                    case 'start':
+                        totalRounds = data.rounds;
+                        updateLoading(2, `Negotiating ${totalRounds} rounds...`, 20);
+                        break;
+                    case 'token':
+                        // Show the message that is being written right now
+                        partialMessages[data.index] = (partialMessages[data.index] || '') + data.text;
+                        if (loadingOverlay) {
+                            loadingOverlay.querySelector('.loading-preview').textContent =
+                                `${getAgentIcon(data.agent)} Round ${data.round}: ${partialMessages[data.index]}`;
+                        }
+                        break;
+                    case 'round':
+                        renderedRounds++;
+                        updateLoading(2, `Round ${renderedRounds} of ${totalRounds} ready...`, 20 + 60 * renderedRounds / totalRounds);
+                        break;
+                    case 'summary':
+                        updateLoading(3, "Analyzing strategic patterns...", 85);
+                        break;
+                    case 'analysis':
+                        updateLoading(4, "Generating comprehensive report...", 95);
+                        break;
+                    case 'done':
+                        currentNegotiation = data;
+                        break;
+                    case 'error':
+                        throw new Error(data.error);
+                }
             });
             
-            if (!response.ok) {
-                const error = await response.json();
-                showNotification(`Error: ${error.error}`, 'error');
+            hideLoading();
+            if (!currentNegotiation) {
+                showNotification('Negotiation ended unexpectedly. Please try again.', 'error');
                 return;
             }
-            
-            currentNegotiation = await response.json();
-            
-            // Simulate processing time for better UX
-            setTimeout(() => {
-                hideLoading();
-                displayNegotiationResults();
-                showNotification('Negotiation completed successfully!', 'success');
-            }, 1000);
+            displayNegotiationResults();
+            showNotification('Negotiation completed successfully!', 'success');
             
         } catch (error) {
             console.error('Error starting negotiation:', error);
             hideLoading();
-            showNotification('Error starting negotiation. Please check your connection.', 'error');
+            showNotification(`Error: ${error.message}`, 'error');
         } finally {
-            setTimeout(() => {
-                startBtn.textContent = 'Start Automatic Negotiation';
-                startBtn.disabled = false;
-                startBtn.classList.remove('loading');
-            }, 1000);
+            startBtn.textContent = 'Start Automatic Negotiation';
+            startBtn.disabled = false;
+            startBtn.classList.remove('loading');
         }
     });
     
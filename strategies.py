@@ -0,0 +1,130 @@
+"""Concession strategies for the buyer and seller agents.
+
+A strategy decides an agent's next move in price terms: accept the other
+side's price, or counter with a new one. The agent keeps its hard limits
+(it never counters past its reservation price and holds firm once the other
+side stays out of range) and writes the messages.
+
+Strategies are stateless and shared; what they remember between turns lives
+on the agent (`rounds_count`, `own_price`, `their_price`), so sessions can
+store it. The generic strategies concede from the agent's `target_price`
+towards its `reservation()`:
+
+- `default`: the original hard-coded schedules, one per side
+- `boulware`, `linear`, `conceder`: time-dependent, conceding late, steadily
+  or early over `horizon` turns (Faratin et al.)
+- `tit_for_tat`: concedes as much as the other side did on its last turn
+- `fixed_step`: concedes the same amount every turn
+
+Run `python tournament.py` to compare them over a range of scenarios.
+"""
+
+class Strategy:
+    name = None
+
+    def respond(self, agent, last_price):
+        """('accept', last_price) or ('counter', price) for the agent's next turn"""
+        raise NotImplementedError
+
+    def counter_or_accept(self, agent, last_price, price):
+        # Take any offer at least as good as what we would propose next
+        if agent.prefers(last_price, price):
+            return 'accept', last_price
+        return 'counter', price
+
+class DefaultSchedule(Strategy):
+    """The agents' original pricing rules, kept exactly (vector_sim.py replays them)"""
+    name = 'default'
+
+    def respond(self, agent, last_price):
+        if agent.role == 'buyer':
+            return self.buyer(agent, last_price)
+        return self.seller(agent, last_price)
+
+    def buyer(self, agent, last_price):
+        # Accept if it's a good deal (within 95% of max)
+        if last_price <= agent.max_price and last_price <= agent.max_price * 0.95:
+            return 'accept', last_price
+        if agent.rounds_count == 1:
+            # First counter - modest increase but stay under budget
+            return 'counter', min(last_price * 1.1, agent.max_price * 0.9)
+        if agent.rounds_count == 2:
+            # Second counter - bigger move but respect budget
+            return 'counter', min((last_price + agent.max_price * 0.9) / 2, agent.max_price * 0.95)
+        # Later rounds - smaller increments, approach max budget carefully
+        return 'counter', min(last_price * 1.03, agent.max_price * 0.98)
+
+    def seller(self, agent, last_price):
+        # Accept if it meets minimum requirement
+        if last_price >= agent.min_price:
+            return 'accept', last_price
+        if agent.rounds_count == 1:
+            # First response - start high but reasonable (105-110% of min)
+            return 'counter', agent.min_price * agent.rng.uniform(1.05, 1.10)
+        if agent.rounds_count == 2:
+            # Second response - make a meaningful concession but stay above min
+            return 'counter', max(agent.min_price * 1.02, (last_price + agent.min_price * 1.05) / 2)
+        # Later rounds - smaller concessions, approach minimum carefully
+        return 'counter', max(agent.min_price * 1.01, last_price * 0.98)
+
+class TimeDependent(Strategy):
+    """Concede (t / horizon) ** (1 / beta) of the way from target to reservation on turn t.
+
+    beta < 1 holds out until near the end (Boulware), beta > 1 gives ground
+    early (Conceder), beta == 1 is linear.
+    """
+    def __init__(self, name, beta, horizon=5):
+        self.name = name
+        self.beta = beta
+        self.horizon = horizon
+
+    def respond(self, agent, last_price):
+        progress = min(1.0, agent.rounds_count / self.horizon) ** (1 / self.beta)
+        price = agent.target_price + (agent.reservation() - agent.target_price) * progress
+        return self.counter_or_accept(agent, last_price, price)
+
+class TitForTat(Strategy):
+    """Match the other side's last concession; open with `opening_step` of the range"""
+    name = 'tit_for_tat'
+
+    def __init__(self, opening_step=0.1):
+        self.opening_step = opening_step
+
+    def respond(self, agent, last_price):
+        current = agent.own_price if agent.own_price is not None else agent.target_price
+        if agent.their_price is None:
+            step = abs(agent.reservation() - agent.target_price) * self.opening_step
+        else:
+            # Positive when the other side moved towards us
+            step = max(0.0, (agent.their_price - last_price) * agent.direction)
+        return self.counter_or_accept(agent, last_price, current + step * agent.direction)
+
+class FixedStep(Strategy):
+    """Concede `step` of the agent's limit price every turn"""
+    name = 'fixed_step'
+
+    def __init__(self, step=0.03):
+        self.step = step
+
+    def respond(self, agent, last_price):
+        current = agent.own_price if agent.own_price is not None else agent.target_price
+        price = current + agent.limit_price() * self.step * agent.direction
+        return self.counter_or_accept(agent, last_price, price)
+
+STRATEGIES = {strategy.name: strategy for strategy in (
+    DefaultSchedule(),
+    TimeDependent('boulware', 0.3),
+    TimeDependent('linear', 1.0),
+    TimeDependent('conceder', 3.0),
+    TitForTat(),
+    FixedStep()
+)}
+
+# Labels the agents carried before strategies were pluggable (stored sessions may have them)
+ALIASES = {'conservative': 'default', 'firm': 'default'}
+
+def get_strategy(name):
+    try:
+        return STRATEGIES[ALIASES.get(name, name)]
+    except KeyError:
+        raise ValueError(f"Unknown strategy '{name}' (choose from {', '.join(STRATEGIES)})")
@@ -0,0 +1,110 @@
+import json
+import re
+
+# A run of backslashes, possibly followed by an unfinished \uXXXX, at the end of a chunk
+TRAILING_ESCAPE = re.compile(r'(\\+)(u[0-9a-fA-F]{0,3})?$')
+# The first half of a surrogate pair whose second half hasn't arrived yet
+TRAILING_HIGH_SURROGATE = re.compile(r'(?<!\\)(\\\\)*\\u[dD][89abAB][0-9a-fA-F]{2}$')
+
+class MessageStreamParser:
+    """Incrementally parse a model reply that contains one JSON object.
+
+    feed() takes text as it arrives and returns whatever new characters of
+    the `field` string value became available, so a message can be shown
+    while it is still being generated. result() returns the parsed object
+    once its closing brace has been seen, or None.
+    """
+    def __init__(self, field='message'):
+        self.field = field
+        self.text = ''
+        self.pos = 0
+        self.start = None
+        self.end = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.expect_key = False
+        self.string_start = None
+        self.key = None
+        self.streaming = False
+        self.emitted = ''
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self.end is not None:
+            return ''
+
+        text = self.text
+        delta = ''
+        while self.pos < len(text):
+            c = text[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == '\\':
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+                    raw = text[self.string_start:self.pos]
+                    if self.streaming:
+                        delta += self.emit(raw)
+                        self.streaming = False
+                    elif self.depth == 1 and self.expect_key:
+                        self.key = decode_string(raw)
+            elif self.depth == 0:
+                if c == '{':
+                    self.start = self.pos
+                    self.depth = 1
+                    self.expect_key = True
+            elif c == '"':
+                self.in_string = True
+                self.string_start = self.pos + 1
+                self.streaming = self.depth == 1 and not self.expect_key and self.key == self.field
+            elif c in '{[':
+                self.depth += 1
+            elif c in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = self.pos + 1
+                    self.pos += 1
+                    break
+            elif self.depth == 1 and c == ':':
+                self.expect_key = False
+            elif self.depth == 1 and c == ',':
+                self.expect_key = True
+                self.key = None
+            self.pos += 1
+
+        if self.streaming:
+            delta += self.emit(text[self.string_start:self.pos])
+        return delta
+
+    def emit(self, raw):
+        """Decode as much of the field's raw text as is complete and return what is new"""
+        match = TRAILING_ESCAPE.search(raw)
+        if match and len(match.group(1)) % 2 == 1:
+            raw = raw[:match.end(1) - 1]
+        match = TRAILING_HIGH_SURROGATE.search(raw)
+        if match:
+            raw = raw[:-6]
+
+        decoded = decode_string(raw)
+        if decoded is None or not decoded.startswith(self.emitted):
+            return ''
+        delta = decoded[len(self.emitted):]
+        self.emitted = decoded
+        return delta
+
+    def result(self):
+        if self.end is None:
+            return None
+        try:
+            return json.loads(self.text[self.start:self.end], strict=False)
+        except ValueError:
+            return None
+
+def decode_string(raw):
+    try:
+        return json.loads(f'"{raw}"', strict=False)
+    except ValueError:
+        return None
@@ -0,0 +1,47 @@
+import app as negotiation_app
+
+START = {'item': 'Laptop', 'buyer_max': 1000, 'seller_min': 800, 'offline': True}
+
+def make_app(tmp_path, name, **config):
+    return negotiation_app.create_app(dict({'DATABASE': str(tmp_path / f'{name}.db'), 'OFFLINE_MODE': True}, **config))
+
+def test_apps_keep_their_own_services(tmp_path):
+    first = make_app(tmp_path, 'first')
+    second = make_app(tmp_path, 'second', REPORT_PROCESSES=0)
+    assert first.extensions['negotiation'] is not second.extensions['negotiation']
+
+    negotiation = first.test_client().post('/start_auto_negotiation', json=START).get_json()
+    assert negotiation['status'] == 'agreed' and negotiation['id'] == 1
+    assert len(first.test_client().get('/api/negotiations').get_json()['negotiations']) == 1
+    assert second.test_client().get('/api/negotiations').get_json()['negotiations'] == []
+
+    # Sessions live in the app that opened them
+    session_id = first.test_client().post('/start_negotiation', json=START).get_json()['session_id']
+    assert second.test_client().post('/continue_negotiation', json={'session_id': session_id}).status_code == 404
+    assert first.test_client().post('/continue_negotiation', json={'session_id': session_id}).status_code == 200
+
+def test_background_reports_save_to_their_own_app(tmp_path):
+    flask_app = make_app(tmp_path, 'jobs', REPORT_PROCESSES=0)
+    client = flask_app.test_client()
+    negotiation = client.post('/start_auto_negotiation', json=dict(START, report_mode='background')).get_json()
+    job = client.get(f"/jobs/{negotiation['report_job']}?wait=10").get_json()
+    assert job['status'] == 'done'
+    assert client.get(f"/download_report/{negotiation['id']}").status_code == 200
+
+def test_posted_negotiations_are_validated(tmp_path):
+    client = make_app(tmp_path, 'posted', REPORT_PROCESSES=0).test_client()
+    for route in ('/continue_negotiation', '/generate_pdf_report'):
+        response = client.post(route, json={})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == "Missing field 'negotiation'"
+        assert client.post(route, json={'negotiation': {'item': 'Laptop'}}).status_code == 400
+        assert client.post(route, json={'negotiation': 'Laptop'}).status_code == 400
+    broken = {'item': 'Laptop', 'buyer_max': 1000, 'seller_min': 800, 'status': 'ongoing', 'rounds': [{'price': 900}]}
+    assert client.post('/generate_pdf_report', json={'negotiation': broken}).get_json()['error'] == "Missing field 'agent'"
+
+    negotiation = client.post('/start_negotiation', json=START).get_json()
+    del negotiation['session_id']
+    response = client.post('/continue_negotiation', json={'negotiation': negotiation})
+    assert response.status_code == 200 and len(response.get_json()['rounds']) > 1
+    response = client.post('/generate_pdf_report', json={'negotiation': response.get_json()})
+    assert response.status_code == 200 and response.mimetype == 'application/pdf'
@@ -0,0 +1,45 @@
+import asyncio
+import json
+import pytest
+from asgi import NegotiationASGI
+
+def call(application, path, body):
+    """POST `body` to `path`; returns (status, body bytes)"""
+    sent = []
+    messages = [{'type': 'http.request', 'body': json.dumps(body).encode('utf-8'), 'more_body': False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()  # the client stays connected
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+             'headers': [(b'content-type', b'application/json')]}
+    asyncio.run(application(scope, receive, send))
+    return sent[0]['status'], b''.join(m.get('body', b'') for m in sent[1:])
+
+@pytest.fixture
+def application(tmp_path):
+    return NegotiationASGI({'DATABASE': str(tmp_path / 'asgi.db'), 'OFFLINE_MODE': True})
+
+@pytest.mark.parametrize('path', ['/start_auto_negotiation', '/start_auto_negotiation/stream'])
+def test_missing_fields_are_a_bad_request(application, path):
+    status, body = call(application, path, {'item': 'Laptop', 'seller_min': 800})
+    assert status == 400
+    assert json.loads(body) == {'error': "Missing field 'buyer_max'"}
+
+@pytest.mark.parametrize('path', ['/start_auto_negotiation', '/start_auto_negotiation/stream'])
+def test_malformed_bodies_are_a_bad_request(application, path):
+    assert call(application, path, {'item': 'Laptop', 'buyer_max': None, 'seller_min': 800})[0] == 400
+    assert call(application, path, ['Laptop'])[0] == 400
+
+def test_stream_sends_every_round_then_done(application):
+    status, body = call(application, '/start_auto_negotiation/stream',
+                        {'item': 'Laptop', 'buyer_max': 1000, 'seller_min': 800})
+    events = [line[len('event: '):] for line in body.decode('utf-8').splitlines() if line.startswith('event: ')]
+    assert status == 200
+    assert events[0] == 'start' and events[-1] == 'done'
+    assert 'round' in events
@@ -0,0 +1,48 @@
+import json
+from backends import CassetteBackend, CassetteMiss, StubBackend
+from batch import run_batch
+from engine import scenario_rng
+
+SCENARIOS = [json.dumps({'item': f'Camera {i}', 'buyer_max': 900 + 10 * i, 'seller_min': 700}) for i in range(4)]
+
+class CountingCassette(CassetteBackend):
+    misses = 0
+
+    def lookup(self, prompt):
+        try:
+            return super().lookup(prompt)
+        except CassetteMiss:
+            self.misses += 1
+            raise
+
+def negotiate(model, seed):
+    results = run_batch(SCENARIOS, model, workers=2, render_workers=2, seed=seed)
+    return {r['line']: r for r in results}
+
+def test_scenario_rng_repeats_per_scenario():
+    first = scenario_rng(7, 'Laptop', 1000.0, 800.0)
+    again = scenario_rng(7, 'Laptop', 1000.0, 800.0)
+    assert [first.random() for _ in range(3)] == [again.random() for _ in range(3)]
+    assert scenario_rng(8, 'Laptop', 1000.0, 800.0).random() != scenario_rng(7, 'Laptop', 1000.0, 800.0).random()
+    assert scenario_rng(None, 'Laptop', 1000.0, 800.0) is None
+
+def test_seeded_batch_replays_from_a_cassette(tmp_path):
+    path = str(tmp_path / 'replies.jsonl')
+    recorded = negotiate(CassetteBackend(path, StubBackend(latency=0), mode='record'), seed=7)
+
+    replay = CountingCassette(path)
+    replayed = negotiate(replay, seed=7)
+
+    # Every prompt was found, so no round fell back to its template text
+    assert replay.misses == 0
+    for line, negotiation in recorded.items():
+        assert [r['price'] for r in replayed[line]['rounds']] == [r['price'] for r in negotiation['rounds']]
+        assert replayed[line]['final_price'] == negotiation['final_price']
+    assert negotiate(CountingCassette(path), seed=7) == replayed
+
+def test_replay_with_another_seed_misses(tmp_path):
+    path = str(tmp_path / 'replies.jsonl')
+    negotiate(CassetteBackend(path, StubBackend(latency=0), mode='record'), seed=7)
+    replay = CountingCassette(path)
+    negotiate(replay, seed=8)
+    assert replay.misses > 0
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import time
+import batch
+from backends import TextResponse
+from batch import ConcurrencyLimitedModel, parse_scenario, run_batch
+from database import get_negotiation_history, init_db
+
+SCENARIOS = [json.dumps({'item': f'Laptop {i}', 'buyer_max': 1200, 'seller_min': 800}) for i in range(6)]
+
+def test_parse_scenario_reports_missing_fields():
+    try:
+        parse_scenario('{"item": "Laptop", "buyer_max": 10}')
+    except ValueError as e:
+        assert 'seller_min' in str(e)
+    else:
+        raise AssertionError('expected ValueError')
+
+def test_agreed_deals_are_saved_when_the_stream_closes_early(tmp_path):
+    db_path = str(tmp_path / 'batch.db')
+    init_db(db_path)
+    results = run_batch(SCENARIOS, None, workers=2, db_path=db_path, save_every=100)
+    first = next(results)
+    assert first['status'] == 'agreed'
+    results.close()  # what Flask does when the client disconnects
+
+    saved = get_negotiation_history(db_path, limit=100)
+    assert len(saved) >= 1
+    assert first['item'] in {n['item'] for n in saved}
+
+def test_closing_early_drops_queued_negotiations(monkeypatch):
+    started = []
+    negotiate = batch.run_negotiation
+
+    def slow_negotiation(item, *args, **kwargs):
+        started.append(item)
+        time.sleep(0.02)
+        return negotiate(item, *args, **kwargs)
+
+    monkeypatch.setattr(batch, 'run_negotiation', slow_negotiation)
+    results = run_batch(SCENARIOS * 5, None, workers=1)
+    next(results)
+    results.close()
+    # The first one and at most the one running when the stream closed; the rest of the window is cancelled
+    assert len(started) <= 2
+
+class SlowModel:
+    """Async model that records how many calls overlap"""
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return TextResponse(prompt)
+
+def test_concurrency_cap_works_on_every_loop():
+    model = SlowModel()
+    limited = ConcurrencyLimitedModel(model, 2)
+
+    async def calls():
+        return await asyncio.gather(*(limited.generate_content_async(f'call {i}') for i in range(6)))
+    for _ in range(2):  # a second loop used to hit the first one's semaphore
+        assert [r.text for r in asyncio.run(calls())] == [f'call {i}' for i in range(6)]
+    assert model.peak == 2
+
+def test_every_agreed_deal_is_saved(tmp_path):
+    db_path = str(tmp_path / 'batch.db')
+    init_db(db_path)
+    results = list(run_batch(SCENARIOS, None, workers=2, db_path=db_path, save_every=4))
+    agreed = [r for r in results if r.get('status') == 'agreed']
+    assert len(get_negotiation_history(db_path, limit=100)) == len(agreed)
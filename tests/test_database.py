@@ -0,0 +1,68 @@
+import sqlite3
+from backfill_rounds import backfill
+from database import MIGRATIONS, get_negotiation, get_negotiation_rounds, init_db, save_negotiation
+
+CONVERSATION = "Round 1 - Buyer: How about $800.00?\nRound 2 - Seller: I can do $900.00.\nRound 3 - Buyer: Deal at $900.00."
+
+def make_baseline_db(path):
+    """A database written before any migration: conversation blobs and a timestamp index"""
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE negotiations
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, item TEXT, buyer_max REAL, seller_min REAL,
+                     final_price REAL, conversation TEXT, timestamp DATETIME)''')
+    conn.execute('CREATE INDEX idx_negotiations_timestamp ON negotiations (timestamp)')
+    conn.execute('''INSERT INTO negotiations (item, buyer_max, seller_min, final_price, conversation, timestamp)
+                    VALUES ('Laptop', 1000, 800, 900, ?, '2024-01-01T00:00:00')''', (CONVERSATION,))
+    conn.commit()
+    conn.close()
+
+def schema(path):
+    conn = sqlite3.connect(path)
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(negotiations)')}
+    finally:
+        conn.close()
+    return version, indexes, columns
+
+def test_existing_database_is_migrated(tmp_path):
+    path = str(tmp_path / 'old.db')
+    make_baseline_db(path)
+    init_db(path)
+
+    version, indexes, columns = schema(path)
+    assert version == len(MIGRATIONS)
+    assert {'summary', 'analysis', 'conversation'} <= columns
+    assert 'idx_negotiations_timestamp_id' in indexes
+    assert 'idx_negotiations_timestamp' not in indexes
+
+    # Old rows keep their data and can be backfilled into rounds
+    assert get_negotiation(path, 1)['final_price'] == 900
+    assert backfill(path) == (1, 3)
+    assert [r['price'] for r in get_negotiation_rounds(path, 1)] == [800.0, 900.0, 900.0]
+
+def test_migrations_run_once(tmp_path):
+    path = str(tmp_path / 'new.db')
+    init_db(path)
+    negotiation_id = save_negotiation(path, 'Laptop', 1000, 800, 900,
+                                      [{'round': 1, 'agent': 'buyer', 'price': 900, 'message': 'Deal'}])
+    init_db(path)
+    assert schema(path)[0] == len(MIGRATIONS)
+    assert get_negotiation(path, negotiation_id)['rounds'][0]['message'] == 'Deal'
+
+def test_partly_migrated_database_gets_the_rest(tmp_path):
+    path = str(tmp_path / 'v2.db')
+    make_baseline_db(path)
+    conn = sqlite3.connect(path)
+    for statements in MIGRATIONS[:2]:
+        for statement in statements:
+            conn.execute(statement)
+    conn.execute('PRAGMA user_version = 2')
+    conn.commit()
+    conn.close()
+
+    init_db(path)
+    version, indexes, _ = schema(path)
+    assert version == len(MIGRATIONS)
+    assert 'idx_negotiations_timestamp_id' in indexes and 'idx_negotiations_timestamp' not in indexes
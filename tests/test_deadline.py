@@ -0,0 +1,64 @@
+import pytest
+from agents import BuyerAgent, render_turn
+from backends import StubBackend
+from deadline import CallEstimate, Deadline, DeadlineExceeded, call_seconds, timed_call
+from engine import render_rounds_batch, run_negotiation, run_offline_negotiation
+from llm_cache import CachedModel
+
+@pytest.fixture(autouse=True)
+def fresh_estimate():
+    call_seconds.reset()
+    yield
+    call_seconds.reset()
+
+def test_first_calls_run_without_an_estimate():
+    model = StubBackend(latency=0.02)
+    negotiation = run_negotiation('Laptop', 1000.0, 800.0, model, deadline=Deadline(0.9))
+    assert not any(r.get('degraded') for r in negotiation['rounds'])
+    assert call_seconds.seconds is not None and call_seconds.seconds < 0.9
+
+def test_a_seeded_estimate_over_the_budget_degrades():
+    call_seconds.reset(5.0)
+    negotiation = run_negotiation('Laptop', 1000.0, 800.0, StubBackend(latency=0), deadline=Deadline(0.9))
+    assert all(r.get('degraded') for r in negotiation['rounds'] if r['agent'] != 'mediator')
+
+def test_estimate_wears_off_without_samples():
+    estimate = CallEstimate(half_life=30.0)
+    assert estimate.seconds is None
+    estimate.observe(8.0)
+    assert estimate.seconds == pytest.approx(8.0, rel=1e-3)
+    estimate.updated -= 60  # two half-lives without a call
+    assert estimate.seconds == pytest.approx(2.0, rel=1e-3)
+    estimate.observe(1.0)
+    assert estimate.seconds == pytest.approx(2.0 + 0.2 * (1.0 - 2.0), rel=1e-3)
+
+def test_deadline_allows_calls_again_once_a_slow_spell_wears_off():
+    call_seconds.observe(5.0)
+    assert not Deadline(1.0).allows_call()
+    call_seconds.updated -= 300
+    assert Deadline(1.0).allows_call()
+
+def test_calls_cut_off_by_the_deadline_are_timed():
+    with pytest.raises(DeadlineExceeded):
+        with timed_call():
+            raise DeadlineExceeded('too slow')
+    assert call_seconds.seconds is not None
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_cache_hits_are_not_timed(stream):
+    model = CachedModel(StubBackend(latency=0.05))
+    plan = BuyerAgent(None, 1000.0).plan_initial_offer('Laptop')
+    on_token = (lambda piece: None) if stream else None
+    render_turn(model, plan, on_token=on_token)
+    model_seconds = call_seconds.seconds
+    assert model_seconds >= 0.04
+    for _ in range(5):
+        render_turn(model, plan, on_token=on_token)
+    assert model.stats()['hits'] == 5
+    assert call_seconds.seconds == pytest.approx(model_seconds, rel=0.01)
+
+def test_batch_render_calls_are_timed():
+    turns = run_offline_negotiation('Laptop', 1000.0, 800.0)['rounds']
+    plan_turns = [dict(t, prompt='Write it', fallback=t['message'], label='turn', intent='counter') for t in turns]
+    render_rounds_batch(StubBackend(latency=0), 'Laptop', plan_turns)
+    assert call_seconds.seconds is not None
@@ -0,0 +1,56 @@
+import asyncio
+from aio import runner
+from agents import BuyerAgent, MediatorAgent, SellerAgent, render_turn, render_turn_async
+from backends import StubBackend, TextResponse
+from engine import (iter_negotiation, plan_negotiation, render_rounds, run_negotiation, run_negotiation_async,
+                    run_offline_negotiation, scenario_rng)
+
+class PeakModel:
+    """Async model that records how many calls overlap"""
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return TextResponse('{"message": "Fine by me."}')
+
+def test_sync_render_turn_runs_the_async_core():
+    plan = BuyerAgent(None, 1000.0, scenario_rng(1, 'Laptop')).plan_initial_offer('Laptop')
+    sync = render_turn(StubBackend(latency=0), plan)
+    direct = runner.run(render_turn_async(StubBackend(latency=0), plan))
+    assert sync == direct
+    assert sync['price'] == plan['price']
+
+def test_streamed_tokens_reach_sync_callers():
+    plan = BuyerAgent(None, 1000.0).plan_initial_offer('Laptop')
+    pieces = []
+    result = render_turn(StubBackend(latency=0, chunk_size=8), plan, on_token=pieces.append)
+    assert pieces and ''.join(pieces) == result['message']
+
+def test_sync_and_async_negotiations_match():
+    args = ('Laptop', 1000.0, 800.0)
+    sync = run_negotiation(*args, StubBackend(latency=0), rng=scenario_rng(3, *args))
+    direct = runner.run(run_negotiation_async(*args, StubBackend(latency=0), rng=scenario_rng(3, *args)))
+    assert sync == direct
+
+def test_iter_negotiation_yields_start_then_every_round():
+    events = list(iter_negotiation('Laptop', 1000.0, 800.0, StubBackend(latency=0)))
+    assert events[0][0] == 'start'
+    rounds = [payload for event, payload in events if event == 'round']
+    assert sorted(r['index'] for r in rounds) == list(range(len(events[0][1]['rounds'])))
+
+def test_max_workers_caps_concurrent_renders():
+    plan = plan_negotiation('Laptop', BuyerAgent(None, 1000.0), SellerAgent(None, 800.0), MediatorAgent(None))
+    model = PeakModel()
+    rounds = render_rounds(model, plan['turns'], max_workers=2)
+    assert model.peak == 2
+    assert all(r['message'] == 'Fine by me.' for r in rounds if r['agent'] != 'mediator')
+
+def test_offline_negotiation_uses_templates():
+    negotiation = run_negotiation('Laptop', 1000.0, 800.0, None, rng=scenario_rng(5, 'Laptop'))
+    offline = run_offline_negotiation('Laptop', 1000.0, 800.0, scenario_rng(5, 'Laptop'))
+    assert negotiation == offline
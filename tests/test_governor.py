@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import pytest
+from backends import StubError, TextResponse
+from governor import CircuitBreaker, CircuitOpenError, GovernedModel, Slots
+
+class FlakyModel:
+    """Fails while `failing` is set, counting the calls that reached it"""
+    def __init__(self, error=StubError):
+        self.error = error
+        self.failing = True
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.failing:
+            raise self.error('upstream down')
+        return TextResponse('{"message": "Fine."}')
+
+def wait_out(breaker):
+    breaker.opened_at -= breaker.reset_after
+
+def test_breaker_goes_closed_open_half_open_closed():
+    breaker = CircuitBreaker(threshold=2, reset_after=30.0)
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open' and not breaker.allow()
+
+    wait_out(breaker)
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()  # one trial at a time
+    breaker.record(True)
+    assert breaker.state == 'closed' and breaker.failures == 0
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(threshold=1, reset_after=30.0)
+    breaker.record(False)
+    wait_out(breaker)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'open' and not breaker.allow()
+
+def test_open_circuit_skips_the_model():
+    model = FlakyModel()
+    governed = GovernedModel(model, retries=0, breaker_threshold=2, breaker_reset=30.0)
+    for _ in range(2):
+        with pytest.raises(StubError):
+            governed.generate_content('Hi')
+    with pytest.raises(CircuitOpenError):
+        governed.generate_content('Hi')
+    assert model.calls == 2
+
+    model.failing = False
+    wait_out(governed.breaker)
+    assert governed.generate_content('Hi').text == '{"message": "Fine."}'
+    assert governed.stats() == {'circuit': 'closed', 'consecutive_failures': 0}
+
+def test_caller_errors_say_nothing_about_the_upstream():
+    model = FlakyModel()
+    governed = GovernedModel(model, retries=0, breaker_threshold=2, breaker_reset=30.0)
+    with pytest.raises(StubError):
+        governed.generate_content('Hi')
+    model.error = ValueError
+    with pytest.raises(ValueError):
+        governed.generate_content('Hi')
+    assert governed.breaker.failures == 1  # not reset by the bad request
+
+    model.error = StubError
+    with pytest.raises(StubError):
+        governed.generate_content('Hi')
+    assert governed.breaker.state == 'open'
+
+    # A bad request as the half-open trial neither closes nor reopens the circuit
+    wait_out(governed.breaker)
+    model.error = ValueError
+    with pytest.raises(ValueError):
+        governed.generate_content('Hi')
+    assert governed.breaker.state == 'half_open'
+    assert governed.breaker.allow()  # and the next trial may go
+
+def test_caller_errors_leave_the_circuit_closed():
+    model = FlakyModel(error=ValueError)
+    governed = GovernedModel(model, retries=2, breaker_threshold=1)
+    with pytest.raises(ValueError):
+        governed.generate_content('Hi')
+    assert model.calls == 1
+    assert governed.breaker.state == 'closed'
+
+class SlowModel:
+    """Async model that records how many calls overlap"""
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return TextResponse(prompt)
+
+def test_waiters_get_slots_in_arrival_order():
+    async def scenario():
+        slots = Slots(1)
+        assert await slots.acquire_async()
+        served = []
+
+        async def wait(name):
+            assert await slots.acquire_async(1.0)
+            served.append(name)
+            slots.release()
+
+        waiters = []
+        for name in 'abc':
+            waiters.append(asyncio.create_task(wait(name)))
+            await asyncio.sleep(0)
+        slots.release()
+        await asyncio.gather(*waiters)
+        return served, slots.free
+    assert asyncio.run(scenario()) == (['a', 'b', 'c'], 1)
+
+def test_threads_and_coroutines_share_slots():
+    slots = Slots(1)
+    assert slots.acquire()
+    got = []
+    thread = threading.Thread(target=lambda: got.append(slots.acquire(1.0)))
+    thread.start()
+
+    async def release_then_wait():
+        await asyncio.sleep(0.02)
+        slots.release()  # goes to the thread, which was first
+        return await slots.acquire_async(0.05)
+    assert asyncio.run(release_then_wait()) is False
+    thread.join()
+    assert got == [True]
+    slots.release()
+    assert slots.free == 1 and not slots.waiters
+
+def test_cancelled_waiters_leave_no_slot_behind():
+    async def scenario():
+        slots = Slots(1)
+        await slots.acquire_async()
+        waiter = asyncio.create_task(slots.acquire_async())
+        await asyncio.sleep(0)
+        slots.release()  # granted to the waiter...
+        waiter.cancel()  # ...which goes away before it runs
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return slots.free, len(slots.waiters)
+    assert asyncio.run(scenario()) == (1, 0)
+
+def test_async_calls_respect_the_concurrency_cap():
+    model = SlowModel()
+    governed = GovernedModel(model, max_concurrency=2, max_wait=5.0)
+
+    async def scenario():
+        return await asyncio.gather(*(governed.generate_content_async(f'call {i}') for i in range(10)))
+    replies = asyncio.run(scenario())
+    assert [r.text for r in replies] == [f'call {i}' for i in range(10)]
+    assert model.peak == 2
+    assert governed.slots.free == 2
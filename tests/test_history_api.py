@@ -0,0 +1,53 @@
+import pytest
+import app as negotiation_app
+from database import save_negotiation, save_negotiations
+
+ROUNDS = [{'round': 1, 'agent': 'buyer', 'price': 900.0, 'message': 'Deal'}]
+
+@pytest.fixture
+def client(tmp_path):
+    flask_app = negotiation_app.create_app({'DATABASE': str(tmp_path / 'history.db'), 'OFFLINE_MODE': True})
+    # One transaction, so every row shares a timestamp and only the id orders them
+    save_negotiations(flask_app.config['DATABASE'],
+                      [(f'Item {i}', 1000.0, 800.0, 850.0 + i, ROUNDS) for i in range(5)])
+    return flask_app.test_client()
+
+def test_cursor_walks_every_page_once(client):
+    seen, cursor = [], None
+    while True:
+        page = client.get('/api/negotiations', query_string={'limit': 2, **({'cursor': cursor} if cursor else {})}).get_json()
+        seen.extend(n['item'] for n in page['negotiations'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [f'Item {i}' for i in reversed(range(5))]
+
+def test_filters_apply_across_pages(client):
+    first = client.get('/api/negotiations?limit=1&min_price=851&max_price=853').get_json()
+    second = client.get('/api/negotiations', query_string={'limit': 1, 'min_price': 851, 'max_price': 853,
+                                                           'cursor': first['next_cursor']}).get_json()
+    assert [n['final_price'] for n in first['negotiations'] + second['negotiations']] == [853.0, 852.0]
+
+def test_etag_round_trip(client):
+    first = client.get('/api/negotiations')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/api/negotiations', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+    unchanged = client.get('/api/negotiations', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert unchanged.status_code == 304
+
+    # A save changes the ETag and the next page read sees it
+    save_negotiation(client.application.config['DATABASE'], 'Camera', 600.0, 400.0, 500.0, ROUNDS)
+    fresh = client.get('/api/negotiations', headers={'If-None-Match': first.headers['ETag']})
+    assert fresh.status_code == 200
+    assert fresh.headers['ETag'] != first.headers['ETag']
+    assert fresh.get_json()['negotiations'][0]['item'] == 'Camera'
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=x', 'min_price=cheap', 'cursor=not-a-cursor'])
+def test_bad_queries_are_rejected(client, query):
+    response = client.get('/api/negotiations?' + query)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
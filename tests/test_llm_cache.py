@@ -0,0 +1,73 @@
+from aio import runner
+from backends import TextResponse
+from database import get_pool
+from llm_cache import CachedModel, LRUCache, SQLiteCache, extract_prices, fill_prices
+
+class EchoModel:
+    """Quotes the prompt's first price back, counting calls"""
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        price = prompt.split('$')[1].split()[0]
+        return TextResponse(f'{{"message": "I can do ${price} (${float(price):,.2f} all in)."}}')
+
+def test_placeholders_round_trip():
+    prices = ['1250.00', '800.50']
+    template = extract_prices('Offer $1,250.00 or 1250.00 against 800.50, not 11250.00.', prices)
+    assert template == 'Offer ${{P0,}} or {{P0}} against {{P1}}, not 11250.00.'
+    assert fill_prices(template, ['1300.00', '790.25']) == 'Offer $1,300.00 or 1300.00 against 790.25, not 11250.00.'
+
+def test_hit_fills_in_the_new_prompts_prices():
+    model = EchoModel()
+    cached = CachedModel(model, memory=LRUCache(), price_bucket=1.0)
+    first = cached.generate_content('Counter at $1250.00 now')
+    hit = cached.generate_content('Counter at   $1250.40 now')
+    assert model.calls == 1
+    assert first.text == '{"message": "I can do $1250.00 ($1,250.00 all in)."}'
+    assert hit.text == '{"message": "I can do $1250.40 ($1,250.40 all in)."}'
+    assert cached.stats()['hits'] == 1 and cached.stats()['misses'] == 1
+
+def test_prices_in_another_bucket_miss():
+    model = EchoModel()
+    cached = CachedModel(model, price_bucket=1.0)
+    cached.generate_content('Counter at $1250.00 now')
+    cached.generate_content('Counter at $1252.00 now')
+    assert model.calls == 2
+
+def test_disk_tier_survives_a_new_model(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    CachedModel(EchoModel(), disk=SQLiteCache(path)).generate_content('Counter at $900.00 now')
+    model = EchoModel()
+    cached = CachedModel(model, disk=SQLiteCache(path))
+    assert cached.generate_content('Counter at $900.20 now').text == '{"message": "I can do $900.20 ($900.20 all in)."}'
+    assert model.calls == 0
+    assert cached.stats()['disk_hits'] == 1
+
+def test_async_calls_share_the_cache():
+    model = EchoModel()
+    cached = CachedModel(model)
+    runner.run(cached.generate_content_async('Counter at $700.00 now'))
+    hit = runner.run(cached.generate_content_async('Counter at $700.10 now'))
+    assert model.calls == 1
+    assert hit.text == '{"message": "I can do $700.10 ($700.10 all in)."}'
+
+def test_disk_tier_evicts_the_oldest_in_batches(tmp_path):
+    disk = SQLiteCache(str(tmp_path / 'cache.db'), max_entries=5, evict_every=4)
+    for i in range(7):
+        disk.set(f'key {i}', f'value {i}')
+    # No eviction pass yet since the 4th write; everything is still there
+    assert disk.get('key 0') == 'value 0'
+    disk.set('key 7', 'value 7')  # the 8th write trims back to 5
+    assert [disk.get(f'key {i}') for i in range(8)] == [None] * 3 + [f'value {i}' for i in range(3, 8)]
+
+def test_disk_tier_expires_entries(tmp_path):
+    disk = SQLiteCache(str(tmp_path / 'cache.db'), ttl=60, evict_every=2)
+    disk.set('old', 'stale')
+    with get_pool(disk.db_path).connection() as conn:
+        conn.execute("UPDATE llm_cache SET stored_at = stored_at - 120 WHERE key = 'old'")
+    assert disk.get('old') is None
+    disk.set('new', 'fresh')  # eviction pass
+    with get_pool(disk.db_path).connection() as conn:
+        assert conn.execute('SELECT key FROM llm_cache').fetchall() == [('new',)]
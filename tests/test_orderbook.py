@@ -0,0 +1,69 @@
+import pytest
+import orderbook
+from engine import scenario_rng
+from orderbook import OrderBook, run_order_book
+
+def test_book_ranks_bids_highest_and_asks_lowest():
+    bids, asks = OrderBook(1), OrderBook(-1)
+    for participant, price in enumerate([900.0, 950.0, 925.0]):
+        bids.post(participant, price)
+        asks.post(participant, price)
+    assert bids.best() == (1, 950.0)
+    assert asks.best() == (0, 900.0)
+    bids.remove(1)
+    assert bids.best() == (2, 925.0)
+    bids.post_many({0: 930.0, 2: 925.0})
+    assert bids.best() == (0, 930.0)
+
+def test_equal_prices_keep_the_earlier_offer_first():
+    book = OrderBook(1)
+    book.post_many({0: 900.0, 1: 880.0})
+    book.post_many({0: 900.0, 1: 900.0})  # 0 didn't move, so it was there first
+    assert book.best() == (0, 900.0)
+    assert len(book.heap) <= 2 * len(book) + 64
+
+def test_buyers_side_goes_to_the_highest_bidder():
+    negotiation = run_order_book('Laptop', 'buyers', 800.0, [700.0, 950.0, 1200.0, 850.0, 900.0],
+                                 rng=scenario_rng(1, 'Laptop'))
+    assert negotiation['status'] == 'agreed'
+    assert negotiation['winner'] == 2 and negotiation['buyer_max'] == 1200.0
+    assert 800.0 <= negotiation['final_price'] <= 1200.0
+    # The 700 bidder can never meet the seller's minimum
+    assert negotiation['pruned'] >= 1 and negotiation['participants'] == 5
+
+def test_sellers_side_goes_to_the_lowest_ask():
+    negotiation = run_order_book('Laptop', 'sellers', 1000.0, [1100.0, 850.0, 700.0, 950.0, 900.0],
+                                 rng=scenario_rng(1, 'Laptop'))
+    assert negotiation['status'] == 'agreed'
+    assert negotiation['winner'] == 2 and negotiation['seller_min'] == 700.0
+    assert 700.0 <= negotiation['final_price'] <= 1000.0
+    assert negotiation['pruned'] == 4
+
+def test_no_competitor_can_meet_the_limit():
+    negotiation = run_order_book('Laptop', 'buyers', 800.0, [600.0, 700.0])
+    assert negotiation['status'] == 'failed'
+    assert negotiation['reason'] == 'No competitor can meet the limit'
+    assert negotiation['pruned'] == 2 and negotiation['winner'] is None
+
+# Limits close to the principal's, so the book runs several rounds
+@pytest.mark.parametrize('side, limit, lowest', [('buyers', 1000.0, 900.0), ('sellers', 800.0, 700.0)])
+def test_standing_offers_never_get_worse(monkeypatch, side, limit, lowest):
+    books = []
+    post_many = OrderBook.post_many
+
+    def record(book, offers):
+        if book not in books:
+            books.append(book)
+            book.history = {}
+        for participant, price in offers.items():
+            book.history.setdefault(participant, []).append(price)
+        post_many(book, offers)
+
+    monkeypatch.setattr(orderbook.OrderBook, 'post_many', record)
+    limits = [lowest + 5 * i for i in range(40)]
+    for seed in range(5):
+        run_order_book('Laptop', side, limit, limits, rng=scenario_rng(seed, 'Laptop'))
+    assert any(len(prices) > 1 for book in books for prices in book.history.values())
+    for book in books:
+        for prices in book.history.values():
+            assert all(book.direction * (later - earlier) >= 0 for earlier, later in zip(prices, prices[1:]))
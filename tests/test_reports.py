@@ -0,0 +1,70 @@
+import pytest
+import app as negotiation_app
+from database import save_negotiation
+from reports import ByteSizeLRU, ReportService, report_key
+
+ROUNDS = [
+    {'round': 1, 'agent': 'buyer', 'price': 850.0, 'message': 'How about $850?'},
+    {'round': 2, 'agent': 'seller', 'price': 900.0, 'message': 'Deal at $900.'}
+]
+
+def negotiation(**changes):
+    return dict({'item': 'Laptop', 'buyer_max': 1000.0, 'seller_min': 800.0, 'status': 'agreed',
+                 'final_price': 900.0, 'rounds': ROUNDS}, **changes)
+
+def test_cache_is_bounded_by_bytes():
+    cache = ByteSizeLRU(10)
+    cache.set('a', b'1234')
+    cache.set('b', b'1234')
+    cache.get('a')  # 'b' is now the least recently used
+    cache.set('c', b'1234')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1234' and cache.get('c') == b'1234'
+    assert cache.size == 8
+    cache.set('huge', b'x' * 11)
+    assert cache.get('huge') is None and len(cache) == 2
+
+def test_same_content_renders_once():
+    service = ReportService(processes=0)
+    first = service.render(negotiation())
+    assert first.startswith(b'%PDF')
+    # Fields that aren't in the report don't change its key
+    assert service.render(negotiation(id=7, session_id='abc')) == first
+    service.render(negotiation(final_price=950.0))
+    assert service.stats()['hits'] == 1 and service.stats()['renders'] == 2
+
+def test_evicted_reports_are_rendered_again():
+    service = ReportService(processes=0, cache_bytes=1)
+    service.render(negotiation())
+    service.render(negotiation())
+    assert service.stats()['renders'] == 2 and service.stats()['cached_reports'] == 0
+
+def test_render_processes_are_spawned():
+    service = ReportService(processes=1)
+    try:
+        assert service.render(negotiation()).startswith(b'%PDF')
+        assert service.pool._mp_context.get_start_method() == 'spawn'
+    finally:
+        service.pool.shutdown()
+
+def test_report_key_ignores_round_extras():
+    extras = [dict(r, index=i, degraded=False) for i, r in enumerate(ROUNDS)]
+    assert report_key(negotiation(rounds=extras)) == report_key(negotiation())
+
+@pytest.fixture
+def client(tmp_path):
+    flask_app = negotiation_app.create_app({'DATABASE': str(tmp_path / 'reports.db'), 'OFFLINE_MODE': True,
+                                            'REPORT_PROCESSES': 0})
+    return flask_app.test_client()
+
+def test_download_report(client):
+    negotiation_id = save_negotiation(client.application.config['DATABASE'], 'Laptop', 1000.0, 800.0, 900.0, ROUNDS)
+    response = client.get(f'/download_report/{negotiation_id}')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert f'negotiation_report_{negotiation_id}.pdf' in response.headers['Content-Disposition']
+    assert client.get(f'/download_report/{negotiation_id}').data == response.data
+    assert client.get('/reports/stats').get_json()['hits'] == 1
+
+def test_download_unknown_report(client):
+    assert client.get('/download_report/999').status_code == 404
@@ -0,0 +1,44 @@
+import threading
+import time
+from sessions import NegotiationSession, SessionStore, SQLiteSessionTier
+
+class SlowTier(SQLiteSessionTier):
+    """Widens the window between reading a session and caching it"""
+    def get(self, session_id):
+        time.sleep(0.05)
+        return super().get(session_id)
+
+def test_session_round_trips_through_the_disk_tier(tmp_path):
+    disk = SQLiteSessionTier(str(tmp_path / 'sessions.db'))
+    store = SessionStore(None, disk=disk)
+    session = store.create('Laptop', 1000.0, 800.0)
+    session.buyer.rounds_count = 3
+    session.rounds.append({'round': 1, 'agent': 'buyer', 'price': 700.0, 'message': 'Hi'})
+    store.save(session)
+
+    restored = SessionStore(None, disk=disk).get(session.session_id)
+    assert restored.buyer.rounds_count == 3
+    assert restored.rounds == session.rounds
+    assert restored.state.last_offer() == (700.0, 'Hi')
+
+def test_concurrent_restores_share_one_session(tmp_path):
+    db_path = str(tmp_path / 'sessions.db')
+    writer = SessionStore(None, disk=SQLiteSessionTier(db_path))
+    session_id = writer.create('Laptop', 1000.0, 800.0).session_id
+    writer.save(writer.get(session_id))
+
+    store = SessionStore(None, disk=SlowTier(db_path))
+    found = []
+    threads = [threading.Thread(target=lambda: found.append(store.get(session_id))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(found) == 8
+    assert all(isinstance(s, NegotiationSession) for s in found)
+    assert len({id(s) for s in found}) == 1
+
+def test_unknown_session_is_none(tmp_path):
+    store = SessionStore(None, disk=SQLiteSessionTier(str(tmp_path / 'sessions.db')))
+    assert store.get('missing') is None
@@ -0,0 +1,48 @@
+import app as negotiation_app
+from engine import NegotiationState
+
+class FixedSeller:
+    """Seller that always answers with the same counter-offer"""
+    model = None
+
+    def __init__(self, price, intent='counter'):
+        self.price = price
+        self.intent = intent
+
+    def plan_response(self, item, last_price, last_message):
+        return {'agent': 'seller', 'intent': self.intent, 'price': self.price,
+                'fallback': f'I can do ${self.price:.2f}.'}
+
+def rounds(*prices):
+    agents = ['buyer', 'seller']
+    return [{'agent': agents[i % 2], 'price': price, 'message': 'Offer'} for i, price in enumerate(prices)]
+
+def test_converging_inside_the_limits_agrees_on_the_midpoint():
+    state = NegotiationState(1000.0, 800.0, rounds(895.0, 905.0))
+    assert state.agreed_price() == 900.0
+    assert state.rejected_price() == 900.0
+
+def test_converging_below_the_seller_minimum_is_rejected():
+    state = NegotiationState(1000.0, 800.0, rounds(790.0, 805.0))
+    assert state.agreed_price() is None
+    assert state.rejected_price() == 797.5
+
+def test_accepting_outside_the_limits_is_rejected():
+    state = NegotiationState(1000.0, 800.0, rounds(700.0, 780.0))
+    assert state.agreed_price(accepted=True) is None
+    assert state.rejected_price(accepted=True) == 780.0
+
+def test_far_apart_sides_have_nothing_to_reject():
+    state = NegotiationState(1000.0, 800.0, rounds(600.0, 950.0))
+    assert state.rejected_price() is None
+
+def test_step_negotiation_fails_with_a_reason(tmp_path):
+    flask_app = negotiation_app.create_app({'DATABASE': str(tmp_path / 'steps.db'), 'OFFLINE_MODE': True})
+    negotiation = {'item': 'Laptop', 'buyer_max': 1000.0, 'seller_min': 800.0,
+                   'rounds': rounds(790.0), 'status': 'ongoing'}
+    state = NegotiationState(1000.0, 800.0, negotiation['rounds'])
+    with flask_app.app_context():
+        negotiation_app.advance_negotiation(negotiation, state, None, FixedSeller(805.0), None)
+    assert negotiation['status'] == 'failed'
+    assert negotiation['reason'] == 'Final price $797.50 outside acceptable range'
+    assert 'final_price' not in negotiation
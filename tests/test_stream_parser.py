@@ -0,0 +1,64 @@
+import json
+import pytest
+from stream_parser import MessageStreamParser
+
+REPLY = {'message': 'Café deal: "$950.00"\nTake it \\ or leave it \U0001F600', 'price': 950.0}
+
+def feed_in_chunks(text, size):
+    parser = MessageStreamParser()
+    pieces = [parser.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    return parser, pieces
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 7, 64])
+def test_chunks_rebuild_the_message(size):
+    text = 'Here you go: ' + json.dumps(REPLY) + ' Hope that helps.'
+    parser, pieces = feed_in_chunks(text, size)
+    assert ''.join(pieces) == REPLY['message']
+    assert parser.result() == REPLY
+
+@pytest.mark.parametrize('size', [1, 2, 3, 4, 5, 6, 7])
+def test_escapes_split_at_a_chunk_boundary(size):
+    # ensure_ascii gives \uXXXX escapes and a surrogate pair for the emoji
+    text = json.dumps(REPLY, ensure_ascii=True)
+    parser, pieces = feed_in_chunks(text, size)
+    assert ''.join(pieces) == REPLY['message']
+    # Half a surrogate pair is never emitted on its own
+    assert not any('\ud800' <= c <= '\udfff' for piece in pieces for c in piece)
+    assert parser.result() == REPLY
+
+def test_field_split_from_its_key():
+    parser = MessageStreamParser()
+    assert parser.feed('{"mess') == ''
+    assert parser.feed('age"') == ''
+    assert parser.feed(' : "Hel') == 'Hel'
+    assert parser.feed('lo"') == 'lo'
+    assert parser.result() is None
+    assert parser.feed(', "price": 1}') == ''
+    assert parser.result() == {'message': 'Hello', 'price': 1}
+
+def test_only_the_top_level_field_streams():
+    parser = MessageStreamParser()
+    text = '{"meta": {"message": "nested"}, "note": "message", "message": "top"}'
+    assert ''.join(parser.feed(c) for c in text) == 'top'
+    assert parser.result()['message'] == 'top'
+
+def test_text_after_the_object_is_ignored():
+    parser = MessageStreamParser()
+    parser.feed('{"message": "Hi"}')
+    assert parser.feed(' {"message": "again"}') == ''
+    assert parser.result() == {'message': 'Hi'}
+
+def test_truncated_reply_has_no_result():
+    parser = MessageStreamParser()
+    assert parser.feed('{"message": "I can do $9') == 'I can do $9'
+    assert parser.result() is None
+
+def test_malformed_reply_has_no_result():
+    parser = MessageStreamParser()
+    assert parser.feed('{"message": "Fine", "price": 9x0}') == 'Fine'
+    assert parser.result() is None
+
+def test_reply_without_json():
+    parser = MessageStreamParser()
+    assert parser.feed('Sorry, I cannot help with that.') == ''
+    assert parser.result() is None
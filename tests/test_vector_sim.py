@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+from vector_sim import main, make_scenarios, simulate_scalar, simulate_vectorized, verify
+
+@pytest.mark.parametrize('seed', [0, 11])
+def test_vectorized_engine_matches_the_agents(seed):
+    buyer_max, seller_min, seeds = make_scenarios(300, (800.0, 1200.0), (600.0, 1000.0), seed)
+    assert len(verify(buyer_max, seller_min, seeds)) == 0
+
+def test_no_overlap_never_agrees():
+    buyer_max, _, seeds = make_scenarios(50, (800.0, 900.0), (600.0, 700.0), 3)
+    seller_min = buyer_max + 100.0
+    vector = simulate_vectorized(buyer_max, seller_min, seeds)
+    scalar = simulate_scalar(buyer_max, seller_min, seeds)
+    assert not vector['agreed'].any() and not scalar['agreed'].any()
+    assert np.isnan(vector['final_price']).all()
+
+def test_verify_main_reports_no_mismatches(capsys):
+    assert not main(['--scenarios', '200', '--verify', '200'])
+    assert 'Verified 200 scenarios against the scalar agents: 0 mismatches' in capsys.readouterr().out
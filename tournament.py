@@ -0,0 +1,145 @@
+"""Strategy tournament.
+
+Plays every buyer strategy against every seller strategy (see strategies.py)
+over the same random scenarios. Negotiations run offline: pricing rules and
+template text only, no model calls. Blocks of scenarios are spread over a
+process pool, so a tournament uses every core. Prints a leaderboard per side,
+ranked by the surplus a strategy earns per scenario, deals or not.
+
+    python tournament.py --scenarios 20000
+    python tournament.py --buyers boulware,conceder,default --sellers default --json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from agents import BuyerAgent, SellerAgent, MediatorAgent
+from engine import plan_negotiation
+from strategies import STRATEGIES, get_strategy
+
+def scenario(seed, index, buyer_range, seller_range):
+    """Limits and agent randomness for scenario `index`, the same for every pairing"""
+    rng = random.Random(seed * 1000003 + index)
+    return rng.uniform(*buyer_range), rng.uniform(*seller_range), rng
+
+def play(task):
+    """Play one block of scenarios for one pairing, returning the pairing and its totals"""
+    buyer, seller, start, count, seed, buyer_range, seller_range = task
+    totals = {'scenarios': 0, 'agreed': 0, 'buyer_surplus': 0.0, 'seller_surplus': 0.0, 'rounds': 0}
+    for index in range(start, start + count):
+        buyer_max, seller_min, rng = scenario(seed, index, buyer_range, seller_range)
+        plan = plan_negotiation('item', BuyerAgent(None, buyer_max, rng, buyer),
+                                SellerAgent(None, seller_min, rng, seller), MediatorAgent(None))
+        totals['scenarios'] += 1
+        totals['rounds'] += plan['turns'][-1]['round']
+        if plan['status'] == 'agreed':
+            totals['agreed'] += 1
+            totals['buyer_surplus'] += buyer_max - plan['final_price']
+            totals['seller_surplus'] += plan['final_price'] - seller_min
+    return buyer, seller, totals
+
+def run_tournament(buyers, sellers, scenarios, seed=0, buyer_range=(800.0, 1200.0), seller_range=(600.0, 1000.0),
+                   workers=None, block=2000):
+    """Play every pairing over `scenarios` scenarios; returns {(buyer, seller): totals}"""
+    tasks = [(buyer, seller, start, min(block, scenarios - start), seed, tuple(buyer_range), tuple(seller_range))
+             for buyer in buyers for seller in sellers for start in range(0, scenarios, block)]
+    if workers == 1:
+        results = list(map(play, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(play, tasks))
+    pairs = {}
+    for buyer, seller, totals in results:
+        pair = pairs.setdefault((buyer, seller), dict.fromkeys(totals, 0))
+        for key, value in totals.items():
+            pair[key] += value
+    return pairs
+
+def summarize(totals, role):
+    scenarios = totals['scenarios']
+    agreed = totals['agreed']
+    surplus = totals[f'{role}_surplus']
+    return {
+        'scenarios': scenarios,
+        'agreement_rate': agreed / scenarios if scenarios else 0.0,
+        'avg_surplus': surplus / agreed if agreed else None,
+        'surplus_per_scenario': surplus / scenarios if scenarios else 0.0,
+        'avg_rounds': totals['rounds'] / scenarios if scenarios else 0.0
+    }
+
+def leaderboard(pairs, role):
+    """Each strategy's results on one side against every opponent, best first"""
+    side = 0 if role == 'buyer' else 1
+    combined = {}
+    for pair, totals in pairs.items():
+        entry = combined.setdefault(pair[side], dict.fromkeys(totals, 0))
+        for key, value in totals.items():
+            entry[key] += value
+    board = [dict(summarize(totals, role), strategy=name) for name, totals in combined.items()]
+    return sorted(board, key=lambda entry: entry['surplus_per_scenario'], reverse=True)
+
+def parse_strategies(text):
+    names = [name.strip() for name in text.split(',') if name.strip()]
+    return [get_strategy(name).name for name in names]
+
+def print_board(title, board):
+    print(f"\n{title}")
+    print(f"{'strategy':<14} {'agreed':>8} {'surplus/deal':>13} {'surplus/scen':>13} {'rounds':>7}")
+    for entry in board:
+        surplus = f"{entry['avg_surplus']:.2f}" if entry['avg_surplus'] is not None else '-'
+        print(f"{entry['strategy']:<14} {entry['agreement_rate']:>8.1%} {surplus:>13} "
+              f"{entry['surplus_per_scenario']:>13.2f} {entry['avg_rounds']:>7.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play negotiation strategies against each other offline")
+    parser.add_argument('--buyers', default=','.join(STRATEGIES), help="comma-separated buyer strategies")
+    parser.add_argument('--sellers', default=','.join(STRATEGIES), help="comma-separated seller strategies")
+    parser.add_argument('--scenarios', type=int, default=10000, help="scenarios per pairing")
+    parser.add_argument('--buyer-max', type=float, nargs=2, default=[800.0, 1200.0], metavar=('LOW', 'HIGH'))
+    parser.add_argument('--seller-min', type=float, nargs=2, default=[600.0, 1000.0], metavar=('LOW', 'HIGH'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="processes (1 runs in this process)")
+    parser.add_argument('--block', type=int, default=2000, help="scenarios per task sent to a worker")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        buyers = parse_strategies(args.buyers)
+        sellers = parse_strategies(args.sellers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    pairs = run_tournament(buyers, sellers, args.scenarios, args.seed, args.buyer_max, args.seller_min,
+                           args.workers, args.block)
+    elapsed = time.perf_counter() - started
+    played = sum(totals['scenarios'] for totals in pairs.values())
+
+    results = {
+        'negotiations': played,
+        'seconds': elapsed,
+        'buyers': leaderboard(pairs, 'buyer'),
+        'sellers': leaderboard(pairs, 'seller'),
+        'pairs': [{
+            'buyer': buyer,
+            'seller': seller,
+            'agreement_rate': totals['agreed'] / totals['scenarios'],
+            'avg_buyer_surplus': summarize(totals, 'buyer')['avg_surplus'],
+            'avg_seller_surplus': summarize(totals, 'seller')['avg_surplus'],
+            'avg_rounds': totals['rounds'] / totals['scenarios']
+        } for (buyer, seller), totals in pairs.items()]
+    }
+    if args.json:
+        print(json.dumps(results))
+        return 0
+
+    print(f"Played {played} negotiations in {elapsed:.2f}s ({played / elapsed:.0f}/s) on {args.workers} processes")
+    print_board('Buyers (surplus = buyer_max - price)', results['buyers'])
+    print_board('Sellers (surplus = price - seller_min)', results['sellers'])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""Vectorized negotiation simulator for strategy parameter sweeps.
+
+Replays the default concession rules of BuyerAgent/SellerAgent, the MediatorAgent
+trigger and the agreement checks of engine.plan_negotiation as NumPy array
+operations, so millions of (buyer_max, seller_min, seed) scenarios run in
+one pass. With DEFAULT_RULES the results match the scalar agents bit for bit
+when both draw from ScenarioRandom with the same seed (see verify()).
+
+    python vector_sim.py --scenarios 1000000 --verify 1000
+    python vector_sim.py --sweep buyer_step=1.02,1.03,1.05
+"""
+import argparse
+import sys
+import time
+import numpy as np
+from engine import plan_negotiation
+from agents import BuyerAgent, SellerAgent, MediatorAgent
+
+# The constants of the default strategy (strategies.py) and engine.py
+DEFAULT_RULES = {
+    'buyer_open_low': 0.70,      # opening offer is max_price * uniform(low, high)
+    'buyer_open_high': 0.80,
+    'buyer_accept': 0.95,        # accept anything at or below this share of max_price
+    'buyer_hold': 0.95,          # final offer once the seller stays above budget
+    'buyer_step1': 1.1,          # first counter: last * step1, capped at max * cap1
+    'buyer_cap1': 0.9,
+    'buyer_anchor2': 0.9,        # second counter: midpoint of last and max * anchor2
+    'buyer_cap2': 0.95,
+    'buyer_step': 1.03,          # later counters: last * step, capped at max * cap
+    'buyer_cap': 0.98,
+    'buyer_ceiling': 0.99,       # never offer more than this share of max_price
+    'seller_open_low': 1.05,     # first counter is min_price * uniform(low, high)
+    'seller_open_high': 1.10,
+    'seller_anchor2': 1.05,      # second counter: midpoint of last and min * anchor2
+    'seller_floor2': 1.02,
+    'seller_step': 0.98,         # later counters: last * step, floored at min * floor
+    'seller_floor': 1.01,
+    'seller_safety': 1.001,      # never ask less than this multiple of min_price
+    'mediator_gap': 0.05,        # mediate while the gap is at least this share of the midpoint
+    'convergence_gap': 0.02,     # agree on the midpoint once offers are within this share of it
+    'min_rounds': 6,
+    'max_rounds': 12
+}
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+GOLDEN = 0x9E3779B97F4A7C15
+MIX1 = 0xBF58476D1CE4E5B9
+MIX2 = 0x94D049BB133111EB
+
+class ScenarioRandom:
+    """SplitMix64 stream with a random.Random-compatible uniform().
+
+    The same generator is implemented on arrays in scenario_draws(), which
+    is what lets the vectorized engine reproduce the scalar agents exactly.
+    """
+    def __init__(self, seed):
+        self.state = seed & MASK64
+
+    def random(self):
+        self.state = (self.state + GOLDEN) & MASK64
+        z = self.state
+        z = ((z ^ (z >> 30)) * MIX1) & MASK64
+        z = ((z ^ (z >> 27)) * MIX2) & MASK64
+        z ^= z >> 31
+        return (z >> 11) * 2.0 ** -53
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+def scenario_draws(seeds, count):
+    """The first `count` ScenarioRandom.random() values for every seed, shape (count, n)"""
+    state = np.asarray(seeds).astype(np.uint64)
+    draws = np.empty((count, len(state)))
+    with np.errstate(over='ignore'):
+        for k in range(count):
+            state = state + np.uint64(GOLDEN)
+            z = state
+            z = (z ^ (z >> np.uint64(30))) * np.uint64(MIX1)
+            z = (z ^ (z >> np.uint64(27))) * np.uint64(MIX2)
+            z = z ^ (z >> np.uint64(31))
+            draws[k] = (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+    return draws
+
+def simulate_vectorized(buyer_max, seller_min, seeds, rules=None):
+    """Run one negotiation per scenario and return outcome arrays.
+
+    Returns a dict of arrays: 'agreed' (bool), 'final_price' (NaN when no
+    deal), 'rounds' (the last round number) and 'turns' (messages exchanged).
+    """
+    r = dict(DEFAULT_RULES, **(rules or {}))
+    bmax = np.asarray(buyer_max, dtype=np.float64)
+    smin = np.asarray(seller_min, dtype=np.float64)
+    n = len(bmax)
+    u_open, u_counter = scenario_draws(seeds, 2)
+
+    # Round 1: buyer's opening offer
+    p_last = bmax * (r['buyer_open_low'] + (r['buyer_open_high'] - r['buyer_open_low']) * u_open)
+    p_prev = np.zeros(n)
+    turns = np.ones(n, dtype=np.int64)
+    round_count = np.ones(n, dtype=np.int64)
+    agreed = np.zeros(n, dtype=bool)
+    final_price = np.full(n, np.nan)
+    active = np.ones(n, dtype=bool)
+
+    step = 0
+    while active.any():
+        step += 1
+        idx = np.flatnonzero(active)
+        last = p_last[idx]
+        b = bmax[idx]
+        s = smin[idx]
+        rc = round_count[idx] + 1
+
+        # Turns strictly alternate seller, buyer, seller... so every scenario
+        # is on the same agent and the same rounds_count at a given step
+        if step % 2 == 1:
+            seller_rounds = (step + 1) // 2
+            hold = (last < s) & (seller_rounds >= 3)
+            accept = ~hold & (last >= s)
+            if seller_rounds == 1:
+                counter = s * (r['seller_open_low'] + (r['seller_open_high'] - r['seller_open_low']) * u_counter[idx])
+            elif seller_rounds == 2:
+                counter = np.maximum(s * r['seller_floor2'], (last + s * r['seller_anchor2']) / 2)
+            else:
+                counter = np.maximum(s * r['seller_floor'], last * r['seller_step'])
+            counter = np.maximum(counter, s * r['seller_safety'])
+            response = np.where(hold, s, np.where(accept, last, counter))
+        else:
+            buyer_rounds = step // 2
+            hold = (last > b) & (buyer_rounds >= 3)
+            accept = ~hold & (last <= b) & (last <= b * r['buyer_accept'])
+            if buyer_rounds == 1:
+                counter = np.minimum(last * r['buyer_step1'], b * r['buyer_cap1'])
+            elif buyer_rounds == 2:
+                counter = np.minimum((last + b * r['buyer_anchor2']) / 2, b * r['buyer_cap2'])
+            else:
+                counter = np.minimum(last * r['buyer_step'], b * r['buyer_cap'])
+            counter = np.minimum(counter, b * r['buyer_ceiling'])
+            response = np.where(hold, b * r['buyer_hold'], np.where(accept, last, counter))
+
+        # Mediator speaks before the response is recorded
+        prev = p_prev[idx]
+        count = turns[idx]
+        mediation_round = (rc == 4) | ((rc > r['min_rounds']) & (rc % 3 == 0))
+        midpoint = (prev + last) / 2
+        mediate = mediation_round & (count >= 3) & ~(np.abs(prev - last) < midpoint * r['mediator_gap'])
+        count = count + 1 + mediate
+        rc = rc + mediate
+
+        # Agreement checks
+        checking = rc >= r['min_rounds']
+        deal_on_accept = checking & accept & (s <= response) & (response <= b)
+        # Between the two sides' latest offers; the mediator's price doesn't count
+        converged = (last + response) / 2
+        deal_on_gap = (checking & ~deal_on_accept & (np.abs(response - last) < converged * r['convergence_gap'])
+                       & (s <= converged) & (converged <= b))
+        done = deal_on_accept | deal_on_gap | (rc >= r['max_rounds'])
+
+        p_prev[idx] = last
+        p_last[idx] = response
+        turns[idx] = count
+        round_count[idx] = rc
+        agreed[idx] = deal_on_accept | deal_on_gap
+        final_price[idx] = np.where(deal_on_accept, response, np.where(deal_on_gap, converged, np.nan))
+        active[idx] = ~done
+
+    return {'agreed': agreed, 'final_price': final_price, 'rounds': round_count, 'turns': turns}
+
+def simulate_scalar(buyer_max, seller_min, seeds):
+    """Reference run through the real agents, returning the same arrays"""
+    results = {'agreed': [], 'final_price': [], 'rounds': [], 'turns': []}
+    for bmax, smin, seed in zip(buyer_max, seller_min, seeds):
+        rng = ScenarioRandom(int(seed))
+        plan = plan_negotiation('item', BuyerAgent(None, float(bmax), rng), SellerAgent(None, float(smin), rng), MediatorAgent(None))
+        results['agreed'].append(plan['status'] == 'agreed')
+        results['final_price'].append(plan.get('final_price', np.nan))
+        results['rounds'].append(plan['turns'][-1]['round'])
+        results['turns'].append(len(plan['turns']))
+    return {key: np.array(values) for key, values in results.items()}
+
+def summarize(buyer_max, seller_min, outcome):
+    """Aggregate outcome arrays into agreement rate, price, rounds and surplus split"""
+    agreed = outcome['agreed']
+    price = outcome['final_price'][agreed]
+    bmax = np.asarray(buyer_max)[agreed]
+    smin = np.asarray(seller_min)[agreed]
+    zone = bmax - smin
+    buyer_share = np.divide(bmax - price, zone, out=np.full(len(price), 0.5), where=zone > 0)
+    return {
+        'scenarios': len(agreed),
+        'agreement_rate': float(agreed.mean()) if len(agreed) else 0.0,
+        'avg_final_price': float(price.mean()) if len(price) else None,
+        'avg_rounds': float(outcome['rounds'].mean()) if len(agreed) else 0.0,
+        'avg_buyer_surplus': float((bmax - price).mean()) if len(price) else None,
+        'avg_seller_surplus': float((price - smin).mean()) if len(price) else None,
+        'avg_buyer_share': float(buyer_share.mean()) if len(price) else None
+    }
+
+def verify(buyer_max, seller_min, seeds):
+    """Check the vectorized engine against the scalar agents; returns mismatching indices"""
+    vector = simulate_vectorized(buyer_max, seller_min, seeds)
+    scalar = simulate_scalar(buyer_max, seller_min, seeds)
+    same = np.ones(len(seeds), dtype=bool)
+    for key in vector:
+        matches = vector[key] == scalar[key]
+        if key == 'final_price':
+            matches |= np.isnan(vector[key]) & np.isnan(scalar[key])
+        same &= matches
+    return np.flatnonzero(~same)
+
+def make_scenarios(count, buyer_range, seller_range, seed):
+    rng = np.random.default_rng(seed)
+    buyer_max = rng.uniform(buyer_range[0], buyer_range[1], count)
+    seller_min = rng.uniform(seller_range[0], seller_range[1], count)
+    seeds = np.arange(count, dtype=np.uint64) + np.uint64(seed)
+    return buyer_max, seller_min, seeds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vectorized negotiation simulator for parameter sweeps")
+    parser.add_argument('--scenarios', type=int, default=100000)
+    parser.add_argument('--buyer-max', type=float, nargs=2, default=[800.0, 1200.0], metavar=('LOW', 'HIGH'))
+    parser.add_argument('--seller-min', type=float, nargs=2, default=[600.0, 1000.0], metavar=('LOW', 'HIGH'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[], metavar='RULE=VALUE',
+                        help="override a rule from DEFAULT_RULES")
+    parser.add_argument('--sweep', metavar='RULE=V1,V2,...', help="compare several values of one rule")
+    parser.add_argument('--verify', type=int, default=0, metavar='N',
+                        help="check the first N scenarios against the scalar agents")
+    args = parser.parse_args(argv)
+
+    rules = {}
+    for override in args.set:
+        name, value = override.split('=', 1)
+        if name not in DEFAULT_RULES:
+            parser.error(f"unknown rule '{name}'")
+        rules[name] = type(DEFAULT_RULES[name])(value)
+
+    buyer_max, seller_min, seeds = make_scenarios(args.scenarios, args.buyer_max, args.seller_min, args.seed)
+
+    if args.verify:
+        n = min(args.verify, args.scenarios)
+        mismatches = verify(buyer_max[:n], seller_min[:n], seeds[:n])
+        print(f"Verified {n} scenarios against the scalar agents: {len(mismatches)} mismatches")
+        if len(mismatches):
+            return 1
+
+    variants = [(None, None)]
+    if args.sweep:
+        name, values = args.sweep.split('=', 1)
+        if name not in DEFAULT_RULES:
+            parser.error(f"unknown rule '{name}'")
+        variants = [(name, type(DEFAULT_RULES[name])(value)) for value in values.split(',')]
+
+    print(f"{'variant':<24} {'agreed':>8} {'price':>10} {'rounds':>7} {'buyer share':>12} {'scen/s':>12}")
+    for name, value in variants:
+        variant_rules = dict(rules, **({name: value} if name else {}))
+        started = time.perf_counter()
+        outcome = simulate_vectorized(buyer_max, seller_min, seeds, variant_rules)
+        elapsed = time.perf_counter() - started
+        stats = summarize(buyer_max, seller_min, outcome)
+        label = f"{name}={value}" if name else 'current rules'
+        price = f"{stats['avg_final_price']:.2f}" if stats['avg_final_price'] is not None else '-'
+        share = f"{stats['avg_buyer_share']:.3f}" if stats['avg_buyer_share'] is not None else '-'
+        print(f"{label:<24} {stats['agreement_rate']:>8.1%} {price:>10} {stats['avg_rounds']:>7.2f} {share:>12} {args.scenarios / elapsed:>12.0f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())